@@ -0,0 +1,55 @@
+"""Time Property.export() against Property.export_to().
+
+This exports a deeply nested tree of about a million lines.
+"""
+import io
+import timeit
+
+from srctools.property_parser import Property
+
+DEPTH = 50
+BRANCHES = 9000
+LEAVES = 10
+
+
+def make_tree() -> Property:
+    """Build chains of nested blocks, each with some keyvalues."""
+    root = Property(None, [])
+    for branch in range(BRANCHES):
+        block = Property('branch', [])
+        root.append(block)
+        for depth in range(DEPTH // 2):
+            block.append(Property('depth', str(depth)))
+            child = Property('level{}'.format(depth), [])
+            block.append(child)
+            block = child
+        for leaf in range(LEAVES):
+            block.append(Property('leaf{}'.format(leaf), 'value "{}"'.format(leaf)))
+    return root
+
+
+def export_gen(tree: Property) -> None:
+    """The existing way, writing each line."""
+    file = io.StringIO()
+    for line in tree.export():
+        file.write(line)
+
+
+def export_to(tree: Property) -> None:
+    """Use the writer."""
+    tree.export_to(io.StringIO())
+
+
+def export_to_bytes(tree: Property) -> None:
+    """Use the writer, on a binary file."""
+    tree.export_to(io.BytesIO())
+
+
+tree = make_tree()
+file = io.StringIO()
+tree.export_to(file)
+print('{} lines'.format(file.getvalue().count('\n')))
+
+for func in [export_gen, export_to, export_to_bytes]:
+    best = min(timeit.repeat(lambda: func(tree), number=1, repeat=3))
+    print('{}: {:.3f}s'.format(func.__name__, best))
@@ -0,0 +1,52 @@
+"""Time Property.parse() with the Python and compiled parsers.
+
+Pass a keyvalues file (like a VMF) to parse, otherwise a map-like file is
+generated.
+"""
+import sys
+import timeit
+
+from srctools import property_parser
+from srctools.tokenizer import C_Tokenizer, Py_Tokenizer
+from srctools.property_parser import Property
+
+BLOCK = '''\
+"solid"
+\t{
+\t"id" "12"
+\t"side"
+\t\t{
+\t\t"id" "1"
+\t\t"plane" "(-64 64 64) (64 64 64) (64 -64 64)"
+\t\t"material" "TOOLS/TOOLSNODRAW"
+\t\t"uaxis" "[1 0 0 0] 0.25"
+\t\t"vaxis" "[0 -1 0 0] 0.25"
+\t\t"rotation" "0"
+\t\t"lightmapscale" "16"
+\t\t"smoothing_groups" "0"
+\t\t}
+\t"editor"
+\t\t{
+\t\t"color" "0 180 0"
+\t\t"visgroupshown" "1"
+\t\t"visgroupautoshown" "1"
+\t\t}
+\t}
+'''
+
+if len(sys.argv) > 1:
+    with open(sys.argv[1]) as f:
+        text = f.read()
+else:
+    text = BLOCK * 5000
+
+modes = [('Python', Py_Tokenizer)]
+if property_parser._cy_parse_tree is not None:
+    modes.append(('Cython', C_Tokenizer))
+else:
+    print('Compiled parser not available!')
+
+for name, tok_type in modes:
+    property_parser.Tokenizer = tok_type
+    best = min(timeit.repeat(lambda: Property.parse(text), number=1, repeat=5))
+    print('{}: {:.3f}s ({} bytes)'.format(name, best, len(text)))
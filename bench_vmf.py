@@ -0,0 +1,68 @@
+"""Time VMF.parse() on a property tree against VMF.parse_text().
+
+Pass a VMF to parse, otherwise a map with many brushes is generated.
+Peak memory use is measured separately, since tracing slows parsing.
+"""
+import sys
+import timeit
+import tracemalloc
+
+from srctools.property_parser import Property
+from srctools.vec import Vec
+from srctools.vmf import VMF
+
+
+def make_map() -> str:
+    """Generate a map with world brushes, brush entities and point entities."""
+    vmf = VMF()
+    for x in range(40):
+        for y in range(40):
+            pos = Vec(x * 128, y * 128, 0)
+            vmf.add_brush(vmf.make_prism(pos, pos + 64).solid)
+            if (x + y) % 4 == 0:
+                ent = vmf.create_ent(
+                    'func_detail' if x % 2 else 'prop_static',
+                    origin=pos + (0, 0, 96),
+                    model='models/props/crate.mdl',
+                    targetname='ent_{}_{}'.format(x, y),
+                )
+                if x % 2:
+                    ent.solids.append(vmf.make_prism(pos + 70, pos + 100).solid)
+            ent = vmf.create_ent('info_target', origin=pos, targetname='targ')
+            ent.hidden = y % 5 == 0
+    return vmf.export()
+
+
+def parse_tree(text: str) -> VMF:
+    """The existing way, building the whole tree first."""
+    return VMF.parse(Property.parse(text))
+
+
+def parse_text(text: str) -> VMF:
+    """Convert each block as it is parsed."""
+    return VMF.parse_text(text)
+
+
+def parse_bytes(text: str) -> VMF:
+    """Convert each block as it is parsed, from a file read as bytes."""
+    return VMF.parse_text(text.encode('utf8'))
+
+
+if len(sys.argv) > 1:
+    with open(sys.argv[1]) as f:
+        text = f.read()
+else:
+    text = make_map()
+
+if parse_tree(text).export() != parse_text(text).export():
+    print('Results differ!')
+
+for func in [parse_tree, parse_text, parse_bytes]:
+    best = min(timeit.repeat(lambda: func(text), number=1, repeat=3))
+    tracemalloc.start()
+    func(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{}: {:.3f}s, peak {:.1f}MB ({} bytes)'.format(
+        func.__name__, best, peak / 1024 / 1024, len(text),
+    ))
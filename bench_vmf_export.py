@@ -0,0 +1,81 @@
+"""Time VMF.export() to a string, a text file and a binary file.
+
+Pass a VMF to export, otherwise a map with many brushes is generated.
+Exporting a map parsed with keep_text, with a few entities modified, is
+also timed.
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from srctools.vec import Vec
+from srctools.vmf import VMF
+
+
+def make_map() -> VMF:
+    """Generate a map with world brushes, brush entities and point entities."""
+    vmf = VMF()
+    for x in range(60):
+        for y in range(60):
+            pos = Vec(x * 128, y * 128, 0)
+            vmf.add_brush(vmf.make_prism(pos, pos + 64).solid)
+            if (x + y) % 4 == 0:
+                ent = vmf.create_ent(
+                    'func_detail' if x % 2 else 'prop_static',
+                    origin=pos + (0, 0, 96),
+                    model='models/props/crate.mdl',
+                    targetname='ent_{}_{}'.format(x, y),
+                )
+                if x % 2:
+                    ent.solids.append(vmf.make_prism(pos + 70, pos + 100).solid)
+            ent = vmf.create_ent('info_target', origin=pos, targetname='targ')
+            ent.hidden = y % 5 == 0
+    return vmf
+
+
+def export_string(vmf: VMF) -> None:
+    """Produce a string."""
+    vmf.export(inc_version=False)
+
+
+def export_text_file(vmf: VMF) -> None:
+    """Write to a file opened in text mode."""
+    with open(filename, 'w') as f:
+        vmf.export(f, inc_version=False)
+
+
+def export_bin_file(vmf: VMF) -> None:
+    """Write to a file opened in binary mode."""
+    with open(filename, 'wb') as f:
+        vmf.export(f, inc_version=False)
+
+
+def export_kept_text(vmf: VMF) -> None:
+    """Produce a string, reusing the original text of unmodified objects."""
+    kept_text_map.export(inc_version=False)
+
+
+if len(sys.argv) > 1:
+    vmf = VMF.parse(sys.argv[1])
+else:
+    vmf = make_map()
+
+kept_text_map = VMF.parse_text(vmf.export(inc_version=False), keep_text=True)
+for ent in kept_text_map.entities[::100]:
+    ent['targetname'] += '_modified'
+    for solid in ent.solids:
+        solid.translate(Vec(0, 0, 8))
+
+fd, filename = tempfile.mkstemp(suffix='.vmf')
+os.close(fd)
+try:
+    for func in [export_string, export_text_file, export_bin_file, export_kept_text]:
+        try:
+            best = min(timeit.repeat(lambda: func(vmf), number=1, repeat=5))
+        except TypeError as exc:  # Binary files aren't supported.
+            print('{}: {}'.format(func.__name__, exc))
+        else:
+            print('{}: {:.3f}s'.format(func.__name__, best))
+finally:
+    os.remove(filename)
@@ -0,0 +1,32 @@
+"""Time copying brushes, which allocates a new ID for each brush and side.
+
+Pass the number of sides to copy, otherwise 100k are copied.
+"""
+import sys
+import time
+
+from srctools.vec import Vec
+from srctools.vmf import VMF
+
+if len(sys.argv) > 1:
+    SIDES = int(sys.argv[1])
+else:
+    SIDES = 100000
+
+vmf = VMF()
+brushes = []
+for x in range(100):
+    pos = Vec(x * 128, 0, 0)
+    brushes.append(vmf.make_prism(pos, pos + 64).solid)
+
+start = time.perf_counter()
+copies = []
+while len(copies) * 6 < SIDES:
+    copies.extend(brush.copy() for brush in brushes)
+print('Copied {} sides: {:.3f}s'.format(len(copies) * 6, time.perf_counter() - start))
+
+# Free every other ID, then copy again to fill the gaps.
+del copies[::2]
+start = time.perf_counter()
+copies.extend(brush.copy() for brush in brushes for _ in range(10))
+print('Recopied {} sides: {:.3f}s'.format(len(brushes) * 60, time.perf_counter() - start))
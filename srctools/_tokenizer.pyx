@@ -3,6 +3,7 @@
 cimport cython
 from cpython.mem cimport PyMem_Malloc, PyMem_Free
 import array
+from sys import intern
 
 cdef extern from *:
     unicode PyUnicode_FromStringAndSize(const char *u, Py_ssize_t size)
@@ -24,6 +25,8 @@ cdef:
 
     object EOF = Token.EOF
     object NEWLINE = Token.NEWLINE
+    object BRACE_OPEN = Token.BRACE_OPEN
+    object BRACE_CLOSE = Token.BRACE_CLOSE
 
     # Iterator that immediately raises StopIteration.
     object EMPTY_ITER = iter('')
@@ -471,6 +474,381 @@ cdef class NewlinesIter:
 del globals()['NewlinesIter']
 
 
+cdef object _make_prop(type prop_type, dict names, str name, object value):
+    """Create a Property, bypassing __init__.
+
+    Names are interned and casefolded once, then cached in names.
+    """
+    cdef tuple name_tup
+    prop = prop_type.__new__(prop_type)
+    name_tup = names.get(name)
+    if name_tup is None:
+        name_tup = names[name] = (intern(name), intern(name.casefold()))
+    prop.real_name = name_tup[0]
+    prop._folded_name = name_tup[1]
+    prop.value = value
+    return prop
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _parse_tree(Tokenizer tok not None, type prop_type not None, flags, read_flag):
+    """Parse a Property tree, for Property.parse().
+
+    This produces the same result as building the tree from
+    Property.parse_events(), but constructs the Properties directly.
+    prop_type is the Property class, read_flag evaluates flags.
+    """
+    cdef:
+        # Cache of name -> (real_name, folded_name).
+        dict names = {}
+        # The children lists of the blocks outside the current one.
+        list open_children = []
+        # The names of all the blocks we are in.
+        list open_names = []
+        # The children of the current block.
+        list children
+
+        object tok_type, prop_tok, flag_tok
+        object tok_value, prop_value, flag_value
+
+        # The name of the block ("name"\n) whose { must be next, or None.
+        object block_name = None
+        bint block_replace = False
+        bint block_enabled = False
+
+        bint can_flag_replace = False
+        # The name of the last property in the block, and if it was a block.
+        object last_name = None
+        bint last_block = False
+
+        # If non-zero, we're inside a block disabled by a flag.
+        Py_ssize_t skip_depth = 0
+        # The replacement state from before the disabled block, restored after.
+        tuple skip_state = (False, None, False)
+
+    root = prop_type.__new__(prop_type)
+    root.real_name = root._folded_name = None
+    root.value = children = []
+
+    while True:
+        tok_type, tok_value = <tuple>tok.next_token()
+        if tok_type is EOF:
+            break
+        elif tok_type is BRACE_OPEN:
+            # Open a new block - make sure the last token was a name..
+            if block_name is None:
+                raise tok._error(
+                    'Property cannot have sub-section if it already '
+                    'has an in-line value.\n\n'
+                    'A "name" "value" line cannot then open a block.',
+                )
+            if skip_depth:
+                skip_depth += 1
+            elif block_enabled:
+                prop = _make_prop(prop_type, names, block_name, [])
+                if block_replace:
+                    children[len(children) - 1] = prop
+                else:
+                    children.append(prop)
+                open_children.append(children)
+                children = prop.value
+            else:
+                # Disabled by a flag, ignore everything inside.
+                skip_depth = 1
+                skip_state = (can_flag_replace, last_name, last_block)
+            open_names.append(block_name)
+            block_name = None
+            can_flag_replace = False
+            continue
+        # Something else, but followed by '{'
+        elif block_name is not None and tok_type is not NEWLINE:
+            raise tok._error(
+                'Block opening ("{") required!\n\n'
+                'A single "name" on a line should next have a open brace '
+                'to begin a block.',
+            )
+
+        if tok_type is NEWLINE:
+            continue
+        elif tok_type is STRING:
+            # We need to check the next token to figure out what kind of
+            # prop it is.
+            prop_tok, prop_value = <tuple>tok.next_token()
+
+            # It's a block followed by flag. ("name" [stuff])
+            if prop_tok is PROP_FLAG:
+                # That must be the end of the line..
+                tok.expect(NEWLINE)
+                block_name = tok_value
+                block_enabled = read_flag(flags, prop_value)
+                # If the last prop was a block with this name, replace it.
+                block_replace = (
+                    block_enabled and can_flag_replace and
+                    last_block and last_name == tok_value
+                )
+                if block_enabled:
+                    # Can't do twice in a row
+                    can_flag_replace = False
+            elif prop_tok is STRING:
+                # A value.. ("name" "value")
+                flag_tok, flag_value = <tuple>tok.next_token()
+                if flag_tok is PROP_FLAG:
+                    # Should be the end of the line here.
+                    tok.expect(NEWLINE)
+                    if read_flag(flags, flag_value):
+                        if not skip_depth:
+                            prop = _make_prop(prop_type, names, tok_value, prop_value)
+                            # If the last prop was a keyvalue with this
+                            # name, replace it.
+                            if (
+                                can_flag_replace and not last_block
+                                and last_name == tok_value
+                            ):
+                                children[len(children) - 1] = prop
+                            else:
+                                children.append(prop)
+                        last_name = tok_value
+                        last_block = False
+                        # Can't do twice in a row
+                        can_flag_replace = False
+                elif flag_tok is STRING:
+                    # Specifically disallow multiple text on the same line.
+                    raise tok._error(
+                        "Cannot have multiple names on the same line!"
+                    )
+                else:
+                    # Nothing after, so check the token in the next loop.
+                    if not skip_depth:
+                        children.append(_make_prop(prop_type, names, tok_value, prop_value))
+                    last_name = tok_value
+                    last_block = False
+                    can_flag_replace = True
+                    tok.pushback_tok = flag_tok
+                    tok.pushback_val = flag_value
+            else:
+                # Something else - treat this as a block, and
+                # then re-evaluate this in the next loop.
+                block_name = tok_value
+                block_enabled = True
+                block_replace = can_flag_replace = False
+                tok.pushback_tok = prop_tok
+                tok.pushback_val = prop_value
+        elif tok_type is BRACE_CLOSE:
+            # Move back a block
+            if not open_names:
+                # It's empty, we've closed one too many properties.
+                raise tok._error(
+                    'Too many closing brackets.\n\n'
+                    'An extra closing bracket was added which would '
+                    'close the outermost level.',
+                )
+            last_name = open_names.pop()
+            last_block = True
+            if skip_depth:
+                skip_depth -= 1
+                if not skip_depth:
+                    # It wasn't added, so continue as if it wasn't there.
+                    can_flag_replace, last_name, last_block = skip_state
+                    continue
+            else:
+                children = <list>open_children.pop()
+            # For replacing the block.
+            can_flag_replace = True
+        else:
+            raise tok.error(tok_type)
+
+    # We're out of data, do some final sanity checks.
+    if block_name is not None:
+        raise tok.error_type(
+            'Block opening ("{") required, but hit EOF!\n'
+            'A "name" line was located at the end of the file, which needs'
+            ' a {} block to follow.',
+            tok.filename,
+            None,
+        )
+    if open_names:
+        raise tok.error_type(
+            'End of text reached with remaining open sections.\n\n'
+            "File ended with at least one property that didn't "
+            'have an ending "}".',
+            tok.filename,
+            None,
+        )
+    return root
+
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _parse_events(Tokenizer tok not None, handler, flags, read_flag):
+    """Parse a file, calling methods on the handler, for Property.parse_events().
+
+    This matches the Python version, read_flag evaluates flags.
+    """
+    cdef:
+        object key_value = handler.key_value
+        object start_block = handler.start_block
+        object end_block = handler.end_block
+
+        # The names of all the blocks we are in.
+        list open_names = []
+
+        object tok_type, prop_tok, flag_tok
+        object tok_value, prop_value, flag_value
+
+        # The name of the block ("name"\n) whose { must be next, or None.
+        object block_name = None
+        bint block_replace = False
+        bint block_enabled = False
+
+        bint can_flag_replace = False
+        # The name of the last property in the block, and if it was a block.
+        object last_name = None
+        bint last_block = False
+
+        # If non-zero, we're inside a block disabled by a flag.
+        Py_ssize_t skip_depth = 0
+        # The replacement state from before the disabled block, restored after.
+        tuple skip_state = (False, None, False)
+
+    while True:
+        tok_type, tok_value = <tuple>tok.next_token()
+        if tok_type is EOF:
+            break
+        elif tok_type is BRACE_OPEN:
+            # Open a new block - make sure the last token was a name..
+            if block_name is None:
+                raise tok._error(
+                    'Property cannot have sub-section if it already '
+                    'has an in-line value.\n\n'
+                    'A "name" "value" line cannot then open a block.',
+                )
+            if skip_depth:
+                skip_depth += 1
+            elif block_enabled:
+                start_block(block_name, block_replace)
+            else:
+                # Disabled by a flag, ignore everything inside.
+                skip_depth = 1
+                skip_state = (can_flag_replace, last_name, last_block)
+            open_names.append(block_name)
+            block_name = None
+            can_flag_replace = False
+            continue
+        # Something else, but followed by '{'
+        elif block_name is not None and tok_type is not NEWLINE:
+            raise tok._error(
+                'Block opening ("{") required!\n\n'
+                'A single "name" on a line should next have a open brace '
+                'to begin a block.',
+            )
+
+        if tok_type is NEWLINE:
+            continue
+        elif tok_type is STRING:
+            # We need to check the next token to figure out what kind of
+            # prop it is.
+            prop_tok, prop_value = <tuple>tok.next_token()
+
+            # It's a block followed by flag. ("name" [stuff])
+            if prop_tok is PROP_FLAG:
+                # That must be the end of the line..
+                tok.expect(NEWLINE)
+                block_name = tok_value
+                block_enabled = read_flag(flags, prop_value)
+                # If the last prop was a block with this name, replace it.
+                block_replace = (
+                    block_enabled and can_flag_replace and
+                    last_block and last_name == tok_value
+                )
+                if block_enabled:
+                    # Can't do twice in a row
+                    can_flag_replace = False
+            elif prop_tok is STRING:
+                # A value.. ("name" "value")
+                flag_tok, flag_value = <tuple>tok.next_token()
+                if flag_tok is PROP_FLAG:
+                    # Should be the end of the line here.
+                    tok.expect(NEWLINE)
+                    if read_flag(flags, flag_value):
+                        if not skip_depth:
+                            # If the last prop was a keyvalue with this
+                            # name, replace it.
+                            key_value(
+                                tok_value,
+                                prop_value,
+                                can_flag_replace and not last_block
+                                and last_name == tok_value,
+                            )
+                        last_name = tok_value
+                        last_block = False
+                        # Can't do twice in a row
+                        can_flag_replace = False
+                elif flag_tok is STRING:
+                    # Specifically disallow multiple text on the same line.
+                    raise tok._error(
+                        "Cannot have multiple names on the same line!"
+                    )
+                else:
+                    # Nothing after, so check the token in the next loop.
+                    if not skip_depth:
+                        key_value(tok_value, prop_value, False)
+                    last_name = tok_value
+                    last_block = False
+                    can_flag_replace = True
+                    tok.pushback_tok = flag_tok
+                    tok.pushback_val = flag_value
+            else:
+                # Something else - treat this as a block, and
+                # then re-evaluate this in the next loop.
+                block_name = tok_value
+                block_enabled = True
+                block_replace = can_flag_replace = False
+                tok.pushback_tok = prop_tok
+                tok.pushback_val = prop_value
+        elif tok_type is BRACE_CLOSE:
+            # Move back a block
+            if not open_names:
+                # It's empty, we've closed one too many properties.
+                raise tok._error(
+                    'Too many closing brackets.\n\n'
+                    'An extra closing bracket was added which would '
+                    'close the outermost level.',
+                )
+            last_name = open_names.pop()
+            last_block = True
+            if skip_depth:
+                skip_depth -= 1
+                if not skip_depth:
+                    # It wasn't added, so continue as if it wasn't there.
+                    can_flag_replace, last_name, last_block = skip_state
+                    continue
+            else:
+                end_block()
+            # For replacing the block.
+            can_flag_replace = True
+        else:
+            raise tok.error(tok_type)
+
+    # We're out of data, do some final sanity checks.
+    if block_name is not None:
+        raise tok.error_type(
+            'Block opening ("{") required, but hit EOF!\n'
+            'A "name" line was located at the end of the file, which needs'
+            ' a {} block to follow.',
+            tok.filename,
+            None,
+        )
+    if open_names:
+        raise tok.error_type(
+            'End of text reached with remaining open sections.\n\n'
+            "File ended with at least one property that didn't "
+            'have an ending "}".',
+            tok.filename,
+            None,
+        )
+
 @cython.nonecheck(False)
 def escape_text(str text not None):
     r"""Escape special characters and backslashes, so tokenising reproduces them.
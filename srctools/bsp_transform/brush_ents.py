@@ -35,7 +35,7 @@ def comp_trigger_coop(ctx: Context):
                 out.output = 'OnChangeToAnyFalse'
             else:
                 continue
-            trig.outputs.remove(out)
+            trig.remove_out(out)
             manager.add_out(out)
         trig.add_out(
             Output('OnStartTouchBluePlayer', man_name, 'SetStateATrue'),
@@ -55,7 +55,7 @@ def comp_trigger_coop(ctx: Context):
                 if out.output.casefold() == 'onchangetoalltrue':
                     out.only_once = True
                 else:
-                    manager.outputs.remove(out)
+                    manager.remove_out(out)
 
 
 @trans('P2 Goo')
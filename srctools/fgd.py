@@ -15,7 +15,10 @@ from typing import (
 )
 
 from srctools.filesys import FileSystem, File
-from srctools.tokenizer import Tokenizer, Token, TokenSyntaxError
+from srctools.tokenizer import (
+    Tokenizer, C_Tokenizer, Py_Tokenizer, BytesTokenizer,
+    Token, TokenSyntaxError,
+)
 
 __all__ = [
     'ValueTypes', 'EntityTypes', 'HelperTypes',
@@ -1489,13 +1492,26 @@ class FGD:
 
         self._parse_list.append(file)
 
-        with filesys, file.open_str(encoding) as f:
-            tokeniser = Tokenizer(
-                f,
-                filename=file.path,
-                error=FGDParseError,
-                string_bracket=False,
-            )
+        with filesys:
+            if C_Tokenizer is not Py_Tokenizer:
+                # The compiled tokenizer is fastest on the decoded text.
+                with file.open_str(encoding) as f:
+                    tokeniser = Tokenizer(
+                        f.read(),
+                        filename=file.path,
+                        error=FGDParseError,
+                        string_bracket=False,
+                    )
+            else:
+                # Otherwise decode as each token is produced.
+                with file.open_bin() as f:
+                    tokeniser = BytesTokenizer(
+                        f.read(),
+                        filename=file.path,
+                        error=FGDParseError,
+                        string_bracket=False,
+                        encoding=encoding,
+                    )
             for token, token_value in tokeniser:
                 # The only things at top-level would be bare strings, and empty lines.
                 if token is Token.NEWLINE:
@@ -2,23 +2,41 @@
 
 This allows accessing raw files, zips and VPKs in the same way.
 Files are case-insensitive, and both slashes are converted to '/'.
+
+Systems may be read from multiple threads at once. Opening and closing
+references is atomic, and each thread reading from a zip uses its own
+handle. The references must still be held open while reads are in progress,
+and systems should not be added to or removed from a chain while other
+threads are using it.
 """
-from zipfile import ZipFile, ZipInfo
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, time
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+import bisect
+import hashlib
+import logging
+import mmap
+import queue
+import struct
+import threading
 import io
 import os
 
 from srctools.vpk import VPK, FileInfo as VPKFile
-from srctools.property_parser import Property
+from srctools import AtomicWriter
+from srctools.property_parser import Property, KeyValError
 
 from typing import (
-    Union, Iterator,
-    List, Tuple, Dict,
-    TextIO, BinaryIO,
+    Union, Iterator, Iterable, Optional, Callable,
+    List, Tuple, Dict, Set,
+    TextIO, BinaryIO, IO, Any,
 )
 
 
 __all__ = [
     'File', 'FileSystem', 'get_filesystem',
+    'FileCache', 'PropCache', 'FileSysStats',
 
     'RawFileSystem', 'VPKFileSystem', 'ZipFileSystem',
     'VirtualFileSystem', 'FileSystemChain',
@@ -41,6 +59,147 @@ def get_filesystem(path: str) -> 'FileSystem':
     raise ValueError('Unrecognised filesystem for "{}"'.format(path))
 
 
+class OpStats:
+    """Statistics for one kind of operation on a system."""
+    __slots__ = ('count', 'hits', 'misses', 'bytes', 'time')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self.time = 0.0
+
+    def __repr__(self) -> str:
+        return '<OpStats: {}>'.format(self.as_dict())
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        """Return the statistics as a dict."""
+        return {
+            'count': self.count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bytes': self.bytes,
+            'time': self.time,
+        }
+
+
+class FileSysStats:
+    """Records I/O statistics for a filesystem, for each kind of operation.
+
+    Operations are:
+    - 'mount': Creating the system's reference (parsing VPK directories, etc).
+    - 'lookup': Locating a File object.
+    - 'exists': Checking if a file exists.
+    - 'open': Opening a file. When it is closed, the bytes read (for text
+      files, characters) and the time spent in read() calls are added.
+
+    This is always active. Updates are locked, since files may be read
+    from other threads.
+    """
+    __slots__ = ('ops', '_lock')
+
+    def __init__(self) -> None:
+        self.ops = defaultdict(OpStats)  # type: Dict[str, OpStats]
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return '<FileSysStats: {}>'.format(self.snapshot())
+
+    def record(self, operation: str, start: float, hit: bool=True) -> None:
+        """Record an operation, which began at the given perf_counter() time."""
+        duration = perf_counter() - start
+        with self._lock:
+            op = self.ops[operation]
+            op.time += duration
+            op.count += 1
+            if hit:
+                op.hits += 1
+            else:
+                op.misses += 1
+
+    def record_read(self, size: int, duration: float) -> None:
+        """Add the data read from an opened file, and the time taken."""
+        with self._lock:
+            op = self.ops['open']
+            op.bytes += size
+            op.time += duration
+
+    def snapshot(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """Return a copy of the current statistics, as a dict."""
+        with self._lock:
+            return {
+                name: op.as_dict()
+                for name, op in self.ops.items()
+            }
+
+    def reset(self) -> None:
+        """Clear all recorded statistics."""
+        with self._lock:
+            self.ops.clear()
+
+
+class _StatsReader:
+    """Wraps a file, counting the data read from it.
+
+    Only read() calls are timed, since timing each line would cost more
+    than reading it. The totals are recorded when the file is closed.
+    """
+    __slots__ = ('_file', '_stats', '_bytes', '_time')
+
+    def __init__(self, file: IO, stats: FileSysStats) -> None:
+        self._file = file
+        self._stats = stats  # type: Optional[FileSysStats]
+        self._bytes = 0
+        self._time = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+    def __enter__(self) -> '_StatsReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the file, and record the statistics."""
+        self._file.close()
+        if self._stats is not None:
+            self._stats.record_read(self._bytes, self._time)
+            self._stats = None
+
+    def __iter__(self) -> '_StatsReader':
+        return self
+
+    def __next__(self):
+        line = next(self._file)
+        self._bytes += len(line)
+        return line
+
+    def read(self, size: int=-1):
+        start = perf_counter()
+        data = self._file.read(size)
+        self._time += perf_counter() - start
+        self._bytes += len(data)
+        return data
+
+    def read1(self, size: int=-1):
+        data = self._file.read1(size)
+        self._bytes += len(data)
+        return data
+
+    def readline(self, size: int=-1):
+        data = self._file.readline(size)
+        self._bytes += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        count = self._file.readinto(buffer)
+        self._bytes += count or 0
+        return count
+
+
 class File:
     """Represents a file in a system. Should not be created directly."""
     def __init__(self, system: 'FileSystem', path: str, data=None):
@@ -63,14 +222,41 @@ class File:
 
         This should be closed when done.
         """
-        return self.sys.open_bin(self._data)
+        cache = self.sys.cache
+        if cache is not None:
+            data = cache.read(self)
+            if data is not None:
+                return io.BytesIO(data)
+        return self._open_bin()
+
+    def _open_bin(self) -> BinaryIO:
+        """Open the file directly from the system, recording statistics."""
+        if isinstance(self.sys, FileSystemChain):
+            # The original file records the statistics.
+            return self.sys.open_bin(self._data)
+        start = perf_counter()
+        file = self.sys.open_bin(self._data)
+        self.sys.stats.record('open', start)
+        return _StatsReader(file, self.sys.stats)
 
     def open_str(self, encoding='utf8') -> TextIO:
         """Return a file-like object in unicode mode.
 
         This should be closed when done.
         """
-        return self.sys.open_str(self._data, encoding)
+        cache = self.sys.cache
+        if cache is not None:
+            data = cache.read(self)
+            if data is not None:
+                # Decode with universal newlines, like the systems do.
+                return io.TextIOWrapper(io.BytesIO(data), encoding)
+        if isinstance(self.sys, FileSystemChain):
+            # The original file records the statistics.
+            return self.sys.open_str(self._data, encoding)
+        start = perf_counter()
+        file = self.sys.open_str(self._data, encoding)
+        self.sys.stats.record('open', start)
+        return _StatsReader(file, self.sys.stats)
 
     def cache_key(self) -> int:
         """Return a checksum or last-modified date suitable for caching.
@@ -80,38 +266,357 @@ class File:
         return self.sys._get_cache_key(self)
 
 
+class FileCache:
+    """A least-recently-used cache of file contents, limited to a byte budget.
+
+    Assign to FileSystem.cache to enable - the same cache can be shared
+    between several systems. Entries are keyed by the system, path and
+    File.cache_key(), so modified files are re-read. Files without a usable
+    cache key (-1) are never stored.
+    """
+    def __init__(self, max_size: int=64 * 1024 * 1024) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # type: Dict[Tuple[FileSystem, str, int], bytes]
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return '<FileCache: {} files, {}/{} bytes, {} hits, {} misses>'.format(
+            len(self._data),
+            self.size,
+            self.max_size,
+            self.hits,
+            self.misses,
+        )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def read(self, file: File) -> Optional[bytes]:
+        """Return the contents of this file, reading and storing if required.
+
+        If the file can't be cached, None is returned.
+        """
+        # Files from a FileSystemChain wrap the original, use that so
+        # the same data is shared with the system itself.
+        while isinstance(file.sys, FileSystemChain):
+            file = file._data
+        cache_key = file.cache_key()
+        if cache_key == -1:
+            return None
+        key = (file.sys, file.path.casefold(), cache_key)
+        with self._lock:
+            try:
+                data = self._data[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return data
+
+        # Read outside the lock, so other threads aren't blocked.
+        with file.sys, file._open_bin() as f:
+            data = f.read()
+        if len(data) <= self.max_size:
+            with self._lock:
+                if key not in self._data:
+                    self._data[key] = data
+                    self.size += len(data)
+                while self.size > self.max_size:
+                    old_key, old_data = self._data.popitem(last=False)
+                    self.size -= len(old_data)
+        return data
+
+    def clear(self) -> None:
+        """Remove all stored data, and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.size = self.hits = self.misses = 0
+
+
+class PropCache:
+    """A cache of parsed property files stored on disk, for read_prop().
+
+    Assign to FileSystem.prop_cache to enable - the same cache can be shared
+    between several systems and processes. Trees are stored in binary
+    KeyValues format in the folder, keyed by the system, path and
+    File.cache_key(), so warm runs skip parsing. Files without a usable cache
+    key (-1) are never stored.
+
+    Entries not used for max_age seconds are removed when the cache is
+    created or prune() is called. If the folder grows beyond max_size bytes,
+    the least recently used entries are removed.
+    """
+    def __init__(
+        self,
+        folder: str,
+        max_size: int=256 * 1024 * 1024,
+        max_age: float=30 * 24 * 60 * 60,
+    ) -> None:
+        self.folder = os.fspath(folder)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        self.prune()
+
+    def __repr__(self) -> str:
+        return '<PropCache: "{}", {}/{} bytes, {} hits, {} misses>'.format(
+            self.folder,
+            self.size,
+            self.max_size,
+            self.hits,
+            self.misses,
+        )
+
+    def _entry_path(self, file: File, encoding: str) -> Optional[str]:
+        """Return the filename used for this file, or None if not cacheable."""
+        # Files from a FileSystemChain wrap the original, use that so
+        # the same entry is shared with the system itself.
+        while isinstance(file.sys, FileSystemChain):
+            file = file._data
+        cache_key = file.cache_key()
+        if cache_key == -1:
+            return None
+        key = '{}\n{}\n{}\n{}\n{}'.format(
+            type(file.sys).__name__,
+            os.path.abspath(file.sys.path),
+            file.path.casefold(),
+            cache_key,
+            encoding,
+        )
+        name = hashlib.sha1(key.encode('utf8')).hexdigest()
+        return os.path.join(self.folder, name + '.vdf')
+
+    def parse(self, file: File, filename: str, encoding: str='utf8') -> Property:
+        """Return the parsed tree for this file, reading and storing if required.
+
+        The file's system must be open.
+        """
+        path = self._entry_path(file, encoding)
+        if path is None:
+            with file.open_str(encoding) as f:
+                return Property.parse(f, filename)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            tree = Property.parse_binary(data, path)
+        except (OSError, KeyValError):
+            # Missing, or partially written by another process.
+            pass
+        else:
+            with self._lock:
+                self.hits += 1
+            try:
+                # Mark as recently used.
+                os.utime(path)
+            except OSError:
+                pass
+            return tree
+
+        with self._lock:
+            self.misses += 1
+        with file.open_str(encoding) as f:
+            tree = Property.parse(f, filename)
+
+        buf = io.BytesIO()
+        tree.export_binary(buf)
+        data = buf.getvalue()
+        if len(data) <= self.max_size:
+            with AtomicWriter(path, is_bytes=True) as f:
+                f.write(data)
+            with self._lock:
+                self.size += len(data)
+                over = self.size > self.max_size
+            if over:
+                self.prune()
+        return tree
+
+    def prune(self) -> None:
+        """Remove expired entries, and old entries until we are under max_size.
+
+        This also recalculates the size of the folder.
+        """
+        entries = []  # type: List[Tuple[float, int, str]]
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith('.vdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        # Newest first.
+        entries.sort(reverse=True)
+
+        expire_time = time() - self.max_age
+        size = 0
+        for mtime, file_size, path in entries:
+            if mtime >= expire_time and size + file_size <= self.max_size:
+                size += file_size
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self.size = size
+
+    def clear(self) -> None:
+        """Remove all stored entries, and reset the counters."""
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith('.vdf'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        with self._lock:
+            self.size = self.hits = self.misses = 0
+
+
+def _stat_key(path: str) -> Optional[Tuple[int, int]]:
+    """Return the modification time and size of a file, to detect changes.
+
+    If it does not exist, None is returned.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_group(
+    files: List[Tuple[str, File]],
+    callback: Callable[[Tuple[str, Union[bytes, Exception]]], None],
+) -> None:
+    """Read each file in turn, passing the results to the callback.
+
+    This is run in a thread by FileSystem.iter_read().
+    """
+    for path, file in files:
+        try:
+            with file.open_bin() as f:
+                result = f.read()
+        except Exception as exc:
+            result = exc
+        callback((path, result))
+
+
 class FileSystem:
     """Base class for different systems defining the interface."""
     def __init__(self, path: str):
         self.path = os.fspath(path)
         self._ref = None
         self._ref_count = 0
+        self._ref_lock = threading.Lock()
+        # If set, file contents are stored here for reuse.
+        self.cache = None  # type: Optional[FileCache]
+        # If set, read_prop() stores parsed trees here.
+        self.prop_cache = None  # type: Optional[PropCache]
+        self.stats = FileSysStats()
 
     def open_ref(self) -> None:
         """Lock open a reference to this system."""
-        self._ref_count += 1
-        if self._ref is None:
-            self._create_ref()
+        with self._ref_lock:
+            self._ref_count += 1
+            if self._ref is None:
+                start = perf_counter()
+                self._create_ref()
+                self.stats.record('mount', start)
 
     def close_ref(self) -> None:
         """Reverse self.open_ref() - must be done in pairs."""
-        self._ref_count -= 1
-        if self._ref_count < 0:
-            raise ValueError('Closed too many times!')
-        if self._ref_count == 0 and self._ref is not None:
-            self._delete_ref()
+        with self._ref_lock:
+            self._ref_count -= 1
+            if self._ref_count < 0:
+                raise ValueError('Closed too many times!')
+            if self._ref_count == 0 and self._ref is not None:
+                self._delete_ref()
 
     def read_prop(self, path: str, encoding='utf8') -> Property:
         """Read a Property file from the filesystem.
 
-        This handles opening and closing files.
+        This handles opening and closing files. If prop_cache is set, the
+        parsed tree is reused from there.
         """
-        with self, self.open_str(path, encoding) as file:
+        if self.prop_cache is not None:
+            with self:
+                return self.prop_cache.parse(
+                    self[path],
+                    self.path + ':' + path,
+                    encoding,
+                )
+        with self, self[path].open_str(encoding) as file:
             return Property.parse(
                 file,
                 self.path + ':' + path,
             )
 
+    def iter_read(
+        self,
+        paths: Iterable[str],
+        max_workers: int=None,
+    ) -> Iterator[Tuple[str, Union[bytes, Exception]]]:
+        """Read many files at once, yielding (path, data) as each completes.
+
+        Files are grouped by the archive they are stored in, then read in
+        order of their position in the archive. Each group is read on
+        a thread pool. If a file could not be read, the exception is
+        produced instead of the data.
+        """
+        results = queue.Queue()
+        groups = defaultdict(list)  # type: Dict[Tuple[FileSystem, str], List[Tuple[int, str, File]]]
+        with self:
+            for path in paths:
+                try:
+                    file = self[path]
+                except (FileNotFoundError, ValueError) as exc:
+                    yield path, exc
+                    continue
+                # Group by the system actually storing the file.
+                while isinstance(file.sys, FileSystemChain):
+                    file = file._data
+                archive, offset = file.sys._get_read_order(file)
+                groups[file.sys, archive].append((offset, path, file))
+
+            if not groups:
+                return
+            count = 0
+            with ThreadPoolExecutor(max_workers) as executor:
+                for group in groups.values():
+                    group.sort(key=lambda item: item[:2])
+                    executor.submit(_read_group, [
+                        (path, file)
+                        for offset, path, file in group
+                    ], results.put)
+                    count += len(group)
+                for _ in range(count):
+                    yield results.get()
+
+    def read_many(self, paths: Iterable[str], max_workers: int=None) -> Dict[str, bytes]:
+        """Read many files at once, returning a path -> data dict.
+
+        Missing files are not included, other errors are raised.
+        See iter_read() for details.
+        """
+        result = {}
+        for path, data in self.iter_read(paths, max_workers):
+            if isinstance(data, FileNotFoundError):
+                continue
+            elif isinstance(data, Exception):
+                raise data
+            result[path] = data
+        return result
+
     def _check_open(self) -> None:
         """Ensure self._ref is valid."""
         if self._ref is None:
@@ -141,10 +646,59 @@ class FileSystem:
         return self.walk_folder('')
 
     def __getitem__(self, name: str) -> File:
-        return self._get_file(name)
+        return self._lookup(name)
 
     def __contains__(self, name: str) -> bool:
-        return self._file_exists(name)
+        return self._exists(name)
+
+    def _lookup(self, name: str) -> File:
+        """Call _get_file(), recording statistics."""
+        start = perf_counter()
+        try:
+            file = self._get_file(name)
+        except FileNotFoundError:
+            self.stats.record('lookup', start, hit=False)
+            raise
+        self.stats.record('lookup', start)
+        return file
+
+    def _exists(self, name: str) -> bool:
+        """Call _file_exists(), recording statistics."""
+        start = perf_counter()
+        result = self._file_exists(name)
+        self.stats.record('exists', start, result)
+        return result
+
+    def get_stats(self) -> Dict[str, Dict[str, Dict[str, Union[int, float]]]]:
+        """Return a snapshot of the I/O statistics for this system.
+
+        This maps the repr() of each system to its statistics.
+        """
+        return {repr(self): self.stats.snapshot()}
+
+    def reset_stats(self) -> None:
+        """Clear the I/O statistics for this system."""
+        self.stats.reset()
+
+    def log_stats(self, logger: logging.Logger, level: int=logging.INFO) -> None:
+        """Write a summary of the I/O statistics to the given logger."""
+        lines = ['Filesystem statistics:']
+        for name, ops in self.get_stats().items():
+            lines.append(name + ':')
+            if not ops:
+                lines.append('  <unused>')
+            for op_name, op in sorted(ops.items()):
+                line = '  {}: {} ({} hits, {} misses), {:.2f}ms'.format(
+                    op_name,
+                    op['count'],
+                    op['hits'],
+                    op['misses'],
+                    op['time'] * 1000,
+                )
+                if op['bytes']:
+                    line += ', {} bytes'.format(op['bytes'])
+                lines.append(line)
+        logger.log(level, '\n'.join(lines))
 
     def _file_exists(self, name: str) -> bool:
         try:
@@ -186,10 +740,17 @@ class FileSystem:
     def _get_cache_key(self, file: File) -> int:
         """Return a checksum or last-modified date suitable for caching.
 
-        This allows preventing re-parsing the file. If not possible, return -2.
+        This allows preventing re-parsing the file. If not possible, return -1.
         """
         return -1
 
+    def _get_read_order(self, file: File) -> Tuple[str, int]:
+        """Return the archive and offset a file is stored at.
+
+        This is used by iter_read() to group and sort reads.
+        """
+        return '', 0
+
 
 class FileSystemChain(FileSystem):
     """Chains several filesystem into one prioritised whole."""
@@ -197,6 +758,12 @@ class FileSystemChain(FileSystem):
     def __init__(self, *systems: Union[FileSystem, Tuple[str, FileSystem]]):
         super().__init__('')
         self.systems = []  # type: List[Tuple[FileSystem, str]]
+        # Names which weren't found in any system. This is only valid while
+        # we're open, and when the list of systems is unchanged.
+        self._misses = set()  # type: Set[str]
+        # Number of misses produced from the cache, and by searching.
+        self.cached_misses = 0
+        self.uncached_misses = 0
         for sys in systems:
             if isinstance(sys, tuple):
                 self.add_sys(*sys)
@@ -224,25 +791,55 @@ class FileSystemChain(FileSystem):
     def add_sys(self, sys: FileSystem, prefix=''):
         """Add a filesystem to the list."""
         self.systems.append((sys, prefix))
+        # The new system might have files we previously didn't find.
+        self.clear_misses()
         # If we're currently open, apply that to the added systems.
         if self._ref_count > 0:
             sys.open_ref()
 
+    def clear_misses(self) -> None:
+        """Forget which files were not found.
+
+        This must be called if self.systems is modified directly, or the
+        underlying systems change.
+        """
+        self._misses.clear()
+
     def _get_file(self, name: str) -> File:
         """Search for a file on each filesystem in turn."""
         self._check_open()
+        miss_key = name.replace('\\', '/')
+        if miss_key in self._misses:
+            self.cached_misses += 1
+            raise FileNotFoundError(name)
         for sys, prefix in self.systems:
             full_name = os.path.join(prefix, name).replace('\\', '/')
             try:
-                file_info = sys._get_file(full_name)
+                file_info = sys._lookup(full_name)
             except FileNotFoundError:
                 pass
             else:
                 # Pass the original file instance, so we can open
                 # from the original system.
                 return File(self, full_name, file_info)
+        self.uncached_misses += 1
+        self._misses.add(miss_key)
         raise FileNotFoundError(name)
 
+    def _file_exists(self, name: str) -> bool:
+        """Check each system in turn, without needing to make Files."""
+        self._check_open()
+        miss_key = name.replace('\\', '/')
+        if miss_key in self._misses:
+            self.cached_misses += 1
+            return False
+        for sys, prefix in self.systems:
+            if sys._exists(os.path.join(prefix, name).replace('\\', '/')):
+                return True
+        self.uncached_misses += 1
+        self._misses.add(miss_key)
+        return False
+
     def open_str(self, name: str, encoding='utf8') -> TextIO:
         """Open a file in unicode mode or raise FileNotFoundError.
 
@@ -261,6 +858,22 @@ class FileSystemChain(FileSystem):
             return name.open_bin()
         return self._get_file(name).open_bin()
 
+    def get_stats(self) -> Dict[str, Dict[str, Dict[str, Union[int, float]]]]:
+        """Return a snapshot of the I/O statistics for this and each system.
+
+        This maps the repr() of each system to its statistics.
+        """
+        stats = {'FileSystemChain': self.stats.snapshot()}
+        for sys, prefix in self.systems:
+            stats.update(sys.get_stats())
+        return stats
+
+    def reset_stats(self) -> None:
+        """Clear the I/O statistics for this and each system."""
+        self.stats.reset()
+        for sys, prefix in self.systems:
+            sys.reset_stats()
+
     def walk_folder(self, folder: str) -> Iterator[File]:
         """Walk folders, not repeating files."""
         done = set()
@@ -291,9 +904,11 @@ class FileSystemChain(FileSystem):
         for sys, prefix in self.systems:
             sys.close_ref()
         self._ref = None
+        self.clear_misses()
 
     def _create_ref(self) -> None:
         """Creating and deleting refs affects the underlying systems."""
+        self.clear_misses()
         for sys, prefix in self.systems:
             sys.open_ref()
         self._ref = True
@@ -490,18 +1105,116 @@ class RawFileSystem(FileSystem):
         except FileNotFoundError:
             return -1
 
+    def _get_read_order(self, file: File) -> Tuple[str, int]:
+        """Each folder can be read in parallel."""
+        return os.path.dirname(file.path), 0
+
+
+class _MMapReader(io.RawIOBase):
+    """Reads a section of a memory map as a file.
+
+    read() returns a copy as bytes, readinto() copies straight from the map,
+    and getbuffer() gives a view of the data without copying. The map stays
+    open until every reader using it is closed.
+    """
+    def __init__(self, mem: mmap.mmap, start: int, size: int) -> None:
+        super().__init__()
+        self._mem = mem
+        self._start = self._pos = start
+        self._end = start + size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos - self._start
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = self._start + offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._end + offset
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+        self._pos = max(self._start, pos)
+        return self._pos - self._start
+
+    def close(self) -> None:
+        super().close()
+        # Release the map, so it can be closed once all readers are.
+        self._mem = None
+
+    def _read_end(self, size: Optional[int]) -> int:
+        """Compute where a read of this size will stop."""
+        self._checkClosed()
+        if size is None or size < 0:
+            return self._end
+        else:
+            return min(self._end, self._pos + size)
+
+    def read(self, size: int=-1) -> bytes:
+        end = self._read_end(size)
+        if end <= self._pos:
+            return b''
+        data = self._mem[self._pos:end]
+        self._pos = end
+        return data
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer) as view, view.cast('B') as dest:
+            end = self._read_end(len(dest))
+            size = max(0, end - self._pos)
+            with memoryview(self._mem) as mem:
+                dest[:size] = mem[self._pos:end]
+        self._pos += size
+        return size
+
+    def getbuffer(self) -> memoryview:
+        """Return a read-only view of the whole file, without copying.
+
+        The map stays open while the view exists.
+        """
+        self._checkClosed()
+        with memoryview(self._mem) as mem:
+            return mem[self._start:self._end]
+
 
 class ZipFileSystem(FileSystem):
-    """Accesses files in a zip file."""
+    """Accesses files in a zip file.
+
+    If a ZipFile is passed in, it is used directly for all threads.
+    Otherwise, each thread opens its own handle to the zip when reading
+    compressed files, and uncompressed files are read directly from a memory
+    map. The index of filenames is kept when the reference is closed, and
+    reused if the zip has not been modified.
+    """
     def __init__(self, path: str, zipfile: ZipFile=None):
-        self._ref = None  # type: ZipFile
-        self._name_to_info = {}
+        self._ref = None  # type: Union[ZipFile, mmap.mmap, None]
+        # Casefolded name -> info, plus the names in sorted order.
+        self._name_to_info = {}  # type: Dict[str, ZipInfo]
+        self._names = []  # type: List[str]
+        # The modification time and size of the zip the index was built from.
+        self._index_key = None  # type: Optional[Tuple[int, int]]
         super().__init__(path)
+        # Thread ID -> handle used by that thread.
+        self._thread_refs = {}  # type: Dict[int, ZipFile]
+        self._thread_lock = threading.Lock()
+        # If set, the zipfile we were given to use.
+        self._shared_zip = zipfile
 
         if zipfile is not None:
             # Use the zipfile directly, and don't close it.
             self._ref_count += 1
             self._ref = zipfile
+            self._build_index(zipfile)
 
     def __repr__(self):
         return 'ZipFileSystem({!r})'.format(self.path)
@@ -511,9 +1224,14 @@ class ZipFileSystem(FileSystem):
         self._check_open()
         # \\ is not allowed in zips.
         folder = folder.replace('\\', '/').casefold()
-        for filename, fileinfo in self._name_to_info.items():
-            if filename.startswith(folder):
-                yield File(self, fileinfo.filename, fileinfo)
+        names = self._names
+        # Names are sorted, so all those with the prefix are together.
+        for ind in range(bisect.bisect_left(names, folder), len(names)):
+            filename = names[ind]
+            if not filename.startswith(folder):
+                break
+            fileinfo = self._name_to_info[filename]
+            yield File(self, fileinfo.filename, fileinfo)
 
     def open_bin(self, name: str):
         """Open a file in bytes mode or raise FileNotFoundError.
@@ -532,7 +1250,35 @@ class ZipFileSystem(FileSystem):
             except KeyError:
                 raise FileNotFoundError('{}:{}'.format(self.path, name)) from None
 
-        return self._ref.open(info)
+        # Uncompressed files can be read straight from the memory map.
+        # Encrypted files are left to ZipFile to deal with.
+        if (
+            self._shared_zip is None and
+            info.compress_type == ZIP_STORED and
+            not info.flag_bits & 0x1
+        ):
+            mem = self._ref  # type: mmap.mmap
+            # Skip the local header, which is followed by the
+            # variable-length filename and extra field.
+            offset = info.header_offset
+            name_len, extra_len = struct.unpack_from('<HH', mem, offset + 26)
+            return _MMapReader(mem, offset + 30 + name_len + extra_len, info.file_size)
+
+        return self._get_zip().open(info)
+
+    def _get_zip(self) -> ZipFile:
+        """Return the zip handle for the current thread to use."""
+        if self._shared_zip is not None:
+            return self._shared_zip
+        thread = threading.get_ident()
+        try:
+            return self._thread_refs[thread]
+        except KeyError:
+            pass
+        with self._thread_lock:
+            self._check_open()
+            zipfile = self._thread_refs[thread] = ZipFile(self.path)
+            return zipfile
 
     def open_str(self, name: str, encoding='utf8'):
         """Open a file in unicode mode or raise FileNotFoundError.
@@ -555,36 +1301,71 @@ class ZipFileSystem(FileSystem):
         self._check_open()
         return name.replace('\\', '/').casefold() in self._name_to_info
 
-    def _delete_ref(self) -> None:
-        self._ref.close()
-        self._name_to_info.clear()
-        self._ref = None
-
-    def _create_ref(self) -> None:
-        self._ref = zipfile = ZipFile(self.path)
+    def _build_index(self, zipfile: ZipFile) -> None:
+        """Build the lookup tables for the files in the zip."""
         self._name_to_info.clear()
         for info in zipfile.infolist():
             # Some zipfiles include entries for the directories too. They have
             # a trailing slash.
             if not info.filename.endswith('/'):
                 self._name_to_info[info.filename.casefold()] = info
+        self._names = sorted(self._name_to_info)
+
+    def _delete_ref(self) -> None:
+        with self._thread_lock:
+            for zipfile in self._thread_refs.values():
+                zipfile.close()
+            self._thread_refs.clear()
+            # Files still open from the map keep it alive, it's unmapped
+            # once they're all closed.
+            self._ref = None
+
+    def _create_ref(self) -> None:
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._ref = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index_key = (stat.st_mtime_ns, stat.st_size)
+        if index_key != self._index_key:
+            # Changed, we need to re-read the directory. Keep the ZipFile
+            # for this thread to use.
+            zipfile = ZipFile(self.path)
+            with self._thread_lock:
+                self._thread_refs[threading.get_ident()] = zipfile
+            self._build_index(zipfile)
+            self._index_key = index_key
 
     def _get_cache_key(self, file: File):
         """Return the CRC of the VPK file."""
         return file._data.CRC
 
+    def _get_read_order(self, file: File) -> Tuple[str, int]:
+        """All files share the zip, so read in the order they're stored."""
+        return '', file._data.header_offset
+
 
 class VPKFileSystem(FileSystem):
-    """Accesses files in a VPK file."""
-    def __init__(self, path: str):
+    """Accesses files in a VPK file.
+
+    The parsed directory is kept when the reference is closed, and reused if
+    the directory file has not been modified. An already parsed VPK can also
+    be passed in.
+    """
+    def __init__(self, path: str, vpk: VPK=None):
         self._ref = None  # type: VPK
         super().__init__(path)
+        self._vpk = vpk
+        # The modification time and size of the directory file we parsed.
+        self._index_key = _stat_key(self.path) if vpk is not None else None
 
     def __repr__(self):
         return 'VPKFileSystem({!r})'.format(self.path)
 
     def _create_ref(self):
-        self._ref = VPK(self.path)
+        index_key = _stat_key(self.path)
+        if self._vpk is None or index_key != self._index_key:
+            self._vpk = VPK(self.path)
+            self._index_key = index_key
+        self._ref = self._vpk
 
     def _delete_ref(self):
         # We only read from VPKs, so no cleanup needs to be done.
@@ -641,3 +1422,10 @@ class VPKFileSystem(FileSystem):
         """Return the CRC of the VPK file."""
         return file._data.crc
 
+    def _get_read_order(self, file: File) -> Tuple[str, int]:
+        """Group by the archive the data is stored in."""
+        info = file._data  # type: VPKFile
+        if info.arch_index is None or not info.arch_len:
+            return '_dir', info.offset
+        return str(info.arch_index), info.offset
+
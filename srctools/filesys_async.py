@@ -0,0 +1,174 @@
+"""Allows accessing filesystems from asyncio code, without blocking the loop.
+
+All blocking operations are performed on a bounded thread pool. Reads from
+each archive (or folder for raw systems) are additionally limited, so many
+concurrent requests share the I/O bandwidth of different archives instead
+of queueing up on one.
+
+    >>> async def main():
+    ...     async with AsyncFileSystem(fsys) as afsys:
+    ...         data = await afsys.read('materials/dev/dev_measuregeneric01.vmt')
+"""
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, Callable, Dict, List, Tuple, TypeVar,
+    Iterator, AsyncIterator,
+)
+
+from srctools.filesys import File, FileSystem, FileSystemChain
+from srctools.property_parser import Property
+
+
+__all__ = ['AsyncFileSystem']
+
+T = TypeVar('T')
+
+
+def _get_file(fsys: FileSystem, path: str) -> File:
+    """Look up a file, in the executor."""
+    with fsys:
+        return fsys[path]
+
+
+def _file_exists(fsys: FileSystem, path: str) -> bool:
+    """Check if a file exists, in the executor."""
+    with fsys:
+        return path in fsys
+
+
+def _read_file(fsys: FileSystem, file: File) -> bytes:
+    """Read the contents of a file, in the executor."""
+    with fsys, file.open_bin() as f:
+        return f.read()
+
+
+def _parse_prop(data: bytes, encoding: str, filename: str) -> Property:
+    """Parse a Property file, in the executor."""
+    # Wrap to handle universal newlines, like open_str().
+    with io.TextIOWrapper(io.BytesIO(data), encoding) as f:
+        return Property.parse(f, filename)
+
+
+def _walk_chunk(files: Iterator[File], count: int) -> List[File]:
+    """Retrieve the next set of files from walk_folder(), in the executor."""
+    chunk = []
+    for file in files:
+        chunk.append(file)
+        if len(chunk) >= count:
+            break
+    return chunk
+
+
+class AsyncFileSystem:
+    """Wraps a FileSystem, providing coroutine versions of its methods.
+
+    - max_workers is the number of threads used for blocking operations.
+    - archive_limit is the number of reads which may be in progress on each
+      VPK archive, zip or raw folder at once.
+
+    Use as an async context manager to hold a reference to the system open,
+    and shut down the threads when done. Otherwise, call close() when done.
+    """
+    def __init__(
+        self,
+        fsys: FileSystem,
+        max_workers: int=8,
+        archive_limit: int=2,
+    ) -> None:
+        self.fsys = fsys
+        self.archive_limit = archive_limit
+        self._executor = ThreadPoolExecutor(max_workers)
+        # (system, archive) -> the semaphore limiting access to it.
+        self._archive_sems = {}  # type: Dict[Tuple[FileSystem, str], asyncio.Semaphore]
+
+    def __repr__(self) -> str:
+        return 'AsyncFileSystem({!r})'.format(self.fsys)
+
+    async def __aenter__(self) -> 'AsyncFileSystem':
+        """Open a reference to the system, which may need to read from disk."""
+        await self._run(self.fsys.open_ref)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._run(self.fsys.close_ref)
+        self.close()
+
+    def close(self) -> None:
+        """Shut down the thread pool. Pending operations are still completed."""
+        self._executor.shutdown(wait=False)
+
+    def _run(self, func: Callable[..., T], *args: Any) -> 'asyncio.Future[T]':
+        """Run a function in our executor."""
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor,
+            func,
+            *args
+        )
+
+    def _archive_sem(self, file: File) -> asyncio.Semaphore:
+        """Find the semaphore limiting access to the archive for this file."""
+        # Files from a chain wrap the original file.
+        while isinstance(file.sys, FileSystemChain):
+            file = file._data
+        archive, offset = file.sys._get_read_order(file)
+        try:
+            return self._archive_sems[file.sys, archive]
+        except KeyError:
+            sem = self._archive_sems[file.sys, archive] = asyncio.Semaphore(
+                self.archive_limit,
+            )
+            return sem
+
+    async def get_file(self, path: str) -> File:
+        """Locate a file, or raise FileNotFoundError."""
+        return await self._run(_get_file, self.fsys, path)
+
+    async def exists(self, path: str) -> bool:
+        """Check if the given file exists."""
+        return await self._run(_file_exists, self.fsys, path)
+
+    async def read(self, path: str) -> bytes:
+        """Read the entire contents of a file, or raise FileNotFoundError.
+
+        A File object can be passed instead of the path.
+        """
+        if isinstance(path, File):
+            file = path
+        else:
+            file = await self.get_file(path)
+        async with self._archive_sem(file):
+            return await self._run(_read_file, self.fsys, file)
+
+    async def read_prop(self, path: str, encoding='utf8') -> Property:
+        """Read and parse a Property file from the filesystem.
+
+        A File object can be passed instead of the path.
+        """
+        data = await self.read(path)
+        if isinstance(path, File):
+            path = path.path
+        return await self._run(
+            _parse_prop,
+            data,
+            encoding,
+            self.fsys.path + ':' + path,
+        )
+
+    async def walk_folder(self, folder: str, chunk_size: int=64) -> AsyncIterator[File]:
+        """Yield files in a folder.
+
+        Files are retrieved chunk_size at a time from the executor.
+        """
+        files = self.fsys.walk_folder(folder)
+        await self._run(self.fsys.open_ref)
+        try:
+            while True:
+                chunk = await self._run(_walk_chunk, files, chunk_size)
+                for file in chunk:
+                    yield file
+                if len(chunk) < chunk_size:
+                    return
+        finally:
+            await self._run(self.fsys.close_ref)
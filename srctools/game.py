@@ -1,26 +1,207 @@
 """Reads the GameInfo file to determine where Source game data is stored."""
 from pathlib import Path
+from zipfile import ZipFile
 import os
 import sys
-from typing import Union, List
+import json
+import threading
+from typing import Union, List, Dict, Tuple, Optional, Any, Mapping
 
 import itertools
 
-from srctools import Property
+from srctools import Property, AtomicWriter, EmptyMapping
 from srctools.filesys import FileSystemChain, VPKFileSystem, RawFileSystem
+from srctools.vpk import VPK
 
 
+__all__ = ['Game', 'MountCache', 'find_gameinfo']
+
 GINFO = 'gameinfo.txt'
 
+# Attributes of Game saved in the mount cache.
+_GAME_ATTRS = [
+    'game_name', 'app_id', 'tools_id', 'additional_content',
+    'fgd_loc', 'search_paths',
+]
+
+
+def _stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """Return the modification time and size of a path, or None if missing."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class MountCache:
+    """Caches parsed gameinfo files and the filesystems built from them.
+
+    This skips parsing gameinfo, probing for DLC folders and checking each
+    search path, and VPK directories are read from the cache instead of
+    the game. Entries are discarded if gameinfo, any search path or any VPK
+    is modified, so only these are checked.
+
+    If a filename is passed, the cache is loaded from there, allowing
+    separate processes to share it. Call save() to write it back, or use the
+    cache as a context manager to save on exit if it was modified. The file
+    is a zip, holding the entries as JSON and the VPK directory data.
+    """
+    # Increment to invalidate existing cache files.
+    VERSION = 2
+
+    def __init__(self, filename: Union[str, Path, None]=None) -> None:
+        self.filename = filename
+        # Gameinfo folder -> entry.
+        self._games = {}  # type: Dict[str, Dict[str, Any]]
+        self._lock = threading.Lock()
+        # If entries were added since loading or saving.
+        self._modified = False
+        if filename is not None:
+            self.load()
+
+    def __repr__(self) -> str:
+        return 'MountCache({!r})'.format(self.filename)
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def __enter__(self) -> 'MountCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        """Save the cache, if it was modified and has a filename."""
+        if self.filename is not None and self._modified:
+            self.save()
+
+    def load(self) -> None:
+        """Load the cache from the file.
+
+        If it is missing, corrupt or from a different version it is ignored.
+        """
+        games = {}  # type: Dict[str, Dict[str, Any]]
+        try:
+            with ZipFile(self.filename) as zipfile:
+                index = json.loads(zipfile.read('index.json').decode('utf8'))
+                if index['version'] != self.VERSION:
+                    return
+                for game, data in index['games'].items():
+                    entry = {attr: data[attr] for attr in _GAME_ATTRS}
+                    entry['search_paths'] = list(map(Path, data['search_paths']))
+                    entry['stamps'] = {
+                        path: None if stamp is None else tuple(stamp)
+                        for path, stamp in data['stamps'].items()
+                    }
+                    if 'mounts' in data:
+                        entry['mounts'] = [
+                            (kind, Path(path), None if vpk_dir is None
+                             else zipfile.read('vpk/{}'.format(vpk_dir)))
+                            for kind, path, vpk_dir in data['mounts']
+                        ]
+                    games[game] = entry
+        except Exception:
+            # Missing, partially written, or incompatible.
+            return
+        with self._lock:
+            self._games.update(games)
+
+    def save(self) -> None:
+        """Write the cache to the file, replacing it atomically."""
+        if self.filename is None:
+            raise ValueError('No filename set for the cache!')
+        with self._lock:
+            games = self._games.copy()
+            self._modified = False
+        index = {}  # type: Dict[str, Dict[str, Any]]
+        vpk_dirs = []  # type: List[bytes]
+        for game, entry in games.items():
+            data = {attr: entry[attr] for attr in _GAME_ATTRS}
+            data['search_paths'] = list(map(str, entry['search_paths']))
+            data['stamps'] = entry['stamps']
+            if 'mounts' in entry:
+                data['mounts'] = mounts = []
+                for kind, path, vpk_dir in entry['mounts']:
+                    if vpk_dir is not None:
+                        vpk_dirs.append(vpk_dir)
+                        mounts.append((kind, str(path), len(vpk_dirs) - 1))
+                    else:
+                        mounts.append((kind, str(path), None))
+            index[game] = data
+
+        with AtomicWriter(os.fspath(self.filename), is_bytes=True) as f, ZipFile(f, 'w') as zipfile:
+            zipfile.writestr('index.json', json.dumps({
+                'version': self.VERSION,
+                'games': index,
+            }))
+            for i, vpk_dir in enumerate(vpk_dirs):
+                zipfile.writestr('vpk/{}'.format(i), vpk_dir)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._games.clear()
+
+    def _lookup(self, game: Path) -> Optional[Dict[str, Any]]:
+        """Return the entry for this game, if it is still valid."""
+        with self._lock:
+            entry = self._games.get(str(game))
+        if entry is None:
+            return None
+        for path, stamp in entry['stamps'].items():
+            if _stamp(Path(path)) != stamp:
+                with self._lock:
+                    # Only remove if it's the same entry.
+                    if self._games.get(str(game)) is entry:
+                        del self._games[str(game)]
+                return None
+        return entry
+
+    def _store(self, game: Path, entry: Dict[str, Any], paths: List[Path]) -> None:
+        """Add or update an entry, recording the stamps of the given paths."""
+        stamps = entry.setdefault('stamps', {})
+        for path in paths:
+            stamps[str(path)] = _stamp(path)
+        with self._lock:
+            self._games[str(game)] = entry
+            self._modified = True
+
 
 class Game:
     """Represents the data in GameInfo."""
-    def __init__(self, path: Union[str, Path]):
-        """Parse a game from a folder."""
+    def __init__(self, path: Union[str, Path], cache: MountCache=None):
+        """Parse a game from a folder.
+
+        If a MountCache is passed, it is used to skip reading if possible.
+        """
         if isinstance(path, Path):
             self.path = path
         else:
             self.path = Path(path)
+        self.cache = cache
+
+        if cache is not None:
+            entry = cache._lookup(self.path)
+            if entry is not None:
+                for attr in _GAME_ATTRS:
+                    setattr(self, attr, entry[attr])
+                # Don't let changes affect the cache.
+                self.search_paths = list(self.search_paths)
+                return
+
+        self._parse()
+
+        if cache is not None:
+            watched = [self.path / GINFO]
+            watched += self.search_paths
+            if self.search_paths:
+                # Detect new DLC folders being added.
+                watched.append(self.search_paths[0].parent)
+            entry = {attr: getattr(self, attr) for attr in _GAME_ATTRS}
+            entry['search_paths'] = self.search_paths.copy()
+            cache._store(self.path, entry, watched)
+
+    def _parse(self) -> None:
+        """Read the gameinfo file."""
         with open(self.path / GINFO) as f:
             gameinfo = Property.parse(f).find_key('GameInfo')
         fsystems = gameinfo.find_key('Filesystem', [])
@@ -68,7 +249,16 @@ class Game:
             return (root / prop.value[25:]).absolute()
 
     def get_filesystem(self) -> FileSystemChain:
-        """Build a chained filesystem from the search paths."""
+        """Build a chained filesystem from the search paths.
+
+        If a MountCache is used, VPKs are parsed immediately so the cache
+        can store their directories.
+        """
+        if self.cache is not None:
+            entry = self.cache._lookup(self.path)
+            if entry is not None and 'mounts' in entry:
+                return self._build_chain(entry['mounts'])
+
         vpks = []
         raw_folders = []
         for path in self.search_paths:
@@ -86,16 +276,53 @@ class Game:
             if path.is_file() and path.suffix == '.vpk':
                 vpks.append(path)
 
-        fsys = FileSystemChain()
+        mounts = []  # type: List[Tuple[str, Path, Optional[bytes]]]
+        parsed = {}  # type: Dict[Path, VPK]
         for path in vpks:
-            fsys.add_sys(VPKFileSystem(path))
-        for path in raw_folders:
-            fsys.add_sys(RawFileSystem(path))
+            if self.cache is None:
+                mounts.append(('vpk', path, None))
+            else:
+                data = path.read_bytes()
+                vpk = parsed[path] = VPK(path, dir_contents=data)
+                # Only keep the directory tree, not the file data after it.
+                mounts.append(('vpk', path, data[:vpk.header_len]))
+        mounts += [('raw', path, None) for path in raw_folders]
+
+        if self.cache is not None:
+            entry = self.cache._lookup(self.path)
+            if entry is not None:
+                # Add to the existing entry, to keep the other stamps.
+                entry = entry.copy()
+                entry['stamps'] = entry['stamps'].copy()
+                entry['mounts'] = mounts
+                self.cache._store(self.path, entry, vpks)
 
+        return self._build_chain(mounts, parsed)
+
+    @staticmethod
+    def _build_chain(
+        mounts: List[Tuple[str, Path, Optional[bytes]]],
+        parsed: Mapping[Path, VPK]=EmptyMapping,
+    ) -> FileSystemChain:
+        """Create the filesystem from the mount table.
+
+        Each is a 'vpk' or 'raw' system, then the path. VPKs also have the
+        directory data, or None to read it when mounted. Already parsed
+        VPKs can be passed in as well.
+        """
+        fsys = FileSystemChain()
+        for kind, path, vpk_dir in mounts:
+            if kind == 'vpk':
+                vpk = parsed.get(path)
+                if vpk is None and vpk_dir is not None:
+                    vpk = VPK(path, dir_contents=vpk_dir)
+                fsys.add_sys(VPKFileSystem(path, vpk))
+            else:
+                fsys.add_sys(RawFileSystem(path))
         return fsys
 
 
-def find_gameinfo(argv=sys.argv) -> Game:
+def find_gameinfo(argv=sys.argv, cache: MountCache=None) -> Game:
     """Locate the game we're in, if launched as a a compiler.
     
     This checks the following:
@@ -103,6 +330,8 @@ def find_gameinfo(argv=sys.argv) -> Game:
     * -game
     * the VPROJECT environment variable
     * the current folder and all parents.
+
+    The cache is passed along to the Game.
     """
     for i, value in enumerate(argv):
         if value.casefold() in ('-vproject', '-game'):
@@ -113,19 +342,19 @@ def find_gameinfo(argv=sys.argv) -> Game:
                     '"{}" argument has no value!'.format(value)
                 ) from None
             if Path(path, GINFO).exists():
-                return Game(path)
+                return Game(path, cache)
     else:
         # Check VPROJECT
         if 'VPROJECT' in os.environ:
             path = os.environ['VPROJECT']
             if Path(path, GINFO).exists():
-                return Game(path)
+                return Game(path, cache)
         else:
             if Path(os.getcwd(), GINFO).exists():
-                return Game(os.getcwd())
+                return Game(os.getcwd(), cache)
 
             for folder in Path(os.getcwd()).parents:
                 path = folder / GINFO
                 if path.exists():
-                    return Game(path)
+                    return Game(path, cache)
             raise ValueError("Couldn't find gameinfo.txt!")
@@ -1,12 +1,12 @@
 """Handles the list of files which are desired to be packed into the BSP."""
 import io
 from collections import OrderedDict
-from typing import Iterable, Dict, Tuple, List, Iterator
+from typing import Iterable, Dict, Tuple, List, Iterator, Optional
 from enum import Enum
 from zipfile import ZipFile
 import os
 
-from srctools.property_parser import Property
+from srctools.property_parser import Property, KeyValError
 from srctools.vmf import VMF
 from srctools.fgd import FGD, ValueTypes as KVTypes, KeyValues
 from srctools.bsp import BSP
@@ -361,7 +361,8 @@ class PackList:
         """Read the soundscript manifest, and read all mentioned scripts.
 
         If cache_file is provided, it should be a path to a file used to
-        cache the file reading for later use.
+        cache the file reading for later use. This is stored in binary
+        KeyValues format.
         """
         try:
             man = self.fsys.read_prop('scripts/game_sounds_manifest.txt')
@@ -371,12 +372,17 @@ class PackList:
         cache_data = {}  # type: Dict[str, Tuple[int, Property]]
         if cache_file is not None:
             try:
-                f = open(cache_file)
+                f = open(cache_file, 'rb')
             except FileNotFoundError:
                 pass
             else:
                 with f:
-                    old_cache = Property.parse(f, cache_file)
+                    cache_bytes = f.read()
+                try:
+                    old_cache = Property.parse_binary(cache_bytes, cache_file)
+                except KeyValError:
+                    # Corrupt, or the old text format. Rebuild it.
+                    old_cache = Property(None, [])
                 for cache_prop in old_cache:
                     cache_data[cache_prop.name] = (
                         cache_prop.int('cache_key'),
@@ -433,9 +439,8 @@ class PackList:
 
         if cache_file is not None:
             # Write back out our new cache with updated data.
-            with open(cache_file, 'w') as f:
-                for line in new_cache_data.export():
-                    f.write(line)
+            with open(cache_file, 'wb') as f:
+                new_cache_data.export_binary(f)
 
     def write_manifest(self, map_name: str=None) -> None:
         """Produce and pack a manifest file for this map.
@@ -451,16 +456,15 @@ class PackList:
             if is_enabled is SoundScriptMode.INCLUDE
         ])
 
-        buf = bytearray()
-        for line in manifest.export():
-            buf.extend(line.encode('utf8'))
+        buf = io.BytesIO()
+        manifest.export_to(buf)
 
         self.pack_file(
             'map/{}_level_sounds.txt'.format(map_name)
             if map_name else
             'scripts/game_sounds_manifest.txt',
             FileType.SOUNDSCRIPT,
-            bytes(buf),
+            buf.getvalue(),
         )
 
     def pack_from_bsp(self, bsp: BSP) -> None:
@@ -577,6 +581,9 @@ class PackList:
         # Then remove blacklisted systems.
         allowed.difference_update(blacklist)
 
+        # Filename -> data, or None to read from the filesystem.
+        to_pack = OrderedDict()  # type: Dict[str, Optional[bytes]]
+
         with self.fsys:
             for file in self._files.values():
                 # Need to ensure / separators.
@@ -584,7 +591,7 @@ class PackList:
 
                 if file.virtual:
                     # Always pack.
-                    zip_file.writestr(fname, file.data)
+                    to_pack[fname] = file.data
                     continue
 
                 if file.filename in existing_names:
@@ -600,8 +607,41 @@ class PackList:
                     continue
 
                 if self.fsys.get_system(sys_file) in allowed:
-                    with sys_file.open_bin() as f:
-                        zip_file.writestr(fname, f.read())
+                    to_pack[fname] = None
+
+            # Read all the files in one batch, which is much quicker.
+            # We write them in our original order as soon as they arrive,
+            # only keeping files read before their turn.
+            order = list(to_pack.items())
+            pos = 0
+            # Filename -> data, or None if it is missing.
+            pending = {}  # type: Dict[str, Optional[bytes]]
+
+            def write_ready() -> None:
+                """Write files until one hasn't been read yet."""
+                nonlocal pos
+                while pos < len(order):
+                    fname, data = order[pos]
+                    if data is None:
+                        try:
+                            data = pending.pop(fname)
+                        except KeyError:
+                            return
+                    pos += 1
+                    if data is not None:
+                        zip_file.writestr(fname, data)
+
+            write_ready()
+            for fname, data in self.fsys.iter_read([
+                fname for fname, data in order
+                if data is None
+            ]):
+                if isinstance(data, FileNotFoundError):
+                    data = None
+                elif isinstance(data, Exception):
+                    raise data
+                pending[fname] = data
+                write_ready()
 
     def eval_dependencies(self) -> None:
         """Add files to the list which need to also be packed.
@@ -652,6 +692,7 @@ class PackList:
                 file.filename: file.data,
             })
             self.fsys.systems.insert(0, (virtual_system, ''))
+            self.fsys.clear_misses()
             try:
                 mdl = Model(self.fsys, self.fsys[file.filename])
             finally:
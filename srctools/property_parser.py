@@ -57,27 +57,59 @@ They end with a quote."
 
     \n, \t, and \\ will be converted in Property values.
 """
+import io
 import sys
+import mmap
+import struct
 import keyword
 import builtins  # Property.bool etc shadows these.
 
 from srctools import BOOL_LOOKUP, EmptyMapping
 from srctools.vec import Vec as _Vec
-from srctools.tokenizer import Token, Tokenizer, TokenSyntaxError, escape_text
+from srctools.tokenizer import (
+    Token, Tokenizer, C_Tokenizer, Py_Tokenizer, BytesTokenizer,
+    TokenSyntaxError, escape_text, _decode_bytes,
+)
 
 from typing import (
     Optional, Union, Any,
-    List, Tuple, Dict, Iterator,
+    List, Tuple, Dict, Iterator, Callable, IO,
     TypeVar,
     Iterable,
 )
 
 
-__all__ = ['KeyValError', 'NoKeyError', 'Property']
+__all__ = ['KeyValError', 'NoKeyError', 'Property', 'PropertyHandler']
 
 # Sentinel value to indicate that no default was given to find_key()
 _NO_KEY_FOUND = object()
 
+# The compiled versions of Property.parse() and parse_events(), if available.
+try:
+    from srctools._tokenizer import (  # type: ignore
+        _parse_tree as _cy_parse_tree,
+        _parse_events as _cy_parse_events,
+    )
+except ImportError:
+    _cy_parse_tree = _cy_parse_events = None
+
+
+# Types which are decoded for the compiled Tokenizer, or otherwise parsed
+# with BytesTokenizer.
+_BINARY_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+# Type codes used in binary KeyValues.
+_BIN_BLOCK = 0
+_BIN_STRING = 1
+_BIN_INT = 2
+_BIN_FLOAT = 3
+_BIN_POINTER = 4
+_BIN_WSTRING = 5
+_BIN_COLOR = 6
+_BIN_UINT64 = 7
+_BIN_END = 8
+_BIN_END_ALT = 11  # Also used by Steam for the end of blocks.
+
 _Prop_Value = Union[List['Property'], str, Any]
 _As_Dict_Ret = Dict[str, Union[str, '_As_Dict_Ret']]
 
@@ -136,6 +168,506 @@ def _read_flag(flags: Dict[str, bool], flag_val: str) -> bool:
     return flag_inv is not flag_result
 
 
+def _ignore(*args) -> None:
+    """Discards events inside blocks disabled by flags."""
+
+
+class PropertyHandler:
+    """Receives events from Property.parse_events().
+
+    Override the methods to process the file without building the tree.
+    If replace is True, the property replaces the previous one in the block,
+    due to a flag.
+    """
+    def key_value(self, name: str, value: str, replace: bool) -> None:
+        """Called for each "name" "value" pair."""
+
+    def start_block(self, name: str, replace: bool) -> None:
+        """Called when a block is opened."""
+
+    def end_block(self) -> None:
+        """Called when the last opened block is closed."""
+
+
+class _TreeBuilder(PropertyHandler):
+    """Builds a tree from the events, the basis of _SelectBuilder."""
+    def __init__(self) -> None:
+        self.root = Property(None, [])
+        # The blocks we are currently inside (outside to inside).
+        self._open_blocks = [self.root]
+        # The list of children of the current block.
+        self._children = self.root.value  # type: List[Property]
+
+    def key_value(self, name: str, value: str, replace: bool) -> None:
+        if replace:
+            self._children[-1] = Property(name, value)
+        else:
+            self._children.append(Property(name, value))
+
+    def start_block(self, name: str, replace: bool) -> None:
+        block = Property(name, [])
+        if replace:
+            self._children[-1] = block
+        else:
+            self._children.append(block)
+        self._open_blocks.append(block)
+        self._children = block.value
+
+    def end_block(self) -> None:
+        self._open_blocks.pop()
+        self._children = self._open_blocks[-1].value
+
+
+class _SelectBuilder(_TreeBuilder):
+    """Builds only the selected blocks, for Property.parse_select()."""
+    def __init__(self, select: Callable[[List[str]], bool]) -> None:
+        super().__init__()
+        self.select = select
+        # The names of blocks we are inside, while not building.
+        self._path = []  # type: List[str]
+        # When building, the number of blocks inside the selected one.
+        self._depth = 0
+
+    def key_value(self, name: str, value: str, replace: bool) -> None:
+        if self._depth:
+            super().key_value(name, value, replace)
+
+    def start_block(self, name: str, replace: bool) -> None:
+        if self._depth:
+            self._depth += 1
+            super().start_block(name, replace)
+            return
+        self._path.append(name)
+        if self.select(self._path):
+            self._depth = 1
+            # Replacements only apply to blocks we built.
+            super().start_block(name, False)
+
+    def end_block(self) -> None:
+        if self._depth:
+            self._depth -= 1
+            super().end_block()
+            if self._depth:
+                return
+        self._path.pop()
+
+
+def _make_tokenizer(
+    file_contents: Union[str, Iterator[str], bytes, memoryview],
+    filename: str,
+    encoding: str,
+) -> Tokenizer:
+    """Create the appropriate tokenizer for the type of data.
+
+    The compiled Tokenizer is much faster than BytesTokenizer even after
+    decoding everything, so that is only used for the Python version.
+    """
+    if isinstance(file_contents, _BINARY_TYPES):
+        if C_Tokenizer is not Py_Tokenizer:
+            file_contents = _decode_bytes(file_contents, encoding)
+        else:
+            return BytesTokenizer(
+                file_contents,
+                filename,
+                KeyValError,
+                string_bracket=True,
+                encoding=encoding,
+            )
+    return Tokenizer(
+        file_contents,
+        filename,
+        KeyValError,
+        string_bracket=True,
+    )
+
+
+def _parse_events(
+    tokenizer: Tokenizer,
+    handler: PropertyHandler,
+    flags: Dict[str, bool],
+) -> None:
+    """Implements Property.parse_events()."""
+    # Grab a reference to the token values, so we avoid global lookups.
+    STRING = Token.STRING
+    PROP_FLAG = Token.PROP_FLAG
+    NEWLINE = Token.NEWLINE
+    BRACE_OPEN = Token.BRACE_OPEN
+    BRACE_CLOSE = Token.BRACE_CLOSE
+
+    # Handler methods, which are swapped out while skipping a block.
+    key_value = handler.key_value
+    start_block = handler.start_block
+    end_block = handler.end_block
+
+    # The names of the blocks we are currently in.
+    open_blocks = []  # type: List[str]
+    # If non-zero, we're inside a block disabled by a flag. This is
+    # the number of blocks deep.
+    skip_depth = 0
+    # The replacement state from before the disabled block, restored after.
+    skip_state = (False, None, False)  # type: Tuple[bool, Optional[str], bool]
+
+    # The name of the block ("name"\n) whose { must be next, or None.
+    # Then if the block replaces the previous, and whether it's enabled.
+    block_name = None  # type: Optional[str]
+    block_replace = block_enabled = False
+
+    # Are we permitted to replace the last property with a flagged version of the same?
+    can_flag_replace = False
+    # The name of the last property in the block, and if it was a block.
+    last_name = None  # type: Optional[str]
+    last_block = False
+
+    for token_type, token_value in tokenizer:
+        if token_type is BRACE_OPEN:  # {
+            # Open a new block - make sure the last token was a name..
+            if block_name is None:
+                raise tokenizer.error(
+                    'Property cannot have sub-section if it already '
+                    'has an in-line value.\n\n'
+                    'A "name" "value" line cannot then open a block.',
+                )
+            if skip_depth:
+                skip_depth += 1
+            elif block_enabled:
+                start_block(block_name, block_replace)
+            else:
+                # Disabled by a flag, ignore everything inside.
+                skip_depth = 1
+                skip_state = can_flag_replace, last_name, last_block
+                key_value = start_block = end_block = _ignore
+            open_blocks.append(block_name)
+            block_name = None
+            can_flag_replace = False
+            continue
+        # Something else, but followed by '{'
+        elif block_name is not None and token_type is not NEWLINE:
+            raise tokenizer.error(
+                'Block opening ("{{") required!\n\n'
+                'A single "name" on a line should next have a open brace '
+                'to begin a block.',
+            )
+
+        if token_type is NEWLINE:
+            continue
+        if token_type is STRING:   # "string"
+            # We need to check the next token to figure out what kind of
+            # prop it is.
+            prop_type, prop_value = tokenizer()
+
+            # It's a block followed by flag. ("name" [stuff])
+            if prop_type is PROP_FLAG:
+                # That must be the end of the line..
+                tokenizer.expect(NEWLINE)
+                block_name = token_value
+                block_enabled = _read_flag(flags, prop_value)
+                # Special function - if the last prop was a
+                # block with this name, replace it instead.
+                block_replace = block_enabled and (
+                    can_flag_replace and
+                    last_block and
+                    last_name == token_value
+                )
+                if block_enabled:
+                    # Can't do twice in a row
+                    can_flag_replace = False
+
+            elif prop_type is STRING:
+                # A value.. ("name" "value")
+                # Check for flags.
+                flag_token, flag_val = tokenizer()
+                if flag_token is PROP_FLAG:
+                    # Should be the end of the line here.
+                    tokenizer.expect(NEWLINE)
+                    if _read_flag(flags, flag_val):
+                        # Special function - if the last prop was a
+                        # keyvalue with this name, replace it instead.
+                        key_value(
+                            token_value,
+                            prop_value,
+                            can_flag_replace and
+                            not last_block and
+                            last_name == token_value,
+                        )
+                        last_name = token_value
+                        last_block = False
+                        # Can't do twice in a row
+                        can_flag_replace = False
+                elif flag_token is STRING:
+                    # Specifically disallow multiple text on the same line.
+                    # ("name" "value" "name2" "value2")
+                    raise tokenizer.error(
+                        "Cannot have multiple names on the same line!"
+                    )
+                else:
+                    # Otherwise, it's got nothing after.
+                    # So insert the keyvalue, and check the token
+                    # in the next loop. This allows braces to be
+                    # on the same line.
+                    key_value(token_value, prop_value, False)
+                    last_name = token_value
+                    last_block = False
+                    can_flag_replace = True
+                    tokenizer.push_back(flag_token, flag_val)
+                continue
+            else:  # Something else - treat this as a block, and
+                # then re-evaluate this in the next loop.
+                block_name = token_value
+                block_enabled = True
+                block_replace = can_flag_replace = False
+                tokenizer.push_back(prop_type, prop_value)
+                continue
+
+        elif token_type is BRACE_CLOSE:  # }
+            # Move back a block
+            try:
+                last_name = open_blocks.pop()
+            except IndexError:
+                # It's empty, we've closed one too many properties.
+                raise tokenizer.error(
+                    'Too many closing brackets.\n\n'
+                    'An extra closing bracket was added which would '
+                    'close the outermost level.',
+                )
+            last_block = True
+            end_block()
+            if skip_depth:
+                skip_depth -= 1
+                if not skip_depth:
+                    # Finished the disabled block.
+                    key_value = handler.key_value
+                    start_block = handler.start_block
+                    end_block = handler.end_block
+                    # It wasn't added, so continue as if it wasn't there.
+                    can_flag_replace, last_name, last_block = skip_state
+                    continue
+            # For replacing the block.
+            can_flag_replace = True
+        else:
+            raise tokenizer.error(token_type)
+
+    # We're out of data, do some final sanity checks.
+
+    # We last had a ("name"\n), so we were expecting a block
+    # next.
+    if block_name is not None:
+        raise KeyValError(
+            'Block opening ("{") required, but hit EOF!\n'
+            'A "name" line was located at the end of the file, which needs'
+            ' a {} block to follow.',
+            tokenizer.filename,
+            line=None,
+        )
+
+    # All the properties in the file should be closed.
+    if open_blocks:
+        raise KeyValError(
+            'End of text reached with remaining open sections.\n\n'
+            "File ended with at least one property that didn't "
+            'have an ending "}".',
+            tokenizer.filename,
+            line=None,
+        )
+
+
+def _parse_tree(tokenizer: Tokenizer, flags: Dict[str, bool]) -> 'Property':
+    """Implements Property.parse().
+
+    This produces the same tree as _TreeBuilder with _parse_events(), but
+    builds it directly instead of calling a method for each property.
+    """
+    # Grab a reference to the token values, so we avoid global lookups.
+    STRING = Token.STRING
+    PROP_FLAG = Token.PROP_FLAG
+    NEWLINE = Token.NEWLINE
+    BRACE_OPEN = Token.BRACE_OPEN
+    BRACE_CLOSE = Token.BRACE_CLOSE
+
+    # The special name 'None' marks it as the root property, which
+    # just outputs its children when exported. This way we can handle
+    # multiple root blocks in the file, while still returning a single
+    # Property object which has all the methods.
+    root = Property(None, [])
+    # The children of the current block, and of those outside it.
+    children = root.value  # type: List[Property]
+    open_children = []  # type: List[List[Property]]
+    # The names of the blocks we are currently in.
+    open_blocks = []  # type: List[str]
+    # If non-zero, we're inside a block disabled by a flag. This is
+    # the number of blocks deep.
+    skip_depth = 0
+    # The replacement state from before the disabled block, restored after.
+    skip_state = (False, None, False)  # type: Tuple[bool, Optional[str], bool]
+
+    # The name of the block ("name"\n) whose { must be next, or None.
+    # Then if the block replaces the previous, and whether it's enabled.
+    block_name = None  # type: Optional[str]
+    block_replace = block_enabled = False
+
+    # Are we permitted to replace the last property with a flagged version of the same?
+    can_flag_replace = False
+    # The name of the last property in the block, and if it was a block.
+    last_name = None  # type: Optional[str]
+    last_block = False
+
+    for token_type, token_value in tokenizer:
+        if token_type is BRACE_OPEN:  # {
+            # Open a new block - make sure the last token was a name..
+            if block_name is None:
+                raise tokenizer.error(
+                    'Property cannot have sub-section if it already '
+                    'has an in-line value.\n\n'
+                    'A "name" "value" line cannot then open a block.',
+                )
+            if skip_depth:
+                skip_depth += 1
+            elif block_enabled:
+                block = Property(block_name, [])
+                if block_replace:
+                    children[-1] = block
+                else:
+                    children.append(block)
+                open_children.append(children)
+                children = block.value
+            else:
+                # Disabled by a flag, ignore everything inside.
+                skip_depth = 1
+                skip_state = can_flag_replace, last_name, last_block
+            open_blocks.append(block_name)
+            block_name = None
+            can_flag_replace = False
+            continue
+        # Something else, but followed by '{'
+        elif block_name is not None and token_type is not NEWLINE:
+            raise tokenizer.error(
+                'Block opening ("{{") required!\n\n'
+                'A single "name" on a line should next have a open brace '
+                'to begin a block.',
+            )
+
+        if token_type is NEWLINE:
+            continue
+        if token_type is STRING:   # "string"
+            # We need to check the next token to figure out what kind of
+            # prop it is.
+            prop_type, prop_value = tokenizer()
+
+            # It's a block followed by flag. ("name" [stuff])
+            if prop_type is PROP_FLAG:
+                # That must be the end of the line..
+                tokenizer.expect(NEWLINE)
+                block_name = token_value
+                block_enabled = _read_flag(flags, prop_value)
+                # Special function - if the last prop was a
+                # block with this name, replace it instead.
+                block_replace = block_enabled and (
+                    can_flag_replace and
+                    last_block and
+                    last_name == token_value
+                )
+                if block_enabled:
+                    # Can't do twice in a row
+                    can_flag_replace = False
+
+            elif prop_type is STRING:
+                # A value.. ("name" "value")
+                # Check for flags.
+                flag_token, flag_val = tokenizer()
+                if flag_token is PROP_FLAG:
+                    # Should be the end of the line here.
+                    tokenizer.expect(NEWLINE)
+                    if _read_flag(flags, flag_val):
+                        if not skip_depth:
+                            # Special function - if the last prop was a
+                            # keyvalue with this name, replace it instead.
+                            if (
+                                can_flag_replace and
+                                not last_block and
+                                last_name == token_value
+                            ):
+                                children[-1] = Property(token_value, prop_value)
+                            else:
+                                children.append(Property(token_value, prop_value))
+                        last_name = token_value
+                        last_block = False
+                        # Can't do twice in a row
+                        can_flag_replace = False
+                elif flag_token is STRING:
+                    # Specifically disallow multiple text on the same line.
+                    # ("name" "value" "name2" "value2")
+                    raise tokenizer.error(
+                        "Cannot have multiple names on the same line!"
+                    )
+                else:
+                    # Otherwise, it's got nothing after.
+                    # So insert the keyvalue, and check the token
+                    # in the next loop. This allows braces to be
+                    # on the same line.
+                    if not skip_depth:
+                        children.append(Property(token_value, prop_value))
+                    last_name = token_value
+                    last_block = False
+                    can_flag_replace = True
+                    tokenizer.push_back(flag_token, flag_val)
+                continue
+            else:  # Something else - treat this as a block, and
+                # then re-evaluate this in the next loop.
+                block_name = token_value
+                block_enabled = True
+                block_replace = can_flag_replace = False
+                tokenizer.push_back(prop_type, prop_value)
+                continue
+
+        elif token_type is BRACE_CLOSE:  # }
+            # Move back a block
+            try:
+                last_name = open_blocks.pop()
+            except IndexError:
+                # It's empty, we've closed one too many properties.
+                raise tokenizer.error(
+                    'Too many closing brackets.\n\n'
+                    'An extra closing bracket was added which would '
+                    'close the outermost level.',
+                )
+            last_block = True
+            if skip_depth:
+                skip_depth -= 1
+                if not skip_depth:
+                    # It wasn't added, so continue as if it wasn't there.
+                    can_flag_replace, last_name, last_block = skip_state
+                    continue
+            else:
+                children = open_children.pop()
+            # For replacing the block.
+            can_flag_replace = True
+        else:
+            raise tokenizer.error(token_type)
+
+    # We're out of data, do some final sanity checks.
+
+    # We last had a ("name"\n), so we were expecting a block
+    # next.
+    if block_name is not None:
+        raise KeyValError(
+            'Block opening ("{") required, but hit EOF!\n'
+            'A "name" line was located at the end of the file, which needs'
+            ' a {} block to follow.',
+            tokenizer.filename,
+            line=None,
+        )
+
+    # All the properties in the file should be closed.
+    if open_blocks:
+        raise KeyValError(
+            'End of text reached with remaining open sections.\n\n'
+            "File ended with at least one property that didn't "
+            'have an ending "}".',
+            tokenizer.filename,
+            line=None,
+        )
+    return root
+
+
 class Property:
     """Represents Property found in property files, like those used by Valve.
 
@@ -193,192 +725,188 @@ class Property:
 
     @staticmethod
     def parse(
-        file_contents: Union[str, Iterator[str]],
+        file_contents: Union[str, Iterator[str], bytes, memoryview],
         filename='',
         flags: Dict[str, bool]=EmptyMapping,
+        encoding: str='utf8',
     ) -> "Property":
         """Returns a Property tree parsed from given text.
 
         filename, if set should be the source of the text for debug purposes.
         file_contents should be an iterable of strings or a single string.
+        It can also be bytes, a memoryview or mmap, which is decoded with
+        the given encoding as it is parsed.
         flags should be a mapping for additional flags to accept
         (which overrides defaults).
         """
-        # The block we are currently adding to.
-
-        # The special name 'None' marks it as the root property, which
-        # just outputs its children when exported. This way we can handle
-        # multiple root blocks in the file, while still returning a single
-        # Property object which has all the methods.
-        cur_block = Property(None, [])
-
-        # A queue of the properties we are currently in (outside to inside).
-        open_properties = [cur_block]
-
-        # Grab a reference to the token values, so we avoid global lookups.
-        STRING = Token.STRING
-        PROP_FLAG = Token.PROP_FLAG
-        NEWLINE = Token.NEWLINE
-        BRACE_OPEN = Token.BRACE_OPEN
-        BRACE_CLOSE = Token.BRACE_CLOSE
-
-        tokenizer = Tokenizer(
-            file_contents,
-            filename,
-            KeyValError,
-            string_bracket=True,
-        )
+        tokenizer = _make_tokenizer(file_contents, filename, encoding)
+        # The compiled parser can only read from the compiled tokenizer.
+        if _cy_parse_tree is not None and type(tokenizer) is C_Tokenizer:
+            return _cy_parse_tree(tokenizer, Property, flags, _read_flag)
+        return _parse_tree(tokenizer, flags)
 
-        # Do we require a block to be opened next? ("name"\n must have { next.)
-        requires_block = False
-        # Are we permitted to replace the last property with a flagged version of the same?
-        can_flag_replace = False
+    @staticmethod
+    def parse_select(
+        file_contents: Union[str, Iterator[str], bytes, memoryview],
+        select: Callable[[List[str]], bool],
+        filename='',
+        flags: Dict[str, bool]=EmptyMapping,
+        encoding: str='utf8',
+    ) -> "Property":
+        """Parse text, but only keep the blocks which are selected.
 
-        for token_type, token_value in tokenizer:
-            if token_type is BRACE_OPEN:  # {
-                # Open a new block - make sure the last token was a name..
-                if not requires_block:
-                    raise tokenizer.error(
-                        'Property cannot have sub-section if it already '
-                        'has an in-line value.\n\n'
-                        'A "name" "value" line cannot then open a block.',
-                    )
-                requires_block = can_flag_replace = False
-                cur_block = cur_block[-1]
-                cur_block.value = []
-                open_properties.append(cur_block)
-                continue
-            # Something else, but followed by '{'
-            elif requires_block and token_type is not NEWLINE:
-                raise tokenizer.error(
-                    'Block opening ("{{") required!\n\n'
-                    'A single "name" on a line should next have a open brace '
-                    'to begin a block.',
-                )
+        For each block, select() is called with the names of it and all
+        the blocks containing it, outermost first. If it returns True the
+        block is kept whole, otherwise only selected blocks inside it are
+        kept. The selected blocks are all placed in the returned root
+        property, in order. Other keyvalues are discarded.
+        """
+        builder = _SelectBuilder(select)
+        Property.parse_events(file_contents, builder, filename, flags, encoding)
+        return builder.root
 
-            if token_type is NEWLINE:
-                continue
-            if token_type is STRING:   # "string"
-                # We need to check the next token to figure out what kind of
-                # prop it is.
-                prop_type, prop_value = tokenizer()
-
-                # It's a block followed by flag. ("name" [stuff])
-                if prop_type is PROP_FLAG: 
-                    # That must be the end of the line..
-                    tokenizer.expect(NEWLINE)
-                    requires_block = True
-                    if _read_flag(flags, prop_value):
-                        # Special function - if the last prop was a
-                        # keyvalue with this name, replace it instead.
-                        if (
-                            can_flag_replace and
-                            cur_block.value[-1].real_name == token_value and
-                            cur_block.value[-1].has_children()
-                        ):
-                            cur_block.value[-1] = Property(token_value, [])
-                        else:
-                            cur_block.append(Property(token_value, []))
-                        # Can't do twice in a row
-                        can_flag_replace = False
+    @staticmethod
+    def parse_events(
+        file_contents: Union[str, Iterator[str], bytes, memoryview],
+        handler: 'PropertyHandler',
+        filename='',
+        flags: Dict[str, bool]=EmptyMapping,
+        encoding: str='utf8',
+    ) -> None:
+        """Parse text, calling methods on the handler instead of building a tree.
 
-                elif prop_type is STRING:
-                    # A value.. ("name" "value")
-                    if requires_block:
-                        raise tokenizer.error(
-                            'Keyvalue split across lines!\n\n'
-                            'A value like "name" "value" must be on the same '
-                            'line.'
-                        )
-                    requires_block = False
+        This takes the same parameters as parse(). Properties disabled by
+        flags are skipped entirely. See PropertyHandler for the methods.
+        """
+        tokenizer = _make_tokenizer(file_contents, filename, encoding)
+        # The compiled parser can only read from the compiled tokenizer.
+        if _cy_parse_events is not None and type(tokenizer) is C_Tokenizer:
+            _cy_parse_events(tokenizer, handler, flags, _read_flag)
+        else:
+            _parse_events(tokenizer, handler, flags)
 
-                    keyvalue = Property(token_value, prop_value)
+    @staticmethod
+    def parse_binary(
+        data: Union[bytes, bytearray, memoryview, mmap.mmap],
+        filename='',
+        encoding: str='utf8',
+    ) -> "Property":
+        """Returns a Property tree read from binary KeyValues data.
 
-                    # Check for flags.
-                    flag_token, flag_val = tokenizer()
-                    if flag_token is PROP_FLAG:
-                        # Should be the end of the line here.
-                        tokenizer.expect(NEWLINE)
-                        if _read_flag(flags, flag_val):
-                            # Special function - if the last prop was a
-                            # keyvalue with this name, replace it instead.
-                            if (
-                                can_flag_replace and
-                                cur_block.value[-1].real_name == token_value and
-                                not cur_block.value[-1].has_children()
-                            ):
-                                cur_block.value[-1] = keyvalue
-                            else:
-                                cur_block.append(keyvalue)
-                            # Can't do twice in a row
-                            can_flag_replace = False
-                    elif flag_token is STRING:
-                        # Specifically disallow multiple text on the same line.
-                        # ("name" "value" "name2" "value2")
-                        raise tokenizer.error(
-                            "Cannot have multiple names on the same line!"
-                        )
-                    else:
-                        # Otherwise, it's got nothing after.
-                        # So insert the keyvalue, and check the token
-                        # in the next loop. This allows braces to be
-                        # on the same line.
-                        cur_block.append(keyvalue)
-                        can_flag_replace = True
-                        tokenizer.push_back(flag_token, flag_val)
-                    continue
-                else:  # Something else - treat this as a block, and
-                    # then re-evaluate this in the next loop.
-                    requires_block = True
-                    can_flag_replace = False
-                    cur_block.append(Property(token_value, []))
-                    tokenizer.push_back(prop_type, prop_value)
+        This is the format produced by export_binary(), and by Valve's
+        KeyValues::WriteAsBinary(). Integer, float, colour and pointer
+        values are converted to strings.
+        The tree is read directly from the buffer, with no tokenising step.
+        """
+        if isinstance(data, memoryview):
+            # No find() method.
+            data = data.tobytes()
+
+        find = data.find
+        unpack_from = struct.unpack_from
+        new_prop = Property.__new__
+        # Raw name -> real and folded name, to intern them.
+        names = {}  # type: Dict[bytes, Tuple[str, str]]
+
+        root = Property(None, [])
+        stack = [root.value]
+        children = root.value
+        size = len(data)
+        pos = 0
+
+        try:
+            while True:
+                if pos >= size:
+                    if len(stack) == 1:
+                        # The final end marker is optional.
+                        break
+                    raise KeyValError(
+                        'Unexpected end of data, with '
+                        '{} unclosed blocks!'.format(len(stack) - 1),
+                        filename,
+                        None,
+                    )
+                kind = data[pos]
+                pos += 1
+                if kind == _BIN_END or kind == _BIN_END_ALT:
+                    stack.pop()
+                    if not stack:
+                        break
+                    children = stack[-1]
                     continue
 
-            elif token_type is BRACE_CLOSE:  # }
-                # Move back a block
-                open_properties.pop()
+                end = find(b'\x00', pos)
+                if end == -1:
+                    raise KeyValError('Unterminated name!', filename, None)
+                raw_name = data[pos:end]
+                pos = end + 1
                 try:
-                    cur_block = open_properties[-1]
-                except IndexError:
-                    # It's empty, we've closed one too many properties.
-                    raise tokenizer.error(
-                        'Too many closing brackets.\n\n'
-                        'An extra closing bracket was added which would '
-                        'close the outermost level.',
+                    real_name, folded_name = names[raw_name]
+                except KeyError:
+                    real_name = sys.intern(raw_name.decode(encoding))
+                    folded_name = sys.intern(real_name.casefold())
+                    names[raw_name] = real_name, folded_name
+
+                if kind == _BIN_BLOCK:
+                    value = []  # type: _Prop_Value
+                    stack.append(value)
+                elif kind == _BIN_STRING:
+                    end = find(b'\x00', pos)
+                    if end == -1:
+                        raise KeyValError(
+                            'Unterminated value for "{}"!'.format(real_name),
+                            filename,
+                            None,
+                        )
+                    value = data[pos:end].decode(encoding)
+                    pos = end + 1
+                elif kind == _BIN_INT:
+                    [value] = unpack_from('<i', data, pos)
+                    value = str(value)
+                    pos += 4
+                elif kind == _BIN_FLOAT:
+                    [value] = unpack_from('<f', data, pos)
+                    value = str(value)
+                    pos += 4
+                elif kind == _BIN_POINTER:
+                    [value] = unpack_from('<I', data, pos)
+                    value = str(value)
+                    pos += 4
+                elif kind == _BIN_COLOR:
+                    value = '{} {} {} {}'.format(*unpack_from('<4B', data, pos))
+                    pos += 4
+                elif kind == _BIN_UINT64:
+                    [value] = unpack_from('<Q', data, pos)
+                    value = str(value)
+                    pos += 8
+                else:
+                    # Wide strings are not written by Valve either.
+                    raise KeyValError(
+                        'Unknown value type {} for "{}"!'.format(kind, real_name),
+                        filename,
+                        None,
                     )
-                # For replacing the block.
-                can_flag_replace = True
-            else:
-                raise tokenizer.error(token_type)
 
-        # We're out of data, do some final sanity checks.
-        
-        # We last had a ("name"\n), so we were expecting a block
-        # next.
-        if requires_block:
+                prop = new_prop(Property)
+                prop.real_name = real_name
+                prop._folded_name = folded_name
+                prop.value = value
+                children.append(prop)
+                if kind == _BIN_BLOCK:
+                    children = value
+        except struct.error as exc:
             raise KeyValError(
-                'Block opening ("{") required, but hit EOF!\n'
-                'A "name" line was located at the end of the file, which needs'
-                ' a {} block to follow.',
-                tokenizer.filename,
-                line=None,
-            )
-        
-        # All the properties in the file should be closed,
-        # so the only thing in open_properties should be the 
-        # root one we added.
-        
-        if len(open_properties) > 1:
+                'Unexpected end of data, in a value at offset {}!'.format(pos),
+                filename,
+                None,
+            ) from exc
+        except UnicodeDecodeError as exc:
             raise KeyValError(
-                'End of text reached with remaining open sections.\n\n'
-                "File ended with at least one property that didn't "
-                'have an ending "}".',
-                tokenizer.filename,
-                line=None,
-            )
-        # Return that root property.
-        return open_properties[0]
+                'Invalid text at offset {}: {}'.format(pos, exc),
+                filename,
+                None,
+            ) from exc
+        return root
 
     def find_all(self, *keys) -> Iterator['Property']:
         """Search through the tree, yielding all properties that match a particular path.
@@ -417,9 +945,9 @@ class Property:
         - This prefers keys located closer to the end of the value list.
         """
         key = key.casefold()
-        for prop in reversed(self.value):  # type: Property
-            if prop._folded_name == key:
-                return prop
+        prop = self._find(key)
+        if prop is not None:
+            return prop
         if def_ is _NO_KEY_FOUND:
             raise NoKeyError(key)
         else:
@@ -436,14 +964,21 @@ class Property:
         - This prefers keys located closer to the end of the value list.
         """
         key = key.casefold()
-        for prop in reversed(self.value):  # type: Property
-            if prop._folded_name == key:
-                return prop.value
+        prop = self._find(key)
+        if prop is not None:
+            return prop.value
         if def_ is _NO_KEY_FOUND:
             raise NoKeyError(key)
         else:
             return def_
 
+    def _find(self, key: str) -> Optional['Property']:
+        """Return the last child with this casefolded name, or None."""
+        for prop in reversed(self.value):  # type: Property
+            if prop._folded_name == key:
+                return prop
+        return None
+
     def int(self, key: str, def_: T=0) -> Union[builtins.int, T]:
         """Return the value of an integer key.
 
@@ -622,10 +1157,7 @@ class Property:
         """Check to see if a name is present in the children."""
         key = key.casefold()
         if self.has_children():
-            for prop in self.value:
-                if prop._folded_name == key:
-                    return True
-            return False
+            return self._find(key) is not None
 
         raise ValueError("Can't search through properties without children!")
 
@@ -832,6 +1364,121 @@ class Property:
             # We need to escape quotes and backslashes so they don't get detected.
             yield '"{}" "{}"\n'.format(escape_text(self.real_name), escape_text(self.value))
 
+    def export_to(
+        self,
+        file: Union[IO[str], IO[bytes]],
+        indent: builtins.int=0,
+        encoding: str='utf8',
+    ) -> None:
+        """Write the property file to a text or binary file.
+
+        This produces the same text as export(), but the tree is walked
+        iteratively, tracking the indentation level. Lines are joined and
+        written in large chunks. Binary files are written with the
+        given encoding. Indent is the number of tabs to start at.
+        """
+        if isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+            def write(text: str) -> None:
+                file.write(text.encode(encoding))
+        else:
+            write = file.write
+
+        lines = []  # type: List[str]
+        add_line = lines.append
+
+        # Each level is an iterator of the children, their indent, and the
+        # line to write once the children are done.
+        if self._folded_name is None and isinstance(self.value, list):
+            # The root, just output the children.
+            root_children = iter(self.value)  # type: Iterator[Property]
+        else:
+            root_children = iter([self])
+        stack = [
+            (root_children, '\t' * indent, None)
+        ]  # type: List[Tuple[Iterator[Property], str, Optional[str]]]
+
+        while stack:
+            children, tabs, end = stack[-1]
+            for prop in children:
+                value = prop.value
+                if isinstance(value, list):
+                    if prop._folded_name is None:
+                        stack.append((iter(value), tabs, None))
+                    else:
+                        add_line(tabs + '"' + prop.real_name + '"\n' + tabs + '\t{\n')
+                        stack.append((iter(value), tabs + '\t', tabs + '\t}\n'))
+                    break
+                # We need to escape quotes and backslashes so they don't get detected.
+                add_line('{}"{}" "{}"\n'.format(
+                    tabs,
+                    escape_text(prop.real_name),
+                    escape_text(value),
+                ))
+                if len(lines) >= 2048:
+                    write(''.join(lines))
+                    lines.clear()
+            else:
+                stack.pop()
+                if end is not None:
+                    add_line(end)
+        if lines:
+            write(''.join(lines))
+
+    def export_binary(self, file: IO[bytes], encoding: str='utf8') -> None:
+        """Write the property tree to a file in binary KeyValues format.
+
+        This can be read back with parse_binary(). All values are written
+        as strings, so they cannot contain null characters.
+        """
+        if self._folded_name is None and isinstance(self.value, list):
+            # The root, just output the children.
+            root_children = iter(self.value)  # type: Iterator[Property]
+        else:
+            root_children = iter([self])
+        # Each level is an iterator of the children, and the marker to
+        # write once they are done. The outermost marks the end of the data.
+        stack = [(root_children, b'\x08')]  # type: List[Tuple[Iterator[Property], bytes]]
+        # Name -> encoded name with terminator.
+        names = {}  # type: Dict[str, bytes]
+        chunks = []  # type: List[bytes]
+        add = chunks.append
+
+        while stack:
+            children, end = stack[-1]
+            for prop in children:
+                value = prop.value
+                if isinstance(value, list):
+                    if prop._folded_name is None:
+                        stack.append((iter(value), b''))
+                        break
+                    kind = b'\x00'  # _BIN_BLOCK
+                else:
+                    kind = b'\x01'  # _BIN_STRING
+                try:
+                    name = names[prop.real_name]
+                except KeyError:
+                    name = prop.real_name.encode(encoding)
+                    if b'\x00' in name:
+                        raise ValueError('Null in name {!r}!'.format(prop.real_name))
+                    name = names[prop.real_name] = name + b'\x00'
+                add(kind)
+                add(name)
+                if kind == b'\x00':
+                    stack.append((iter(value), b'\x08'))
+                    break
+                value = value.encode(encoding)
+                if b'\x00' in value:
+                    raise ValueError('Null in value of "{}"!'.format(prop.real_name))
+                add(value)
+                add(b'\x00')
+                if len(chunks) >= 8192:
+                    file.write(b''.join(chunks))
+                    chunks.clear()
+            else:
+                stack.pop()
+                add(end)
+        file.write(b''.join(chunks))
+
     def build(self) -> '_Builder':
         """Allows appending a tree to this property in a convenient way.
 
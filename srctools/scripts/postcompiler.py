@@ -69,6 +69,8 @@ def main(argv):
     with bsp_file.packfile() as pak_zip:
         packlist.pack_into_zip(pak_zip)
 
+    fsys.log_stats(LOGGER)
+
     LOGGER.info("srctools VRAD hook finished!")
 
 if __name__ == '__main__':
@@ -262,8 +262,7 @@ class Sound:
                         '\t\t\t' '{\n'
                     )
                     for prop in snd.stack_start:
-                        for line in prop.export():
-                            file.write('\t\t\t' + line)
+                        prop.export_to(file, indent=3)
                     file.write('\t\t\t}\n')
                 if snd.stack_update:
                     file.write(
@@ -271,8 +270,7 @@ class Sound:
                         '\t\t\t' '{\n'
                     )
                     for prop in snd.stack_update:
-                        for line in prop.export():
-                            file.write('\t\t\t' + line)
+                        prop.export_to(file, indent=3)
                     file.write('\t\t\t}\n')
                 if snd.stack_stop:
                     file.write(
@@ -280,8 +278,7 @@ class Sound:
                         '\t\t\t' '{\n'
                     )
                     for prop in snd.stack_stop:
-                        for line in prop.export():
-                            file.write('\t\t\t' + line)
+                        prop.export_to(file, indent=3)
                     file.write('\t\t\t}\n')
                 file.write('\t\t}\n')
             file.write('\t}\n')
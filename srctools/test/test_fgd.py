@@ -0,0 +1,19 @@
+"""Test parsing FGD files."""
+import os
+
+import pytest
+
+from srctools.fgd import FGD
+from srctools.filesys import RawFileSystem
+
+FGD_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'fgd')
+
+
+@pytest.mark.parametrize('filename, count', [
+    ('base.fgd', 324),
+    ('portal2.fgd', 499),
+])
+def test_parse_bundled(filename: str, count: int) -> None:
+    """Test the bundled FGDs parse."""
+    fgd = FGD.parse(filename, RawFileSystem(FGD_FOLDER))
+    assert len(fgd.entities) == count
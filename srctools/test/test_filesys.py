@@ -0,0 +1,411 @@
+"""Test the filesystem implementations."""
+import io
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+from srctools.filesys import (
+    FileCache, PropCache, FileSystemChain, FileSysStats,
+    RawFileSystem, ZipFileSystem, VirtualFileSystem,
+    _StatsReader,
+)
+
+
+@pytest.fixture
+def raw_sys(tmpdir) -> RawFileSystem:
+    """A raw folder with a few files."""
+    tmpdir.join('root.txt').write_binary(b'"Root" "value"\n')
+    tmpdir.mkdir('sub').join('data.bin').write_binary(b'\x00\x01\x02\x03')
+    return RawFileSystem(str(tmpdir))
+
+
+@pytest.fixture
+def zip_sys(tmpdir) -> ZipFileSystem:
+    """A zip with a few files."""
+    path = str(tmpdir.join('files.zip'))
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('zipped/text.txt', b'"Zip" "data"\n')
+        zf.writestr('zipped/Mixed_Case.txt', b'"Case" "mixed"\n')
+    return ZipFileSystem(path)
+
+
+def test_cache_hits(raw_sys: RawFileSystem) -> None:
+    """Repeated reads should be served from the cache."""
+    cache = raw_sys.cache = FileCache()
+    with raw_sys:
+        file = raw_sys['sub/data.bin']
+        with file.open_bin() as f:
+            assert f.read() == b'\x00\x01\x02\x03'
+        assert (cache.hits, cache.misses) == (0, 1)
+        with file.open_bin() as f:
+            assert f.read() == b'\x00\x01\x02\x03'
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert raw_sys.read_prop('root.txt')['root'] == 'value'
+        assert raw_sys.read_prop('root.txt')['root'] == 'value'
+        assert (cache.hits, cache.misses) == (2, 2)
+    assert cache.size == 4 + len(b'"Root" "value"\n')
+
+
+def test_cache_chain_shared(raw_sys: RawFileSystem, zip_sys: ZipFileSystem) -> None:
+    """Files read through a chain share entries with the original system."""
+    cache = FileCache()
+    chain = FileSystemChain(raw_sys, zip_sys)
+    chain.cache = zip_sys.cache = cache
+    with chain:
+        with chain.open_str('zipped/mixed_case.txt') as f:
+            assert f.read() == '"Case" "mixed"\n'
+        with zip_sys['zipped/MIXED_case.txt'].open_str() as f:
+            assert f.read() == '"Case" "mixed"\n'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_eviction(zip_sys: ZipFileSystem) -> None:
+    """The byte budget is respected, discarding the oldest data."""
+    cache = zip_sys.cache = FileCache(max_size=20)
+    with zip_sys:
+        zip_sys['zipped/text.txt'].open_bin().close()
+        zip_sys['zipped/Mixed_Case.txt'].open_bin().close()
+        assert len(cache) == 1
+        assert cache.size == len(b'"Case" "mixed"\n')
+        zip_sys['zipped/text.txt'].open_bin().close()
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+def test_cache_uncachable() -> None:
+    """Files without a cache key are never stored."""
+    vfs = VirtualFileSystem({'some/file.txt': 'text'})
+    cache = vfs.cache = FileCache()
+    with vfs, vfs['some/file.txt'].open_str() as f:
+        assert f.read() == 'text'
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_prop_cache(raw_sys: RawFileSystem, zip_sys: ZipFileSystem, tmpdir) -> None:
+    """Parsed trees are stored on disk, and reused until the file changes."""
+    folder = str(tmpdir.join('prop_cache'))
+    cache = raw_sys.prop_cache = PropCache(folder)
+    assert raw_sys.read_prop('root.txt')['root'] == 'value'
+    assert raw_sys.read_prop('root.txt')['root'] == 'value'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(os.listdir(folder)) == 1
+
+    # A new cache, as if in another process.
+    cache = PropCache(folder)
+    chain = FileSystemChain(raw_sys, zip_sys)
+    chain.prop_cache = cache
+    assert chain.read_prop('root.txt')['root'] == 'value'
+    assert chain.read_prop('zipped/text.txt')['zip'] == 'data'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Modifying the file invalidates it.
+    tmpdir.join('root.txt').write_binary(b'"Root" "changed"\n')
+    stamp = time.time() + 10
+    os.utime(str(tmpdir.join('root.txt')), (stamp, stamp))
+    assert chain.read_prop('root.txt')['root'] == 'changed'
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Corrupt entries are replaced.
+    for name in os.listdir(folder):
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(b'\x00bad')
+    assert chain.read_prop('zipped/text.txt')['zip'] == 'data'
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert chain.read_prop('zipped/text.txt')['zip'] == 'data'
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_prop_cache_prune(zip_sys: ZipFileSystem, tmpdir) -> None:
+    """Old entries are removed when over the size or age limits."""
+    folder = str(tmpdir.join('prop_cache'))
+    cache = zip_sys.prop_cache = PropCache(folder, max_size=20)
+    zip_sys.read_prop('zipped/text.txt')
+    [first] = os.listdir(folder)
+    old = time.time() - 60
+    os.utime(os.path.join(folder, first), (old, old))
+    zip_sys.read_prop('zipped/mixed_case.txt')
+    # Both don't fit, so the older one is removed.
+    assert len(os.listdir(folder)) == 1
+    assert first not in os.listdir(folder)
+    assert cache.size <= 20
+
+    PropCache(folder, max_age=30)
+    assert len(os.listdir(folder)) == 1
+    [entry] = os.listdir(folder)
+    os.utime(os.path.join(folder, entry), (old, old))
+    cache = PropCache(folder, max_age=30)
+    assert os.listdir(folder) == []
+    assert cache.size == 0
+
+
+def test_iter_read(raw_sys: RawFileSystem, zip_sys: ZipFileSystem) -> None:
+    """Reading many files at once produces every result."""
+    chain = FileSystemChain(raw_sys, zip_sys)
+    paths = [
+        'root.txt',
+        'zipped/text.txt',
+        'sub/data.bin',
+        'zipped/MIXED_case.txt',
+        'missing.txt',
+    ]
+    results = dict(chain.iter_read(paths, max_workers=2))
+    assert results.keys() == set(paths)
+    assert results['root.txt'] == b'"Root" "value"\n'
+    assert results['sub/data.bin'] == b'\x00\x01\x02\x03'
+    assert results['zipped/text.txt'] == b'"Zip" "data"\n'
+    assert results['zipped/MIXED_case.txt'] == b'"Case" "mixed"\n'
+    assert isinstance(results['missing.txt'], FileNotFoundError)
+
+    assert chain.read_many(paths) == {
+        path: data
+        for path, data in results.items()
+        if path != 'missing.txt'
+    }
+
+
+def test_async_facade(raw_sys: RawFileSystem, zip_sys: ZipFileSystem) -> None:
+    """Test the asyncio wrapper for filesystems."""
+    import asyncio
+    from srctools.filesys_async import AsyncFileSystem
+
+    chain = FileSystemChain(raw_sys, zip_sys)
+
+    async def main():
+        async with AsyncFileSystem(chain, max_workers=4) as afsys:
+            assert await afsys.exists('zipped/text.txt')
+            assert not await afsys.exists('zipped/missing.txt')
+            datas = await asyncio.gather(
+                afsys.read('root.txt'),
+                afsys.read('zipped/text.txt'),
+                afsys.read('zipped/mixed_case.txt'),
+            )
+            assert datas == [
+                b'"Root" "value"\n',
+                b'"Zip" "data"\n',
+                b'"Case" "mixed"\n',
+            ]
+            with pytest.raises(FileNotFoundError):
+                await afsys.read('missing.txt')
+            prop = await afsys.read_prop('zipped/text.txt')
+            assert prop['zip'] == 'data'
+            prop = await afsys.read_prop(await afsys.get_file('zipped/text.txt'))
+            assert prop['zip'] == 'data'
+            files = [file.path async for file in afsys.walk_folder('zipped', 1)]
+            assert sorted(files) == ['zipped/Mixed_Case.txt', 'zipped/text.txt']
+            # The reference is closed on a worker thread, like other calls.
+            assert close_threads
+            assert threading.get_ident() not in close_threads
+
+    close_threads = set()
+    orig_close_ref = chain.close_ref
+
+    def close_ref() -> None:
+        """Record which thread this is called from."""
+        close_threads.add(threading.get_ident())
+        orig_close_ref()
+    chain.close_ref = close_ref
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def test_chain_miss_cache(raw_sys: RawFileSystem, zip_sys: ZipFileSystem, tmpdir) -> None:
+    """Repeated misses are cached until the chain is closed or modified."""
+    chain = FileSystemChain(raw_sys)
+    with chain:
+        assert 'zipped/text.txt' not in chain
+        assert (chain.cached_misses, chain.uncached_misses) == (0, 1)
+        with pytest.raises(FileNotFoundError):
+            chain['zipped/text.txt']
+        assert 'zipped\\text.txt' not in chain
+        assert (chain.cached_misses, chain.uncached_misses) == (2, 1)
+        # Adding a system must invalidate.
+        chain.add_sys(zip_sys)
+        assert 'zipped/text.txt' in chain
+
+        assert 'new.txt' not in chain
+        assert (chain.cached_misses, chain.uncached_misses) == (2, 2)
+    # Reopening clears the cache, so new files are found.
+    tmpdir.join('new.txt').write_binary(b'')
+    with chain:
+        assert 'new.txt' in chain
+
+
+def test_stats(raw_sys: RawFileSystem, zip_sys: ZipFileSystem) -> None:
+    """Check I/O statistics are recorded for each system."""
+    chain = FileSystemChain(raw_sys, zip_sys)
+    with chain:
+        assert 'sub/data.bin' in chain
+        with chain['zipped/text.txt'].open_bin() as f:
+            assert f.read() == b'"Zip" "data"\n'
+        assert chain.read_prop('root.txt')['root'] == 'value'
+
+    stats = chain.get_stats()
+    raw_stats = stats[repr(raw_sys)]
+    zip_stats = stats[repr(zip_sys)]
+    assert raw_stats['mount']['count'] == 1
+    assert raw_stats['exists']['hits'] == 1
+    assert raw_stats['lookup']['hits'] == 1
+    assert raw_stats['lookup']['misses'] == 1  # zipped/text.txt
+    assert raw_stats['open']['count'] == 1
+    assert raw_stats['open']['bytes'] == len('"Root" "value"\n')
+    assert zip_stats['lookup']['hits'] == 1
+    assert zip_stats['open']['bytes'] == len(b'"Zip" "data"\n')
+    assert zip_stats['open']['time'] >= 0.0
+    assert stats['FileSystemChain']['lookup']['count'] == 2
+
+    chain.reset_stats()
+    assert chain.get_stats()[repr(raw_sys)] == {}
+
+
+def test_stats_read_time() -> None:
+    """Time spent reading an opened file is included in the stats."""
+    class SlowFile(io.BytesIO):
+        """Takes a while to read."""
+        def read(self, size: int=-1) -> bytes:
+            time.sleep(0.05)
+            return super().read(size)
+
+    stats = FileSysStats()
+    with _StatsReader(SlowFile(b'data\nmore\n'), stats) as f:
+        assert f.readline() == b'data\n'
+        assert f.read() == b'more\n'
+        # Only recorded once closed.
+        assert stats.snapshot() == {}
+    op = stats.ops['open']
+    assert op.time >= 0.05
+    assert op.bytes == 10
+
+
+def test_threaded_reads(tmpdir) -> None:
+    """Read random files from raw, zip and VPK systems from many threads."""
+    import random
+    import threading
+    from srctools.vpk import VPK
+    from srctools.filesys import VPKFileSystem
+
+    contents = {}
+    raw_folder = tmpdir.mkdir('raw')
+    for i in range(30):
+        data = contents['raw/file_{}.txt'.format(i)] = b'raw %d ' % i * (i + 1)
+        raw_folder.join('file_{}.txt'.format(i)).write_binary(data)
+
+    zip_path = str(tmpdir.join('files.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(30):
+            data = contents['zip/file_{}.txt'.format(i)] = b'zip %d ' % i * (i + 50)
+            zf.writestr('zip/file_{}.txt'.format(i), data)
+
+    vpk_path = str(tmpdir.join('pak01_dir.vpk'))
+    with VPK(vpk_path, mode='w', dir_data_limit=64) as vpk:
+        for i in range(30):
+            data = contents['vpk/file_{}.txt'.format(i)] = b'vpk %d ' % i * (i + 10)
+            vpk.add_file('vpk/file_{}.txt'.format(i), data, arch_index=i % 3)
+
+    chain = FileSystemChain(
+        RawFileSystem(str(tmpdir)),
+        ZipFileSystem(zip_path),
+        VPKFileSystem(vpk_path),
+    )
+    names = sorted(contents)
+    failures = []
+
+    def worker(seed: int) -> None:
+        rand = random.Random(seed)
+        try:
+            for _ in range(200):
+                # Repeatedly open and close refs, to check these are atomic.
+                with chain:
+                    name = rand.choice(names)
+                    with chain[name].open_bin() as f:
+                        if f.read() != contents[name]:
+                            failures.append(name)
+        except Exception as exc:
+            failures.append(exc)
+
+    # The references are not held open here, so they are repeatedly
+    # created and destroyed by the workers.
+    threads = [
+        threading.Thread(target=worker, args=(i, ))
+        for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert chain._ref_count == 0
+    for sys, prefix in chain.systems:
+        assert sys._ref_count == 0
+        assert sys._ref is None
+
+
+def test_zip_index(tmpdir) -> None:
+    """Check walking zips by prefix, and reusing the index on reopen."""
+    path = str(tmpdir.join('index.zip'))
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('b/two.txt', b'two')
+        zf.writestr('a/One.txt', b'one')
+        zf.writestr('ab/three.txt', b'three', zipfile.ZIP_DEFLATED)
+        zf.writestr('b/', b'')  # A directory entry.
+    fsys = ZipFileSystem(path)
+    with fsys:
+        assert [file.path for file in fsys.walk_folder('A/')] == ['a/One.txt']
+        assert [file.path for file in fsys.walk_folder('a')] == [
+            'a/One.txt', 'ab/three.txt',
+        ]
+        assert [file.path for file in fsys.walk_folder('b')] == ['b/two.txt']
+        # Stored and compressed files both read correctly.
+        with fsys['a/one.txt'].open_bin() as f:
+            assert f.read(2) == b'on'
+            assert f.read() == b'e'
+            f.seek(1)
+            assert f.read() == b'ne'
+        with fsys.open_str('ab/three.txt') as f:
+            assert f.read() == 'three'
+        names = fsys._names
+
+    # Unmodified, so the index is kept.
+    with fsys:
+        assert fsys._names is names
+        with fsys.open_bin('b/two.txt') as f:
+            assert f.read() == b'two'
+
+    with zipfile.ZipFile(path, 'a') as zf:
+        zf.writestr('c/four.txt', b'four')
+    with fsys:
+        assert fsys._names is not names
+        assert [file.path for file in fsys.walk_folder('c')] == ['c/four.txt']
+
+
+def test_zip_mmap(zip_sys: ZipFileSystem) -> None:
+    """Uncompressed files in zips are read from a memory map."""
+    with zip_sys:
+        file = zip_sys.open_bin('zipped/text.txt')
+        other = zip_sys.open_bin('zipped/mixed_case.txt')
+    # These stay readable after the filesystem closes.
+    assert file.read(5) == b'"Zip"'
+    buffer = bytearray(4)
+    assert file.readinto(buffer) == 4
+    assert buffer == b' "da'
+    assert file.readinto(buffer) == 4
+    assert file.readinto(buffer) == 0
+    assert file.getbuffer() == b'"Zip" "data"\n'
+    file.seek(-6, os.SEEK_END)
+    assert file.read() == b'data"\n'
+    file.close()
+    with pytest.raises(ValueError):
+        file.read()
+    assert other.read() == b'"Case" "mixed"\n'
+    other.close()
+
+    with zip_sys:
+        with zip_sys.open_bin('zipped/text.txt') as f:
+            assert f.read() == b'"Zip" "data"\n'
@@ -0,0 +1,65 @@
+"""Test parsing gameinfo and caching the mounts."""
+import os
+import zipfile
+
+from srctools.game import Game, MountCache
+from srctools.vpk import VPK
+
+
+GAMEINFO = '''\
+"GameInfo"
+    {
+    game "Test Game"
+    GameData "test.fgd"
+    FileSystem
+        {
+        SteamAppId 620
+        SearchPaths
+            {
+            Game |gameinfo_path|.
+            Game "base/pak01_dir.vpk"
+            }
+        }
+    }
+'''
+
+
+def test_mount_cache(tmpdir) -> None:
+    """Check games and filesystems are cached, until the files change."""
+    game_dir = tmpdir.mkdir('game')
+    game_dir.join('gameinfo.txt').write(GAMEINFO)
+    game_dir.join('loose.txt').write('loose')
+    tmpdir.mkdir('base')
+    with VPK(str(tmpdir.join('base', 'pak01_dir.vpk')), mode='w') as vpk:
+        vpk.add_file('packed.txt', b'packed')
+
+    cache_file = str(tmpdir.mkdir('cache').join('mounts.cache'))
+    with MountCache(cache_file) as cache:
+        game = Game(str(game_dir), cache)
+        assert game.game_name == 'Test Game'
+        with game.get_filesystem() as fsys:
+            assert fsys['packed.txt'].open_bin().read() == b'packed'
+            assert fsys['loose.txt'].open_bin().read() == b'loose'
+        # Only written once done.
+        assert not os.path.exists(cache_file)
+    assert zipfile.is_zipfile(cache_file)
+
+    # A different process loads from the file.
+    cache = MountCache(cache_file)
+    assert len(cache) == 1
+    entry = cache._lookup(game.path)
+    assert entry is not None
+    assert [kind for kind, path, vpk_dir in entry['mounts']] == ['vpk', 'raw']
+    # Just the VPK directory is stored, not an object.
+    assert entry['mounts'][0][2].startswith(b'\x34\x12\xaa\x55')
+    game = Game(str(game_dir), cache)
+    assert game.app_id == '620'
+    with game.get_filesystem() as fsys:
+        assert fsys['packed.txt'].open_bin().read() == b'packed'
+
+    # Modifying gameinfo discards the entry.
+    game_dir.join('gameinfo.txt').write(GAMEINFO.replace('Test Game', 'Changed'))
+    stat = os.stat(str(game_dir.join('gameinfo.txt')))
+    os.utime(str(game_dir.join('gameinfo.txt')), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache._lookup(game.path) is None
+    assert Game(str(game_dir), cache).game_name == 'Changed'
@@ -1,5 +1,9 @@
+import io
 import pytest
-from srctools.property_parser import Property, KeyValError, NoKeyError
+from srctools.property_parser import (
+    Property, PropertyHandler,
+    KeyValError, NoKeyError,
+)
 from srctools.tokenizer import C_Tokenizer, Py_Tokenizer
 from srctools import property_parser as pp_mod
 
@@ -223,6 +227,20 @@ def test_parse(py_c_token):
     )
     assert_tree(result, parse_result)
 
+    # Binary data is decoded, with a byte order mark and any newlines.
+    for data in [
+        parse_test.replace('\n', '\r\n').encode('utf8'),
+        memoryview(b'\xef\xbb\xbf' + parse_test.replace('\n', '\r').encode('utf8')),
+    ]:
+        result = Property.parse(
+            data,
+            flags={
+                'test_enabled': True,
+                'test_disabled': False,
+            },
+        )
+        assert_tree(result, parse_result)
+
     # Check export roundtrips.
     assert_tree(Property.parse(parse_result.export()), parse_result)
     
@@ -269,6 +287,96 @@ def test_build():
     assert_tree(parse_result, prop)
     
 
+def test_parse_events(py_c_token):
+    """Test the event-based parser."""
+    events = []
+
+    class Handler(PropertyHandler):
+        def key_value(self, name, value, replace):
+            events.append(('kv', name, value, replace))
+
+        def start_block(self, name, replace):
+            events.append(('start', name, replace))
+
+        def end_block(self):
+            events.append(('end', ))
+
+    Property.parse_events('''\
+"Block"
+    {
+    "key" "value"
+    "key" "other" [test_enabled]
+    "Disabled" [test_disabled]
+        {
+        "inner" "skipped"
+        "Nested" { "a" "b" }
+        }
+    }
+"Block" [test_enabled]
+    {
+    }
+''', Handler(), flags={'test_enabled': True, 'test_disabled': False})
+    assert events == [
+        ('start', 'Block', False),
+        ('kv', 'key', 'value', False),
+        ('kv', 'key', 'other', True),
+        ('end', ),
+        ('start', 'Block', True),
+        ('end', ),
+    ]
+
+
+def test_parse_disabled_replace(py_c_token):
+    """Disabled flagged properties don't stop the next one replacing."""
+    result = Property.parse('''\
+"a" "1"
+"a" "2" [x360]
+"a" "3" [!x360]
+"b"
+    {
+    "c" "1"
+    }
+"b" [x360]
+    {
+    "c" "2"
+    }
+"b" [!x360]
+    {
+    "c" "3"
+    }
+''', flags={'x360': False})
+    assert_tree(result, Property(None, [
+        Property('a', '3'),
+        Property('b', [Property('c', '3')]),
+    ]))
+
+
+def test_parse_select(py_c_token):
+    """Test only building the selected blocks."""
+    result = Property.parse_select(
+        parse_test,
+        lambda path: path[-1] in ('Oneliner', 'Block'),
+    )
+    assert_tree(result, Property(None, [
+        Property('Block', [
+            Property('Empty', []),
+        ]),
+        Property('Block', [
+            Property('bare', [
+                Property('block', 'he\tre'),
+            ]),
+        ]),
+        Property('Oneliner', [
+            Property('name', 'value'),
+        ]),
+    ]))
+    # Paths include the parent blocks.
+    paths = []
+    Property.parse_select(parse_test, lambda path: paths.append(path.copy()))
+    assert ['Root1', 'Block', 'Empty'] in paths
+    assert ['Root2', 'Oneliner'] in paths
+
+
 def test_parse_fails(py_c_token):
     """Test various forms of invalid syntax to ensure they indeed fail."""
     def t(text):
@@ -432,6 +540,123 @@ text with
     ''')
 
 
+def test_child_index():
+    """Test lookups in large blocks stay correct when modified."""
+    block = Property('Block', [
+        Property('key{}'.format(i % 20), str(i))
+        for i in range(40)
+    ])
+    # The last is found.
+    assert block['KEY3'] == '23'
+    assert 'key19' in block
+    assert 'key20' not in block
+
+    block['key3'] = 'new'
+    assert block['key3'] == 'new'
+    block.append(Property('Key3', 'appended'))
+    assert block['key3'] == 'appended'
+    del block['key3']
+    assert block['key3'] == 'new'
+    block += [Property('key20', 'extended')]
+    assert block['key20'] == 'extended'
+    block.value.append(Property('key21', 'direct'))
+    assert block['key21'] == 'direct'
+    block.find_key('key5').name = 'renamed'
+    assert block['key5'] == '5'
+    assert block['renamed'] == '25'
+
+    # Renaming or replacing children directly is seen immediately.
+    block.find_key('key6').name = 'renamed_again'
+    assert 'renamed_again' in block
+    assert block.find_key('renamed_again').value == '26'
+    block.find_key('key7').edit(name='key1')
+    assert block['key1'] == '27'
+    block.value[30] = Property('newkey', 'replaced')
+    assert 'newkey' in block
+    assert block.find_key('newkey').value == 'replaced'
+    assert block['key10'] == '10'
+    block.clear()
+    assert 'key3' not in block
+
+    # Replacing a later child with an earlier name, keeping the length.
+    block = Property('Block', [
+        Property('key{}'.format(i), str(i))
+        for i in range(51)
+    ])
+    block.value[40] = Property('a', 'first')
+    assert block['a'] == 'first'
+    block.value[45] = Property('a', 'second')
+    assert block['a'] == 'second'
+
+
+def test_export_to():
+    """Test the writer produces the same text as export()."""
+    text = ''.join(parse_result.export())
+    file = io.StringIO()
+    parse_result.export_to(file)
+    assert file.getvalue() == text
+
+    file = io.BytesIO()
+    parse_result.export_to(file)
+    assert file.getvalue() == text.encode('utf8')
+
+    block = parse_result.find_key('Root2')
+    file = io.StringIO()
+    block.export_to(file, indent=2)
+    assert file.getvalue() == ''.join('\t\t' + line for line in block.export())
+
+
+def test_binary():
+    """Test reading and writing binary KeyValues."""
+    file = io.BytesIO()
+    parse_result.export_binary(file)
+    assert_tree(parse_result, Property.parse_binary(file.getvalue()))
+    assert_tree(parse_result, Property.parse_binary(file.getbuffer()))
+
+    file = io.BytesIO()
+    Property('Block', [Property('Key', 'Value')]).export_binary(file)
+    assert file.getvalue() == b'\x00Block\x00\x01Key\x00Value\x00\x08\x08'
+
+    # Other value types are converted to strings, and the final end is optional.
+    assert_tree(Property.parse_binary(
+        b'\x00Root\x00'
+        b'\x02int\x00\xfe\xff\xff\xff'
+        b'\x03float\x00\x00\x00\xc0\x3f'
+        b'\x06color\x00\x01\x02\x03\x04'
+        b'\x07uint64\x00\x00\x00\x00\x00\x01\x00\x00\x00'
+        b'\x0b'
+    ), Property(None, [
+        Property('Root', [
+            Property('int', '-2'),
+            Property('float', '1.5'),
+            Property('color', '1 2 3 4'),
+            Property('uint64', str(2**32)),
+        ]),
+    ]))
+
+    for bad in [
+        b'\x00Root\x00', b'\x01Key', b'\x01Key\x00Value', b'\x05Key\x00',
+        # Truncated numbers, and invalid UTF-8.
+        b'\x02int\x00\x01', b'\x07uint64\x00\x01\x02\x03\x04',
+        b'\x01k\x00\xff\xfe\x00', b'\x01\xff\x00value\x00',
+    ]:
+        with pytest.raises(KeyValError):
+            Property.parse_binary(bad)
+
+    # Any truncated file either parses or raises KeyValError.
+    file = io.BytesIO()
+    parse_result.export_binary(file)
+    data = file.getvalue()
+    for i in range(len(data)):
+        try:
+            Property.parse_binary(data[:i])
+        except KeyValError:
+            pass
+
+    with pytest.raises(ValueError):
+        Property('Key', 'Null\0').export_binary(io.BytesIO())
+
+
 def test_edit():
     """Check functionality of Property.edit()"""
     test_prop = Property('Name', 'Value')
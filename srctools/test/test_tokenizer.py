@@ -6,7 +6,7 @@ from srctools.test.test_property_parser import parse_test as prop_parse_test
 from srctools.property_parser import KeyValError
 from srctools.tokenizer import (
     Token,
-    Tokenizer,
+    Tokenizer, BytesTokenizer,
     C_Tokenizer, Py_Tokenizer,
     escape_text, _py_escape_text,
     TokenSyntaxError,
@@ -185,6 +185,39 @@ def test_pushback(py_c_token):
 
 
 
+def test_bytes_tokens():
+    """Test tokenising binary data directly."""
+    data = prop_parse_test.encode('utf8')
+    check_tokens(BytesTokenizer(data, string_bracket=True), prop_parse_tokens)
+    check_tokens(
+        BytesTokenizer(memoryview(data), string_bracket=True),
+        prop_parse_tokens,
+    )
+    # Newlines are translated like universal newlines mode.
+    tok = BytesTokenizer(data.replace(b'\n', b'\r\n'), string_bracket=True)
+    check_tokens(tok, prop_parse_tokens)
+    assert tok.line_num == prop_parse_test.count('\n') + 1
+
+    tok = BytesTokenizer(codecs.BOM_UTF8 + '"\u00e9" "\r\nb"\r'.encode('utf8'))
+    check_tokens(tok, [
+        (T.STRING, '\u00e9'), (T.STRING, '\nb'), T.NEWLINE,
+    ])
+    tok = BytesTokenizer('"\u00e9"'.encode('cp1252'), encoding='cp1252')
+    check_tokens(tok, [(T.STRING, '\u00e9')])
+
+    with pytest.raises(ValueError):
+        BytesTokenizer(b'', encoding='utf16')
+
+
+def test_bytes_operators():
+    """Test BytesTokenizer produces operators the same as Tokenizer."""
+    text = 'a=b = c=d\n=+e f+ +g :h [i] {j}\n@Point base(x) = name : "desc" +\n'
+    tokens = list(Py_Tokenizer(text))
+    assert (T.EQUALS, '=') in tokens
+    assert (T.PLUS, '+') in tokens
+    check_tokens(BytesTokenizer(text.encode('ascii')), tokens)
+
+
 def test_bom(py_c_token):
     """Test skipping a UTF8 BOM at the beginning."""
     Tokenizer = py_c_token
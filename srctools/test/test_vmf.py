@@ -0,0 +1,666 @@
+"""Test the VMF library."""
+import io
+import pickle
+from typing import List, Tuple
+
+import pytest
+
+from srctools.property_parser import Property
+from srctools.vec import Vec
+from srctools.vmf import (
+    VMF, Entity, EntityKeys, EntityList, IDMan, Output, _ExportBuffer,
+)
+
+
+def test_entity_keys() -> None:
+    """Keyvalues are case-insensitive, but keep the first casing used."""
+    vmf = VMF()
+    ent = vmf.create_ent('info_target', targetname='Target', Origin='1 2 3')
+    assert isinstance(ent.keys, EntityKeys)
+    assert ent['ORIGIN'] == ent['origin'] == '1 2 3'
+    assert 'oRiGiN' in ent
+    assert 'angles' not in ent
+    assert ent['angles'] == ''
+    assert ent['angles', '0 0 0'] == '0 0 0'
+    assert ent.get('angles', None) is None
+
+    ent['ORIGIN'] = '4 5 6'
+    ent['angles'] = '0 90 0'
+    ent['spawnflags'] = True
+    assert list(ent.keys.items()) == [
+        ('targetname', 'Target'),
+        ('Origin', '4 5 6'),
+        ('classname', 'info_target'),
+        ('angles', '0 90 0'),
+        ('spawnflags', '1'),
+    ]
+    assert list(ent.keys) == [
+        'targetname', 'Origin', 'classname', 'angles', 'spawnflags',
+    ]
+    assert list(ent.keys.values()) == [
+        'Target', '4 5 6', 'info_target', '0 90 0', '1',
+    ]
+
+    del ent['ANGLES']
+    del ent['missing']
+    assert 'angles' not in ent
+    assert len(ent.keys) == 4
+
+    # Re-adding uses the new casing.
+    ent['Angles'] = '0 0 0'
+    assert list(ent.keys)[-1] == 'Angles'
+
+
+def test_entity_keys_lookups() -> None:
+    """Changing names and classes updates the lookups in the VMF."""
+    vmf = VMF()
+    ent = vmf.create_ent('info_target', targetname='first')
+    assert vmf.by_target['first'] == {ent}
+
+    ent['TargetName'] = 'second'
+    assert not vmf.by_target['first']
+    assert vmf.by_target['second'] == {ent}
+    assert list(ent.keys) == ['targetname', 'classname']
+
+    ent['ClassName'] = 'info_null'
+    assert vmf.by_class['info_null'] == {ent}
+    assert not vmf.by_class['info_target']
+
+    del ent['TARGETNAME']
+    assert not vmf.by_target['second']
+    assert 'targetname' not in ent
+
+
+def test_entity_copy() -> None:
+    """Copied entities don't share keyvalues."""
+    vmf = VMF()
+    ent = vmf.create_ent('info_target', Origin='1 2 3')
+    copy = ent.copy()
+    copy['origin'] = '0 0 0'
+    assert ent['origin'] == '1 2 3'
+    assert list(copy.keys.items()) == [
+        ('Origin', '0 0 0'),
+        ('classname', 'info_target'),
+    ]
+
+
+def test_parse_text() -> None:
+    """Parsing directly from text matches parsing the tree."""
+    vmf = VMF()
+    vmf.add_brush(vmf.make_prism(Vec(0, 0, 0), Vec(64, 64, 64)).solid)
+    hidden_brush = vmf.make_prism(Vec(0, 0, 128), Vec(64, 64, 192)).solid
+    hidden_brush.hidden = True
+    vmf.add_brush(hidden_brush)
+    vmf.create_visgroup('Group', (255, 0, 0))
+
+    vmf.create_ent('info_target', targetname='target', origin='0 0 64')
+    brush_ent = vmf.create_ent('func_detail')
+    brush_ent.solids.append(vmf.make_prism(Vec(64, 0, 0), Vec(128, 64, 64)).solid)
+    hidden_ent = vmf.create_ent('func_brush', targetname='hidden')
+    hidden_ent.hidden = True
+    hidden_ent.solids.append(vmf.make_prism(Vec(128, 0, 0), Vec(192, 64, 64)).solid)
+    text = vmf.export()
+
+    from_tree = VMF.parse(Property.parse(text))
+    from_text = VMF.parse_text(text)
+    expected = from_tree.export(inc_version=False)
+    assert from_text.export(inc_version=False) == expected
+    from_bytes = VMF.parse_text(text.encode('utf8'))
+    assert from_bytes.export(inc_version=False) == expected
+
+    assert len(from_text.brushes) == 2
+    assert from_text.brushes[1].hidden
+    assert from_text.spawn.id == vmf.spawn.id
+    [hidden] = from_text.by_target['hidden']
+    assert hidden.hidden
+    assert len(hidden.solids) == 1
+    assert [vis.name for vis in from_text.vis_tree] == ['Group']
+
+
+def make_test_map() -> str:
+    """Produce a map with a few brushes and entities."""
+    vmf = VMF()
+    vmf.add_brush(vmf.make_prism(Vec(0, 0, 0), Vec(64, 64, 64)).solid)
+    hidden_brush = vmf.make_prism(Vec(0, 0, 128), Vec(64, 64, 192)).solid
+    hidden_brush.hidden = True
+    vmf.add_brush(hidden_brush)
+
+    vmf.create_ent('info_target', targetname='target', origin='0 0 64')
+    brush_ent = vmf.create_ent('func_detail')
+    brush_ent.solids.append(vmf.make_prism(Vec(64, 0, 0), Vec(128, 64, 64)).solid)
+    hidden_ent = vmf.create_ent('func_brush', targetname='hidden')
+    hidden_ent.hidden = True
+    hidden_ent.solids.append(vmf.make_prism(Vec(128, 0, 0), Vec(192, 64, 64)).solid)
+    # Round-trip once, so values are in the form parsing produces.
+    return VMF.parse_text(vmf.export()).export()
+
+
+def test_parse_lazy_solids() -> None:
+    """Brushes can be parsed only when accessed."""
+    text = make_test_map()
+    expected = VMF.parse_text(text).export(inc_version=False)
+
+    vmf = VMF.parse_text(text, lazy_solids=True)
+    # Unparsed brushes are written back unchanged.
+    assert vmf.export(inc_version=False) == expected
+    [detail] = vmf.by_class['func_detail']
+    assert detail.is_brush()
+    assert detail._raw_solids
+
+    assert len(vmf.brushes) == 2
+    assert vmf.brushes[1].hidden
+    assert len(detail.solids) == 1
+    assert not detail._raw_solids
+    assert vmf.export(inc_version=False) == expected
+
+    # Also works on trees.
+    vmf = VMF.parse(Property.parse(text), lazy_solids=True)
+    assert vmf.export(inc_version=False) == expected
+
+
+def test_parse_filename(tmp_path) -> None:
+    """Filenames passed to VMF.parse() are parsed into a tree first."""
+    text = make_test_map()
+    path = tmp_path / 'test.vmf'
+    path.write_text(text)
+    expected = VMF.parse(Property.parse(text)).export(inc_version=False)
+    assert VMF.parse(str(path)).export(inc_version=False) == expected
+    vmf = VMF.parse(str(path), lazy_solids=True)
+    assert vmf.export(inc_version=False) == expected
+
+
+def test_parse_filter_ents() -> None:
+    """Entities can be skipped, but are still exported."""
+    text = make_test_map()
+    vmf = VMF.parse_text(text, classnames={'func_detail', 'func_brush'})
+    assert {ent['classname'] for ent in vmf.entities} == {'func_detail', 'func_brush'}
+    assert [prop.name for prop in vmf.skipped_ents] == ['entity']
+
+    vmf = VMF.parse_text(text, ent_filter=lambda ent: ent['targetname'] == 'target')
+    assert [ent['classname'] for ent in vmf.entities] == ['info_target']
+    assert [prop.name for prop in vmf.skipped_ents] == ['entity', 'hidden']
+
+    # Skipped entities are kept, though moved to the end.
+    reparsed = VMF.parse_text(vmf.export())
+    assert sorted(ent['classname'] for ent in reparsed.entities) == [
+        'func_brush', 'func_detail', 'info_target',
+    ]
+    [hidden] = reparsed.by_class['func_brush']
+    assert hidden.hidden
+    assert len(hidden.solids) == 1
+    assert len(reparsed.brushes) == 2
+
+
+def collect_ids(text: str) -> Tuple[List[str], List[str], List[str]]:
+    """Collect the entity, brush and side IDs in an exported map."""
+    ent_ids = []  # type: List[str]
+    solid_ids = []  # type: List[str]
+    side_ids = []  # type: List[str]
+    for block in Property.parse(text):
+        for ent in (block if block.name == 'hidden' else [block]):
+            if ent.name not in ('world', 'entity'):
+                continue
+            ent_ids.append(ent['id'])
+            for child in ent:
+                for solid in (child if child.name == 'hidden' else [child]):
+                    if solid.name == 'solid' and solid.has_children():
+                        solid_ids.append(solid['id'])
+                        side_ids.extend(side['id'] for side in solid.find_all('side'))
+    return ent_ids, solid_ids, side_ids
+
+
+def test_parse_filter_ids() -> None:
+    """Adding objects after a filtered or lazy parse doesn't reuse IDs."""
+    text = make_test_map()
+    orig_ids = collect_ids(text)
+    for kwargs in [
+        {'classnames': {'func_door'}},
+        {'ent_filter': lambda ent: ent['targetname'] == 'target'},
+        {'lazy_solids': True},
+        {'lazy_solids': True, 'classnames': {'func_detail'}},
+    ]:
+        vmf = VMF.parse_text(text, **kwargs)
+        for i in range(3):
+            ent = vmf.create_ent('func_brush')
+            ent.solids.append(vmf.make_prism(Vec(i, 0, 0), Vec(i + 64, 64, 64)).solid)
+            vmf.add_brush(vmf.make_prism(Vec(0, i, 0), Vec(64, i + 64, 64)).solid)
+        for ids in collect_ids(vmf.export()):
+            assert len(ids) == len(set(ids)), sorted(ids)
+
+        # Parsing the brushes afterward keeps their original IDs.
+        for ent in list(vmf.entities) + [vmf.spawn]:
+            assert ent.solids is not None
+        for orig, ids in zip(orig_ids, collect_ids(vmf.export())):
+            assert len(ids) == len(set(ids)), sorted(ids)
+            assert set(orig) <= set(ids)
+
+
+def test_disp_lazy() -> None:
+    """Displacement rows are only decoded when accessed."""
+    vmf = VMF()
+    vmf.add_brush(vmf.make_prism(Vec(0, 0, 0), Vec(64, 64, 16)).solid)
+    text = VMF.parse_text(vmf.export()).export().replace(
+        '"smoothing_groups" "0"\n\t\t}',
+        # Rows are deliberately out of order.
+        '"smoothing_groups" "0"\n\t\tdispinfo\n\t\t{\n'
+        '\t\t\t"power" "2"\n'
+        '\t\t\t"startposition" "[0 0 16]"\n'
+        '\t\t\t"flags" "0"\n'
+        '\t\t\t"elevation" "0"\n'
+        '\t\t\t"subdiv" "0"\n'
+        '\t\t\tdistances\n\t\t\t{\n'
+        '\t\t\t\t"row1" "1 1 1 1 1"\n'
+        '\t\t\t\t"row0" "0 0 0 0 0"\n'
+        '\t\t\t}\n'
+        '\t\t}\n\t\t}',
+        1,
+    )
+
+    vmf = VMF.parse_text(text)
+    [side] = [side for side in vmf.brushes[0].sides if side.is_disp]
+    assert side._disp_raw is not None
+    # Written back unchanged.
+    assert vmf.export(inc_version=False) == VMF.parse(
+        Property.parse(text),
+    ).export(inc_version=False)
+    exported = vmf.export()
+    assert exported.index('"row1" "1 1 1 1 1"') < exported.index('"row0" "0 0 0 0 0"')
+
+    copy = side.copy()
+    assert copy._disp_raw is side._disp_raw
+    assert copy.disp_data['distances'] == ['0 0 0 0 0', '1 1 1 1 1']
+    assert copy.disp_data['normals'] == []
+    assert copy._disp_raw is None
+    # The original is unaffected.
+    assert side._disp_raw is not None
+    assert side.disp_power == 2
+    assert side.disp_data['distances'] == ['0 0 0 0 0', '1 1 1 1 1']
+    exported = vmf.export()
+    assert exported.index('"row0" "0 0 0 0 0"') < exported.index('"row1" "1 1 1 1 1"')
+
+
+def test_disp_raw_export() -> None:
+    """Untouched displacements are exported byte-for-byte."""
+    vmf = VMF()
+    vmf.add_brush(vmf.make_prism(Vec(0, 0, 0), Vec(64, 64, 16)).solid)
+    disp_text = (
+        '\t\t\tdispinfo\n\t\t\t{\n'
+        '\t\t\t\t"power" "2"\n'
+        '\t\t\t\t"startposition" "[0 0 16]"\n'
+        '\t\t\t\t"flags" "0"\n'
+        '\t\t\t\t"elevation" "0.0"\n'
+        '\t\t\t\t"subdiv" "0"\n'
+        '\t\t\t\tnormals\n\t\t\t\t{\n'
+        '\t\t\t\t\t"row0" "0 0 1 0 0 1 0 0 1"\n'
+        '\t\t\t\t\t"row1" "0 0 1 0 0 1 0 0 1"\n'
+        '\t\t\t\t}\n'
+        '\t\t\t\tdistances\n\t\t\t\t{\n'
+        '\t\t\t\t\t"row2" "2.5 2 2"\n'
+        '\t\t\t\t\t"row0" "0 0 0"\n'
+        '\t\t\t\t\t"Row1" "1 1 1"\n'
+        '\t\t\t\t}\n'
+        '\t\t\t\talphas\n\t\t\t\t{\n'
+        '\t\t\t\t\t"row0" "255 0 128"\n'
+        '\t\t\t\t}\n'
+        '\t\t\t}\n'
+    )
+    text = vmf.export().replace(
+        '"smoothing_groups" "0"\n\t\t}',
+        '"smoothing_groups" "0"\n' + disp_text + '\t\t}',
+        1,
+    )
+    for parsed in [VMF.parse_text(text), VMF.parse(Property.parse(text))]:
+        [side] = [side for side in parsed.brushes[0].sides if side.is_disp]
+        assert side._disp_raw is not None
+        assert disp_text in parsed.export()
+        assert side.disp_data['distances'] == ['0 0 0', '1 1 1', '2.5 2 2']
+        assert side.disp_data['alphas'] == ['255 0 128']
+        assert side.disp_data['offsets'] == []
+
+
+def test_export_files(monkeypatch) -> None:
+    """Exporting to text and binary files produces the same text."""
+    vmf = VMF.parse_text(make_test_map())
+    expected = vmf.export(inc_version=False)
+    # Write out in many small chunks.
+    monkeypatch.setattr(_ExportBuffer, 'CHUNK_SIZE', 64)
+
+    text_file = io.StringIO()
+    vmf.export(text_file, inc_version=False)
+    assert text_file.getvalue() == expected
+
+    bin_file = io.BytesIO()
+    vmf.export(bin_file, inc_version=False)
+    assert bin_file.getvalue() == expected.encode('utf8')
+
+
+def test_export_keep_text() -> None:
+    """Unmodified brushes and entities can reuse their original text."""
+    text = make_test_map().replace('"rotation" "0.0"', '"rotation" "0.00"')
+    vmf = VMF.parse_text(text, keep_text=True)
+    exported = vmf.export(inc_version=False)
+    # Not re-serialised.
+    assert '"rotation" "0.00"' in exported
+    assert '"rotation" "0.0"\n' not in exported
+    assert VMF.parse_text(exported).export() == VMF.parse_text(text).export()
+
+    # Now modify a few things.
+    expected = VMF.parse_text(text)
+    for map_obj in [vmf, expected]:
+        map_obj.brushes[0].translate(Vec(0, 0, 64))
+        map_obj.brushes[1].sides[2].mat = 'tools/toolsskip'
+        [target] = map_obj.by_class['info_target']
+        target['targetname'] = 'renamed'
+        [brush_ent] = map_obj.by_class['func_brush']
+        brush_ent.outputs.append(Output('OnUser1', '!self', 'Kill'))
+
+    exported = vmf.export(inc_version=False)
+    # The modified brush and sides are re-serialised.
+    assert exported.count('"rotation" "0.0"\n') == 12
+    assert VMF.parse_text(exported).export() == VMF.parse_text(
+        expected.export(inc_version=False),
+    ).export()
+
+
+def test_entity_list() -> None:
+    """The entity list acts like a list, but can be modified while iterating."""
+    vmf = VMF()
+    ents = [vmf.create_ent('info_target', targetname=str(i)) for i in range(40)]
+    assert isinstance(vmf.entities, EntityList)
+    assert vmf.entities == ents
+    assert len(vmf.entities) == 40
+    assert vmf.entities[5] is ents[5]
+    assert vmf.entities[-1] is ents[-1]
+    assert vmf.entities[::10] == ents[::10]
+
+    seen = []
+    for ent in vmf.entities:
+        seen.append(ent)
+        if ent is ents[0]:
+            # Removed before being reached, so skipped.
+            ents[1].remove()
+            ents[2].remove()
+            # Added, so included.
+            vmf.create_ent('info_null', targetname='new')
+    assert seen == [ents[0]] + ents[3:] + [vmf.entities[-1]]
+    assert vmf.entities[-1]['targetname'] == 'new'
+    assert ents[1] not in vmf.entities
+    assert vmf.entities.index(ents[3]) == 1
+
+    # iter_ents() skips new entities, so this doesn't loop forever.
+    for ent in vmf.iter_ents(classname='info_target'):
+        vmf.create_ent('info_target')
+        ent.remove()
+    assert len(vmf.entities) == 39
+    assert all(ent['targetname'] in ('', 'new') for ent in vmf.entities)
+
+    # Remove enough that the placeholders are discarded.
+    for ent in list(vmf.entities)[::2]:
+        ent.remove()
+    assert len(vmf.entities) == 19
+    assert len(vmf.entities._ents) <= 2 * 19 + 8
+    with pytest.raises(ValueError):
+        vmf.entities.append(vmf.entities[0])
+    with pytest.raises(ValueError):
+        vmf.entities.remove(ents[0])
+    # Nothing is added if one is a duplicate.
+    count = len(vmf.entities)
+    new_ent = Entity(vmf)
+    with pytest.raises(ValueError):
+        vmf.add_ents([new_ent, vmf.entities[1]])
+    assert len(vmf.entities) == count
+    assert new_ent not in vmf.entities
+    assert new_ent not in vmf.by_class[None]
+    vmf.add_ent(new_ent)
+    with pytest.raises(ValueError):
+        vmf.entities.extend([ents[0], ents[0]])
+    assert ents[0] not in vmf.entities
+    assert len(vmf.entities) == count + 1
+
+    vmf.entities = ents[:3]
+    assert isinstance(vmf.entities, EntityList)
+    del vmf.entities[1]
+    vmf.entities.insert(0, ents[1])
+    assert list(vmf.entities) == [ents[1], ents[0], ents[2]]
+
+    # Indexing discards placeholders, instead of rebuilding each time.
+    vmf.entities = ents[:20]
+    vmf.entities.remove(ents[5])
+    assert vmf.entities[5] is ents[6]
+    assert len(vmf.entities._ents) == 19
+    vmf.entities[0] = ents[30]
+    assert vmf.entities.index(ents[30]) == 0
+    assert ents[0] not in vmf.entities
+
+    # Changes during iteration either keep the order, or raise.
+    seen = []
+    for ent in vmf.entities:
+        seen.append(ent)
+        if ent is ents[30]:
+            del vmf.entities[1]  # ents[1]
+            assert vmf.entities[1] is ents[2]
+            vmf.entities[2] = ents[31]  # ents[3]
+            with pytest.raises(RuntimeError):
+                vmf.entities.insert(0, ents[32])
+            with pytest.raises(RuntimeError):
+                vmf.entities.sort(key=lambda ent: ent['targetname'])
+            with pytest.raises(RuntimeError):
+                del vmf.entities[:2]
+    assert seen == [ents[30], ents[2], ents[31]] + ents[4:5] + ents[6:20]
+    assert list(vmf.entities) == seen
+    vmf.entities.insert(0, ents[32])
+    assert vmf.entities[0] is ents[32]
+
+
+def test_id_man() -> None:
+    """IDs are allocated from the lowest free ID."""
+    ids = IDMan()
+    assert [ids.get_id() for _ in range(5)] == [1, 2, 3, 4, 5]
+    assert ids.get_id(10) == 10
+    assert ids.get_id(3) == 6
+    assert ids.get_id() == 7
+    ids.remove(2)
+    ids.discard(4)
+    ids.discard(12)
+    assert ids.get_id() == 2
+    assert ids.get_id() == 4
+    assert ids.get_id() == 8
+    assert ids.get_id() == 9
+    assert ids.get_id() == 11
+
+    ids -= {1, 2}
+    assert ids.get_id() == 1
+    assert ids.get_id() == 2
+    assert ids.get_id() == 12
+
+    block = ids.reserve(4)
+    assert block == range(13, 17)
+    assert 14 in ids
+    assert ids.get_id() == 17
+    # Reserved IDs can be claimed once.
+    assert ids.get_id(14) == 14
+    assert ids.get_id(14) == 18
+
+    copy = pickle.loads(pickle.dumps(ids))
+    assert type(copy) is IDMan
+    assert copy == ids
+    assert copy.get_id() == 19
+
+
+def test_copy_ids() -> None:
+    """Copying brushes and entities allocates new IDs."""
+    vmf = VMF()
+    ent = vmf.create_ent('func_detail')
+    ent.solids.append(vmf.make_prism(Vec(0, 0, 0), Vec(64, 64, 64)).solid)
+    ent.solids.append(vmf.make_prism(Vec(0, 0, 64), Vec(64, 64, 128)).solid)
+    copies = [ent.copy() for _ in range(3)]
+    solid_ids = {solid.id for copy in [ent] + copies for solid in copy.solids}
+    side_ids = {side.id for copy in [ent] + copies for side in copy.sides()}
+    assert len(solid_ids) == 8
+    assert len(side_ids) == 48
+    assert side_ids == vmf.face_id
+
+
+def test_spatial_index() -> None:
+    """Test querying the spatial index, compared to checking every object."""
+    vmf = VMF()
+    for x in range(-5, 5):
+        for y in range(-5, 5):
+            pos = Vec(x * 200, y * 150, (x * y) % 7 * 32)
+            vmf.add_brush(vmf.make_prism(pos, pos + (x % 3 + 1) * 100).solid)
+            vmf.create_ent('info_target', origin=pos + (10, 20, 30))
+    big = vmf.create_ent('func_detail')
+    big.solids.append(vmf.make_prism(Vec(-3000, -40, -40), Vec(3000, 40, 40)).solid)
+    vmf.create_ent('logic_relay')  # No location.
+
+    index = vmf.build_spatial_index(cell_size=128)
+    assert len(index) == len(vmf.brushes) + len(vmf.entities)
+
+    def check_box(bbox_min: Vec, bbox_max: Vec) -> None:
+        """Check find_box() against every object."""
+        expected = set()
+        for obj in vmf.brushes + list(vmf.entities):
+            if obj in index:
+                try:
+                    obj_min, obj_max = index.get_bbox(obj)
+                except KeyError:
+                    continue
+                if (
+                    obj_min.x <= bbox_max.x and obj_max.x >= bbox_min.x and
+                    obj_min.y <= bbox_max.y and obj_max.y >= bbox_min.y and
+                    obj_min.z <= bbox_max.z and obj_max.z >= bbox_min.z
+                ):
+                    expected.add(obj)
+        found = index.find_box(bbox_min, bbox_max)
+        assert len(found) == len(expected)
+        assert set(found) == expected
+
+    for bbox in [
+        (Vec(-64, -64, -64), Vec(64, 64, 64)),
+        (Vec(-1000, -1000, -1000), Vec(1000, 1000, 1000)),
+        (Vec(10, 20, 30), Vec(10, 20, 30)),
+        (Vec(2900, 0, 0), Vec(2950, 10, 10)),
+        (Vec(5000, 5000, 5000), Vec(6000, 6000, 6000)),
+    ]:
+        check_box(*bbox)
+    assert big in index.find_point(Vec(2999, 0, 0))
+    assert big not in index.find_point(Vec(3001, 0, 0))
+
+    hits = index.find_ray(Vec(-3500, 0, 0), Vec(3500, 0, 0))
+    assert hits == sorted(hits, key=lambda hit: hit[0])
+    dist, obj = hits[0]
+    assert obj is big
+    assert dist == pytest.approx(500)
+    assert {obj for dist, obj in hits} == set(index.find_box(
+        Vec(-3500, 0, 0), Vec(3500, 0, 0),
+    ))
+    assert index.find_ray(Vec(-3500, 0, 5000), Vec(3500, 0, 5000)) == []
+
+    # Changes to the map update the index.
+    brush = vmf.brushes[0]
+    brush.translate(Vec(0, 0, 10000))
+    assert brush in index.find_point(Vec(brush.get_origin()))
+    ent = next(iter(vmf.by_class['info_target']))
+    ent['origin'] = '20000 0 0'
+    assert index.find_point(Vec(20000, 0, 0)) == [ent]
+    vmf.remove_ent(ent)
+    assert ent not in index
+    assert index.find_point(Vec(20000, 0, 0)) == []
+    new_ent = vmf.create_ent('info_null', origin='-20000 0 0')
+    assert index.find_point(Vec(-20000, 0, 0)) == [new_ent]
+    del new_ent['origin']
+    assert index.find_point(Vec(-20000, 0, 0)) == []
+    new_brush = vmf.make_prism(Vec(0, 0, -9000), Vec(64, 64, -8000)).solid
+    vmf.add_brush(new_brush)
+    assert index.find_point(Vec(32, 32, -8500)) == [new_brush]
+    vmf.remove_brush(new_brush)
+    assert new_brush not in index
+
+    big.solids[0].translate(Vec(0, 0, -5000))
+    assert index.find_point(Vec(0, 0, -5000)) == [big]
+    check_box(Vec(-5000, -5000, -5000), Vec(5000, 5000, 5000))
+
+
+def test_io_index() -> None:
+    """Test finding outputs with the IO index, compared to without."""
+    vmf = VMF()
+    names = ['relay', 'relay_a', 'relay_b', 'a_relay', 'door', 'door_relay']
+    for i, name in enumerate(names):
+        ent = vmf.create_ent('logic_relay', targetname='src_{}'.format(i))
+        for target in names[i:]:
+            ent.add_out(Output('OnTrigger', target, 'Trigger'))
+
+    queries = ['relay', 'relay*', '*relay', '*relay*', 'missing', '*', 'door*']
+    expected = {
+        name: set(vmf.iter_inputs(name))
+        for name in queries
+    }
+    index = vmf.build_io_index()
+    assert len(index) == sum(len(ent.outputs) for ent in vmf.entities)
+    for name in queries:
+        found = list(vmf.iter_inputs(name))
+        assert len(found) == len(expected[name])
+        assert set(found) == expected[name]
+
+    out = next(iter(vmf.iter_inputs('door_relay')))
+    source = index.get_source(out)
+    assert out in source.outputs
+
+    # Changes to outputs update the index.
+    new_ent = vmf.create_ent('logic_auto')
+    new_ent.add_out(Output('OnMapSpawn', 'relay_c', 'Trigger'))
+    assert [index.get_source(out) for out in vmf.iter_inputs('relay_*')].count(new_ent) == 1
+    assert len(list(vmf.iter_inputs('*_c'))) == 1
+
+    def check() -> None:
+        """Check the index finds the same outputs as searching the map."""
+        for name in queries + ['relay_c', 'new_relay', '*new*']:
+            found = set(vmf.iter_inputs(name))
+            vmf.io_index = None
+            try:
+                assert found == set(vmf.iter_inputs(name)), name
+            finally:
+                vmf.io_index = index
+        assert len(index) == sum(len(ent.outputs) for ent in vmf.entities)
+
+    # Every way of changing the outputs is tracked.
+    new_out = Output('OnMapSpawn', 'new_relay', 'Trigger')
+    new_ent.outputs.append(new_out)
+    assert list(vmf.iter_inputs('*relay')).count(new_out) == 1
+    check()
+    new_out.target = 'door'
+    assert new_out in index.find_inputs('door')
+    assert new_out not in index.find_inputs('new_relay')
+    check()
+    new_ent.outputs[0] = Output('OnMapSpawn', 'new_relay', 'Enable')
+    check()
+    new_ent.outputs.insert(0, Output('OnMapSpawn', 'relay_b', 'Enable'))
+    new_ent.outputs += [Output('OnMapSpawn', 'relay', 'Enable')]
+    check()
+    del new_ent.outputs[1]
+    new_ent.outputs.pop()
+    check()
+    new_ent.outputs[:1] = [Output('OnMapSpawn', 'a_relay', 'Kill')]
+    check()
+    new_ent.outputs.remove(new_out)
+    assert new_out not in index
+    assert new_out not in index.find_inputs('door')
+    check()
+    new_ent.outputs = [new_out]
+    assert new_out in index
+    check()
+    new_ent.outputs.clear()
+    assert new_out not in index
+    check()
+    new_ent.add_out(new_out)
+    new_ent.remove_out(new_out)
+    check()
+
+    vmf.remove_ent(source)
+    assert out not in index
+    assert out not in index.find_inputs('*relay')
+    # Removed entities aren't tracked.
+    source.outputs.append(Output('OnTrigger', 'relay', 'Trigger'))
+    out.target = 'new_relay'
+    check()
+    assert len(index) == sum(len(ent.outputs) for ent in vmf.entities)
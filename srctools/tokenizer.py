@@ -2,6 +2,7 @@
 
 This is used internally for parsing files.
 """
+import re
 from enum import Enum
 
 from typing import (
@@ -432,6 +433,220 @@ class Tokenizer:
         return value
 
 
+# Matches for BytesTokenizer, on the raw data.
+# \r is treated as a newline here, since we don't have universal newlines.
+# The common tokens, after skipping whitespace. If none match,
+# the slower code handles the rest.
+_BYTES_FAST = re.compile(
+    rb'[ \t]*(?:'
+    rb'(\n|\r\n?)|'  # 1: Newline
+    rb'"([^"\\\n\r]*)"|'  # 2: Simple strings, without escapes or newlines.
+    rb'([^"\'{};:\[\]()\n\r\t /=+][^"\'{};:\[\]()\n\r\t ]*)|'  # 3: Bare names
+    rb'([{}:=+\]])'  # 4: Operators
+    rb')?'
+)
+_BYTES_BARE = re.compile(rb'[^"\'{};:\[\]()\n\r\t ]+')
+_BYTES_WHITESPACE = re.compile(rb'[ \t]+')
+_BYTES_COMMENT = re.compile(rb'[^\n\r]*')
+# Simple strings, with no escapes or newlines.
+_BYTES_SIMPLE_STR = re.compile(rb'([^"\\\n\r]*)"')
+_BYTES_ESCAPED_STR = re.compile(rb'((?:[^"\\]|\\.)*)"', re.DOTALL)
+_BYTES_RAW_STR = re.compile(rb'([^"]*)"')
+_BYTES_FLAG = re.compile(rb'[^\]\n\r]*')
+_BYTES_PAREN = re.compile(rb'([^)]*)\)')
+# Characters BytesTokenizer searches for, which must be encoded as ASCII.
+_ASCII_CHARS = BARE_DISALLOWED + '\r/\\=+'
+# Escapes in decoded text.
+_ESCAPE_SEQ = re.compile(r'\\(.)', re.DOTALL)
+
+_BYTES_OPERATORS = {
+    ord(char): (tok, char)
+    for char, tok in _OPERATORS.items()
+    if char is not None
+}
+
+
+def _replace_escape(match) -> str:
+    """Substitute the escape sequence in a match."""
+    char = match.group(1)
+    try:
+        return ESCAPES[char]
+    except KeyError:
+        return '\\' + char
+
+
+def _count_newlines(data: bytes) -> int:
+    """Count \n, \r\n and lone \r line endings."""
+    # Memoryviews and mmap slices don't have count().
+    data = bytes(data)
+    return data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n')
+
+
+def _decode_bytes(data: Union[bytes, bytearray, memoryview], encoding: str) -> str:
+    """Decode binary data for the regular Tokenizer.
+
+    This matches BytesTokenizer - the UTF-8 byte order mark is skipped, and
+    newlines are translated like universal newlines mode.
+    """
+    if isinstance(data, memoryview):
+        data = data.cast('B')
+    skip = 3 if data[:3] == b'\xef\xbb\xbf' else 0
+    text = str(data[skip:], encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+class BytesTokenizer(Tokenizer):
+    """Processes binary data into groups of tokens, without decoding it all.
+
+    The data can be bytes, bytearray, memoryview or mmap. Only the text of
+    strings and other tokens is decoded, so the encoding must be
+    ASCII-compatible - UTF-8 and single-byte codepages like cp1252 are fine.
+    Newlines are translated like universal newlines mode.
+    """
+    def __init__(
+        self,
+        data: Union[bytes, bytearray, memoryview],
+        filename: str=None,
+        error: Type[TokenSyntaxError]=TokenSyntaxError,
+        string_bracket=False,
+        allow_escapes=True,
+        encoding: str='utf8',
+    ) -> None:
+        super().__init__('', filename, error, string_bracket, allow_escapes)
+        if _ASCII_CHARS.encode(encoding) != _ASCII_CHARS.encode('ascii'):
+            raise ValueError(
+                'Encoding "{}" is not ASCII-compatible!'.format(encoding)
+            )
+        if isinstance(data, memoryview):
+            data = data.cast('B')
+        elif isinstance(data, str) or not hasattr(data, '__getitem__'):
+            raise TypeError('Data must be a bytes-like object!')
+        self.data = data
+        self.encoding = encoding
+        self.pos = 0
+        if data[:3] == b'\xef\xbb\xbf':
+            # Skip the UTF-8 byte order mark.
+            self.pos = 3
+
+    def _decode(self, start: int, end: int) -> str:
+        """Decode a section of the data, fixing newlines."""
+        text = str(self.data[start:end], self.encoding)
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def __call__(self) -> Tuple[Token, Optional[str]]:
+        """Return the next token, value pair."""
+        if self._pushback is not None:
+            next_val = self._pushback
+            self._pushback = None
+            return next_val
+
+        data = self.data
+        while True:
+            match = _BYTES_FAST.match(data, self.pos)
+            kind = match.lastindex
+            if kind is not None:
+                self.pos = match.end()
+                if kind == 2:
+                    return Token.STRING, match.group(2).decode(self.encoding)
+                elif kind == 3:
+                    return Token.STRING, match.group(3).decode(self.encoding)
+                elif kind == 1:
+                    self.line_num += 1
+                    return Token.NEWLINE, '\n'
+                else:
+                    return _BYTES_OPERATORS[data[match.start(4)]]
+
+            # Otherwise, handle the more unusual cases.
+            pos = match.end()
+            try:
+                char = data[pos]
+            except IndexError:
+                return Token.EOF, None
+            self.pos = pos + 1
+
+            try:
+                return _BYTES_OPERATORS[char]
+            except KeyError:
+                pass
+
+            if char == 10:  # \n
+                self.line_num += 1
+                return Token.NEWLINE, '\n'
+            elif char == 13:  # \r
+                if data[pos + 1:pos + 2] == b'\n':
+                    self.pos += 1
+                self.line_num += 1
+                return Token.NEWLINE, '\n'
+            elif char == 32 or char == 9:  # Space, tab.
+                self.pos = _BYTES_WHITESPACE.match(data, pos).end()
+            elif char == 47:  # /
+                # The next must be another slash! (//)
+                if data[pos + 1:pos + 2] != b'/':
+                    raise self.error(
+                        'Single slash found, '
+                        'instead of two for a comment (//)!'
+                    )
+                # Skip to the end of line, leaving that to be produced.
+                self.pos = _BYTES_COMMENT.match(data, pos + 2).end()
+            elif char == 34:  # "
+                match = _BYTES_SIMPLE_STR.match(data, pos + 1)
+                if match is None:
+                    # Has escapes or newlines, take the slow path.
+                    if self.allow_escapes:
+                        match = _BYTES_ESCAPED_STR.match(data, pos + 1)
+                    else:
+                        match = _BYTES_RAW_STR.match(data, pos + 1)
+                    if match is None:
+                        self.line_num += _count_newlines(data[pos:])
+                        raise self.error('Unterminated string!')
+                    self.line_num += _count_newlines(data[pos:match.end()])
+                    value = self._decode(*match.span(1))
+                    if self.allow_escapes and '\\' in value:
+                        value = _ESCAPE_SEQ.sub(_replace_escape, value)
+                else:
+                    value = str(data[pos + 1:match.end() - 1], self.encoding)
+                self.pos = match.end()
+                return Token.STRING, value
+            elif char == 91:  # [
+                # FGDs use [] for grouping, Properties use it for flags.
+                if not self.string_bracket:
+                    return Token.BRACK_OPEN, '['
+                end = _BYTES_FLAG.match(data, pos + 1).end()
+                end_char = data[end:end + 1]
+                if end_char == b']':
+                    self.pos = end + 1
+                    return Token.PROP_FLAG, self._decode(pos + 1, end)
+                elif end_char:
+                    # Must be one line!
+                    raise self.error(Token.NEWLINE)
+                else:
+                    raise self.error(
+                        'Unterminated property flag!\n\n'
+                        'Like "name" "value" [flag_without_end'
+                    )
+            elif char == 40:  # (
+                match = _BYTES_PAREN.match(data, pos + 1)
+                if match is None:
+                    self.line_num += _count_newlines(data[pos:])
+                    raise self.error('Unterminated parentheses!')
+                self.line_num += _count_newlines(data[pos:match.end()])
+                self.pos = match.end()
+                return Token.PAREN_ARGS, self._decode(*match.span(1))
+            else:
+                match = _BYTES_BARE.match(data, pos)
+                if match is None:
+                    raise self.error(
+                        'Unexpected character "{}"!',
+                        self._decode(pos, pos + 1),
+                    )
+                self.pos = end = match.end()
+                return Token.STRING, str(data[pos:end], self.encoding)
+
+
 def escape_text(text: str) -> str:
     r"""Escape special characters and backslashes, so tokenising reproduces them.
 
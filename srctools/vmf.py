@@ -3,21 +3,26 @@ Wraps property_parser tree in a set of classes which smartly handle
 specifics of VMF files.
 """
 import io
+import bisect
+import heapq
 import itertools
+import math
 import operator
 import builtins
+import weakref
 from collections import defaultdict, namedtuple
+from collections.abc import ItemsView, ValuesView
 from contextlib import suppress
 
 from typing import (
     Optional, Union, Any, overload, TypeVar,
-    Dict, List, Tuple, Set, Mapping, IO,
-    Iterable, Iterator,
+    Dict, List, Tuple, Set, Mapping, MutableMapping, MutableSequence, IO,
+    Iterable, Iterator, Callable, Container, Sequence,
 )
 
 from srctools import BOOL_LOOKUP, EmptyMapping
 from srctools.vec import Vec
-from srctools.property_parser import Property
+from srctools.property_parser import Property, PropertyHandler
 import srctools
 
 # Used to set the defaults for versioninfo
@@ -37,6 +42,21 @@ _DISP_ROWS = (
     'triangle_tags',
 )
 
+# The start of a side block, up to the displacement info.
+_SIDE_FORMAT = (
+    '{0}side\n'
+    '{0}{{\n'
+    '{0}\t"id" "{1}"\n'
+    '{0}\t"plane" "({2.x:g} {2.y:g} {2.z:g}) ({3.x:g} {3.y:g} {3.z:g}) '
+    '({4.x:g} {4.y:g} {4.z:g})"\n'
+    '{0}\t"material" "{5}"\n'
+    '{0}\t"uaxis" "[{6.x:g} {6.y:g} {6.z:g} {6.offset:g}] {6.scale:g}"\n'
+    '{0}\t"vaxis" "[{7.x:g} {7.y:g} {7.z:g} {7.offset:g}] {7.scale:g}"\n'
+    '{0}\t"rotation" "{8}"\n'
+    '{0}\t"lightmapscale" "{9}"\n'
+    '{0}\t"smoothing_groups" "{10}"\n'
+)
+
 # Return value for VMF.make_prism()
 PrismFace = namedtuple(
     "PrismFace",
@@ -51,27 +71,142 @@ T = TypeVar('T')
 
 
 class IDMan(set):
-    """Allocate and manage a set of unique IDs."""
-    __slots__ = ()
+    """Allocate and manage a set of unique IDs.
 
-    def get_id(self, desired: int=-1) -> int:
-        """Get a valid ID."""
+    New IDs are the lowest unused ID. To find these quickly, every ID
+    below _next is either used or in the _free heap, so only IDs above
+    that need to be checked. Removed IDs are added to the heap, and
+    re-added IDs are skipped when popped.
+    """
+    __slots__ = ('_next', '_free', '_reserved')
 
-        if desired == -1:
-            # Start with the lowest ID, and look upwards
-            desired = 1
+    def __init__(self, ids: Iterable[int]=()) -> None:
+        super().__init__(ids)
+        self._next = 1
+        self._free = []  # type: List[int]
+        # IDs from reserve() which haven't been requested yet.
+        self._reserved = set()  # type: Set[int]
 
-        if desired not in self:
-            # The desired ID is available!
-            self.add(desired)
-            return desired
+    def __reduce__(self) -> tuple:
+        """Pickle as just the IDs, since the rest can be recomputed."""
+        return self.__class__, (list(self), )
 
-        # Check every ID in order to find a valid one
-        for poss_id in itertools.count(start=1):
+    def get_id(self, desired: int=-1) -> int:
+        """Get a valid ID."""
+        if desired != -1:
+            if desired not in self:
+                # The desired ID is available!
+                self.add(desired)
+                return desired
+            if desired in self._reserved:
+                self._reserved.remove(desired)
+                return desired
+
+        # Use the lowest freed ID, if there are any still free.
+        free = self._free
+        while free:
+            poss_id = heapq.heappop(free)
             if poss_id not in self:
                 self.add(poss_id)
                 return poss_id
 
+        poss_id = self._next
+        while poss_id in self:
+            poss_id += 1
+        self.add(poss_id)
+        self._next = poss_id + 1
+        return poss_id
+
+    def reserve(self, count: int) -> range:
+        """Allocate a block of consecutive IDs, and return the range.
+
+        This is the lowest block above any existing ones. Each can then
+        be passed to get_id() once, to claim it.
+        """
+        start = self._next
+        while True:
+            # Check from the end, so we can skip past the last used ID.
+            for used_id in range(start + count - 1, start - 1, -1):
+                if used_id in self:
+                    start = used_id + 1
+                    break
+            else:
+                break
+        ids = range(start, start + count)
+        self.update(ids)
+        self._reserved.update(ids)
+        if start == self._next:
+            self._next = start + count
+        return ids
+
+    def reserve_ids(self, ids: Iterable[int]) -> None:
+        """Reserve specific IDs, if they're unused.
+
+        Each can then be passed to get_id() once, to claim it.
+        """
+        for ident in ids:
+            if ident not in self:
+                self.add(ident)
+                self._reserved.add(ident)
+
+    def _freed(self, ident: int) -> None:
+        """Record that this ID was removed, so it can be reused."""
+        self._reserved.discard(ident)
+        if ident < self._next:
+            heapq.heappush(self._free, ident)
+
+    def _reset(self) -> None:
+        """Forget where free IDs are, after an unknown number were removed."""
+        self._next = 1
+        self._free.clear()
+        self._reserved.intersection_update(self)
+
+    def remove(self, ident: int) -> None:
+        """Remove an ID, raising KeyError if not present."""
+        super().remove(ident)
+        self._freed(ident)
+
+    def discard(self, ident: int) -> None:
+        """Remove an ID if present."""
+        if ident in self:
+            super().remove(ident)
+            self._freed(ident)
+
+    def pop(self) -> int:
+        """Remove and return an arbitrary ID."""
+        ident = super().pop()
+        self._freed(ident)
+        return ident
+
+    def clear(self) -> None:
+        """Remove all IDs."""
+        super().clear()
+        self._reset()
+
+    def difference_update(self, *others: Iterable[Any]) -> None:
+        super().difference_update(*others)
+        self._reset()
+
+    def intersection_update(self, *others: Iterable[Any]) -> None:
+        super().intersection_update(*others)
+        self._reset()
+
+    def symmetric_difference_update(self, other: Iterable[Any]) -> None:
+        super().symmetric_difference_update(other)
+        self._reset()
+
+    def __isub__(self, other: Any) -> 'IDMan':
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other: Any) -> 'IDMan':
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other: Any) -> 'IDMan':
+        self.symmetric_difference_update(other)
+        return self
+
 
 class NullIDMan(IDMan):
     """An alternate Id manager which allows repeated IDs."""
@@ -196,6 +331,337 @@ class CopySet(set):
         yield from (self - cur_items)
 
 
+class EntityList(MutableSequence['Entity']):
+    """The list of entities in a VMF, which allows quick removal.
+
+    Removing an entity replaces it with a placeholder instead of shifting
+    the rest of the list, and a dict of positions avoids searching for it.
+    The placeholders are discarded once they make up half the list.
+    Each entity can only be present once.
+
+    Entities can be added, removed or replaced while iterating. Entities
+    removed before they are reached are skipped, and entities added are
+    included. Other changes which reorder the list (inserting, assigning
+    slices, sorting) raise RuntimeError while iterating.
+    """
+    __slots__ = ['_ents', '_pos', '_iterating', '_list']
+
+    def __init__(self, ents: Iterable['Entity']=()) -> None:
+        # Removed entities are replaced by None.
+        self._ents = []  # type: List[Optional[Entity]]
+        # Entity -> index in _ents.
+        self._pos = {}  # type: Dict[Entity, int]
+        # The number of iterators running, we can't compact during those.
+        self._iterating = 0
+        # If placeholders are present while iterating, a copy of the list
+        # without them for indexing.
+        self._list = None  # type: Optional[List[Entity]]
+        self.extend(ents)
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(self.__class__.__name__, list(self))
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, ent: object) -> bool:
+        return ent in self._pos
+
+    def __iter__(self) -> Iterator['Entity']:
+        return self._iter(True)
+
+    def _iter(self, include_new: bool) -> Iterator['Entity']:
+        """Iterate over the entities.
+
+        If include_new is False, entities added after starting are skipped.
+        """
+        # No compacting happens while we're running, so the list is only
+        # modified by appending or replacing entities with None.
+        if include_new:
+            ents = iter(self._ents)  # type: Iterator[Optional[Entity]]
+        else:
+            ents = itertools.islice(self._ents, len(self._ents))
+        self._iterating += 1
+        try:
+            for ent in ents:
+                if ent is not None:
+                    yield ent
+        finally:
+            self._iterating -= 1
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, EntityList):
+            return list(self) == list(other)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def _compact(self) -> None:
+        """Discard the placeholders, if there are enough and it's safe to."""
+        if self._iterating == 0 and len(self._ents) > 2 * len(self._pos) + 8:
+            self._set_list([ent for ent in self._ents if ent is not None])
+
+    def _set_list(self, ents: List['Entity']) -> None:
+        """Replace the contents with the given entities."""
+        if self._iterating:
+            raise RuntimeError('EntityList reordered during iteration!')
+        pos = {}  # type: Dict[Entity, int]
+        for i, ent in enumerate(ents):
+            if ent in pos:
+                raise ValueError('{!r} is already present!'.format(ent))
+            pos[ent] = i
+        self._ents[:] = ents
+        self._pos = pos
+        self._list = None
+
+    def _as_list(self) -> List['Entity']:
+        """Return the entities as a list, without placeholders.
+
+        If possible, the placeholders are removed first.
+        """
+        if len(self._ents) == len(self._pos):
+            return self._ents
+        if not self._iterating:
+            self._set_list([ent for ent in self._ents if ent is not None])
+            return self._ents
+        if self._list is None:
+            self._list = [ent for ent in self._ents if ent is not None]
+        return self._list
+
+    @overload
+    def __getitem__(self, index: int) -> 'Entity': ...
+    @overload
+    def __getitem__(self, index: slice) -> List['Entity']: ...
+    def __getitem__(self, index: Union[int, slice]) -> Union['Entity', List['Entity']]:
+        return self._as_list()[index]
+
+    def __setitem__(self, index: Union[int, slice], value: Any) -> None:
+        if isinstance(index, slice):
+            ents = list(self._as_list())
+            ents[index] = value
+            self._set_list(ents)
+            return
+        # Replace the single entity in its place.
+        old = self._as_list()[index]
+        if value is old:
+            return
+        if value in self._pos:
+            raise ValueError('{!r} is already present!'.format(value))
+        pos = self._pos[value] = self._pos.pop(old)
+        self._ents[pos] = value
+        self._list = None
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        if isinstance(index, slice):
+            ents = list(self._as_list())
+            del ents[index]
+            self._set_list(ents)
+        else:
+            self.remove(self._as_list()[index])
+
+    def insert(self, index: int, ent: 'Entity') -> None:
+        """Insert an entity before the given index."""
+        if index >= len(self._pos):
+            self.append(ent)
+        else:
+            ents = list(self._as_list())
+            ents.insert(index, ent)
+            self._set_list(ents)
+
+    def append(self, ent: 'Entity') -> None:
+        """Add an entity to the end."""
+        if ent in self._pos:
+            raise ValueError('{!r} is already present!'.format(ent))
+        self._pos[ent] = len(self._ents)
+        self._ents.append(ent)
+        self._list = None
+
+    def extend(self, ents: Iterable['Entity']) -> None:
+        """Add several entities to the end.
+
+        If any are already present, none are added.
+        """
+        ents = list(ents)
+        pos = self._pos
+        start = len(self._ents)
+        for i, ent in enumerate(ents, start):
+            if ent in pos:
+                # Undo the ones we added.
+                for added in ents[:i - start]:
+                    del pos[added]
+                raise ValueError('{!r} is already present!'.format(ent))
+            pos[ent] = i
+        self._ents.extend(ents)
+        self._list = None
+
+    def remove(self, ent: 'Entity') -> None:
+        """Remove the given entity."""
+        try:
+            pos = self._pos.pop(ent)
+        except KeyError:
+            raise ValueError('{!r} is not present!'.format(ent)) from None
+        self._ents[pos] = None
+        self._list = None
+        self._compact()
+
+    def index(self, ent: 'Entity', start: int=0, stop: int=None) -> int:
+        """Return the position of the given entity."""
+        if stop is None:
+            return self._as_list().index(ent, start)
+        return self._as_list().index(ent, start, stop)
+
+    def count(self, ent: 'Entity') -> int:
+        """Entities can only be present once, so this is 0 or 1."""
+        return 1 if ent in self._pos else 0
+
+    def clear(self) -> None:
+        """Remove all entities."""
+        self._ents.clear()
+        self._pos.clear()
+        self._list = None
+
+    def copy(self) -> List['Entity']:
+        """Return the entities as a regular list."""
+        return list(self._as_list())
+
+    def reverse(self) -> None:
+        """Reverse the order of entities."""
+        self._set_list(self._as_list()[::-1])
+
+    def sort(
+        self, *,
+        key: Optional[Callable[['Entity'], Any]]=None,
+        reverse: bool=False,
+    ) -> None:
+        """Sort the entities."""
+        self._set_list(sorted(self._as_list(), key=key, reverse=reverse))
+
+
+class OutputList(MutableSequence['Output']):
+    """The outputs of an entity, which keeps the map's IOIndex up to date.
+
+    This acts like a regular list. Any changes are passed onto VMF.io_index
+    if it has been built.
+    """
+    __slots__ = ['_ent', '_outs']
+
+    def __init__(self, ent: 'Entity', outputs: Iterable['Output']=()) -> None:
+        self._ent = ent
+        self._outs = list(outputs)
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(self.__class__.__name__, self._outs)
+
+    def __len__(self) -> int:
+        return len(self._outs)
+
+    def __contains__(self, out: object) -> bool:
+        return out in self._outs
+
+    def __iter__(self) -> Iterator['Output']:
+        return iter(self._outs)
+
+    def __reversed__(self) -> Iterator['Output']:
+        return reversed(self._outs)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, OutputList):
+            return self._outs == other._outs
+        if isinstance(other, list):
+            return self._outs == other
+        return NotImplemented
+
+    def _changed(self) -> None:
+        """Re-index all our outputs, after several were changed."""
+        if self._ent.map.io_index is not None:
+            self._ent.map.io_index.update(self._ent)
+
+    @overload
+    def __getitem__(self, index: int) -> 'Output': ...
+    @overload
+    def __getitem__(self, index: slice) -> List['Output']: ...
+    def __getitem__(self, index: Union[int, slice]) -> Union['Output', List['Output']]:
+        return self._outs[index]
+
+    def __setitem__(self, index: Union[int, slice], value: Any) -> None:
+        if isinstance(index, slice):
+            self._outs[index] = value
+            self._changed()
+            return
+        io_index = self._ent.map.io_index
+        old = self._outs[index]
+        self._outs[index] = value
+        if io_index is not None:
+            io_index.remove_outputs(self._ent, [old])
+            io_index.add_outputs(self._ent, [value])
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        if isinstance(index, slice):
+            del self._outs[index]
+            self._changed()
+        else:
+            self.remove(self._outs[index])
+
+    def insert(self, index: int, out: 'Output') -> None:
+        """Insert an output before the given index."""
+        self._outs.insert(index, out)
+        if self._ent.map.io_index is not None:
+            self._ent.map.io_index.add_outputs(self._ent, [out])
+
+    def append(self, out: 'Output') -> None:
+        """Add an output to the end."""
+        self._outs.append(out)
+        if self._ent.map.io_index is not None:
+            self._ent.map.io_index.add_outputs(self._ent, [out])
+
+    def extend(self, outputs: Iterable['Output']) -> None:
+        """Add several outputs to the end."""
+        outputs = list(outputs)
+        self._outs.extend(outputs)
+        if self._ent.map.io_index is not None:
+            self._ent.map.io_index.add_outputs(self._ent, outputs)
+
+    def remove(self, out: 'Output') -> None:
+        """Remove the given output.
+
+        ValueError is raised if it isn't present.
+        """
+        self._outs.remove(out)
+        if self._ent.map.io_index is not None:
+            self._ent.map.io_index.remove_outputs(self._ent, [out])
+
+    def index(self, out: 'Output', start: int=0, stop: int=None) -> int:
+        """Return the position of the given output."""
+        if stop is None:
+            return self._outs.index(out, start)
+        return self._outs.index(out, start, stop)
+
+    def count(self, out: 'Output') -> int:
+        """Return the number of times this output is present."""
+        return self._outs.count(out)
+
+    def clear(self) -> None:
+        """Remove all outputs."""
+        self._outs.clear()
+        self._changed()
+
+    def copy(self) -> List['Output']:
+        """Return the outputs as a regular list."""
+        return self._outs.copy()
+
+    def reverse(self) -> None:
+        """Reverse the order of outputs."""
+        self._outs.reverse()
+
+    def sort(
+        self, *,
+        key: Optional[Callable[['Output'], Any]]=None,
+        reverse: bool=False,
+    ) -> None:
+        """Sort the outputs."""
+        self._outs.sort(key=key, reverse=reverse)
+
+
 class VMF:
     """Represents a VMF file, and holds counters for various IDs used.
 
@@ -234,24 +700,35 @@ class VMF:
         self.by_target = defaultdict(CopySet)  # type: Dict[Optional[str], Set[Entity]]
         self.by_class = defaultdict(CopySet)  # type: Dict[Optional[str], Set[Entity]]
 
-        self.entities = []  # type: List[Entity]
+        # If built, the index of brush and entity locations.
+        self.spatial = None  # type: Optional[SpatialIndex]
+        # If built, the index of outputs by their target.
+        self.io_index = None  # type: Optional[IOIndex]
+
+        self.entities = EntityList()
         self.add_ents(entities or [])  # We need to set the by_ dicts too.
-        self.brushes = brushes or []  # type: List[Solid]
         self.cameras = cameras or []  # type: List[Camera]
         self.cordons = cordons or []  # type: List[Cordon]
         self.vis_tree = vis_tree or []  # type: List[VisGroup]
+        # Entities skipped by the filters when parsing. These are
+        # exported unchanged.
+        self.skipped_ents = []  # type: List[Property]
 
         # mapspawn entity, which is the entity world brushes are saved
         # to.
         self.spawn = spawn or Entity(self)  # type: Entity
-        self.spawn.solids = self.brushes
-        self.spawn.hidden_brushes = self.brushes
-        self.is_prefab = srctools.conv_bool(map_info.get('prefab'), False)
-        self.cordon_enabled = srctools.conv_bool(map_info.get('cordons_on'), False)
-        self.map_ver = srctools.conv_int(map_info.get('mapversion'))
+        self.spawn.solids = brushes or []
+        self.spawn.hidden_brushes = self.spawn.solids
         if 'mapversion' in self.spawn:
             # This is saved only in the main VMF object, delete the copy.
             del self.spawn['mapversion']
+        self._set_map_info(map_info)
+
+    def _set_map_info(self, map_info: Mapping[str, str]) -> None:
+        """Apply the map settings read from the file."""
+        self.is_prefab = srctools.conv_bool(map_info.get('prefab'), False)
+        self.cordon_enabled = srctools.conv_bool(map_info.get('cordons_on'), False)
+        self.map_ver = srctools.conv_int(map_info.get('mapversion'))
 
         # These three are mostly useless for us, but we'll preserve them anyway
         self.format_ver = srctools.conv_int(
@@ -277,22 +754,62 @@ class VMF:
         self.quickhide_count = srctools.conv_int(
             map_info.get('quickhide'), -1)
 
+    @property
+    def entities(self) -> EntityList:
+        """The entities in the map, excluding the worldspawn."""
+        return self._entities
+
+    @entities.setter
+    def entities(self, ents: Iterable['Entity']) -> None:
+        if isinstance(ents, EntityList):
+            self._entities = ents
+        else:
+            self._entities = EntityList(ents)
+
+    @property
+    def brushes(self) -> List['Solid']:
+        """The world brushes, stored in the spawn entity."""
+        return self.spawn.solids
+
+    @brushes.setter
+    def brushes(self, brushes: List['Solid']) -> None:
+        self.spawn.solids = brushes
+
+    def _discard_spawn(self) -> None:
+        """Free the ID of the current spawn entity, before replacing it.
+
+        This allows the parsed world to keep its ID.
+        """
+        self.ent_id.discard(self.spawn.id)
+        # Don't free it again once the entity is deleted.
+        self.spawn.id = -1
+
     def add_brush(self, item: 'Solid'):
         """Add a world brush to this map."""
         self.brushes.append(item)
+        if self.spatial is not None:
+            self.spatial.add(item)
 
     def remove_brush(self, brush: 'Solid'):
         """Remove a world brush from this map."""
         self.brushes.remove(brush)
+        if self.spatial is not None:
+            self.spatial.remove(brush)
 
     def add_ent(self, item: 'Entity'):
         """Add an entity to the map.
 
         The entity should have been created with this VMF as a parent.
+        Each entity can only be added once, ValueError is raised if it is
+        already present.
         """
         self.entities.append(item)
         self.by_class[item['classname', None]].add(item)
         self.by_target[item['targetname', None]].add(item)
+        if self.spatial is not None:
+            self.spatial.add(item)
+        if self.io_index is not None:
+            self.io_index.add(item)
 
     def remove_ent(self, item: 'Entity'):
         """Remove an entity from the map.
@@ -303,21 +820,36 @@ class VMF:
         self.entities.remove(item)
         self.by_class[item['classname', None]].remove(item)
         self.by_target[item['targetname', None]].remove(item)
+        if self.spatial is not None:
+            self.spatial.remove(item)
+        if self.io_index is not None:
+            self.io_index.remove(item)
 
         if item.id in self.ent_id:
             self.ent_id.remove(item.id)
 
     def add_brushes(self, brushes: Iterable['Solid']):
         """Add multiple brushes to the map."""
+        brushes = list(brushes)
         self.brushes.extend(brushes)
+        if self.spatial is not None:
+            for brush in brushes:
+                self.spatial.add(brush)
 
     def add_ents(self, ents: Iterable['Entity']):
-        """Add multiple entities to the map."""
+        """Add multiple entities to the map.
+
+        If any are already present, ValueError is raised and none are added.
+        """
         ents = list(ents)
         self.entities.extend(ents)
         for item in ents:
             self.by_class[item['classname', None]].add(item)
             self.by_target[item['targetname', None]].add(item)
+            if self.spatial is not None:
+                self.spatial.add(item)
+            if self.io_index is not None:
+                self.io_index.add(item)
 
     def create_ent(self, classname: str, **kargs) -> 'Entity':
         """Convenience method to allow creating point entities.
@@ -331,6 +863,25 @@ class VMF:
         self.add_ent(ent)
         return ent
 
+    def build_spatial_index(self, cell_size: float=256.0) -> 'SpatialIndex':
+        """Build an index of where brushes and entities are.
+
+        This is stored in VMF.spatial, and kept up to date as brushes and
+        entities are added, removed or moved. See SpatialIndex for details.
+        """
+        self.spatial = SpatialIndex(self, cell_size)
+        return self.spatial
+
+    def build_io_index(self) -> 'IOIndex':
+        """Build an index of the outputs targeting each entity name.
+
+        This is stored in VMF.io_index, and is then used by iter_inputs().
+        It is kept up to date as entities are added or removed, and as their
+        outputs are changed. See IOIndex for details.
+        """
+        self.io_index = IOIndex(self)
+        return self.io_index
+
     def create_visgroup(self, name: str, color: Vec=(255, 255, 255)) -> 'VisGroup':
         """Convenience method for creating visgroups."""
         vis = VisGroup(self, -1, name, color)
@@ -338,47 +889,45 @@ class VMF:
         return vis
 
     @staticmethod
-    def parse(tree: Union[Property, str], preserve_ids=False):
+    def parse(
+        tree: Union[Property, str],
+        preserve_ids=False,
+        *,
+        lazy_solids: bool=False,
+        classnames: Optional[Container[str]]=None,
+        ent_filter: Optional[Callable[['Entity'], bool]]=None,
+        keep_text: bool=False,
+    ):
         """Convert a property_parser tree into VMF classes.
+
+        A filename can be passed instead, to parse that file.
+        See parse_text() for the other options, and to convert the file
+        as it is parsed without building the whole tree first.
         """
         if not isinstance(tree, Property):
             # if not a tree, try to read the file
             with open(tree) as file:
-                tree = Property.parse(file)
-
-        map_info = {}
-        ver_info = tree.find_key('versioninfo', [])
-        for key in ('editorversion',
-                    'mapversion',
-                    'editorbuild',
-                    'prefab'):
-            map_info[key] = ver_info[key, '']
-
-        map_info['formatversion'] = ver_info['formatversion', '100']
-        if map_info['formatversion'] != '100':
-            # If the version is different, we're probably about to fail horribly
-            raise Exception(
-                'Unknown VMF format version " ' +
-                map_info['formatversion'] + '"!'
-                )
-
-        view_opt = tree.find_key('viewsettings', [])
-        view_dict = {
-            'bSnapToGrid': 'snaptogrid',
-            'bShowGrid': 'showgrid',
-            'bShow3DGrid': 'show3dgrid',
-            'bShowLogicalGrid': 'showlogicalgrid',
-            'nGridSpacing': 'gridspacing'
-            }
-        for key in view_dict:
-            map_info[view_dict[key]] = view_opt[key, '']
+                tree = Property.parse(file, tree)
+        if (
+            lazy_solids or keep_text
+            or classnames is not None or ent_filter is not None
+        ):
+            builder = _VMFBuilder(
+                VMF(preserve_ids=preserve_ids),
+                lazy_solids, classnames, ent_filter, keep_text,
+            )
+            _replay_tree(tree, builder)
+            return builder.finish()
 
         cordons = tree.find_key('cordons', [])
-        map_info['cordons_on'] = cordons['active', '0']
-
         cam_props = tree.find_key('cameras', [])
-        map_info['active_cam'] = cam_props.int('activecamera', -1)
-        map_info['quickhide'] = tree.find_key('quickhide', [])['count', '']
+        map_info = VMF._parse_map_info(
+            tree.find_key('versioninfo', []),
+            tree.find_key('viewsettings', []),
+            cordons,
+            cam_props,
+            tree.find_key('quickhide', []),
+        )
 
         # We have to create an incomplete map before parsing any data.
         # This ensures the IDman objects have been created, so we can
@@ -411,34 +960,124 @@ class VMF:
         if map_spawn is None:
             # Generate a fake default to parse through
             map_spawn = Property("world", [])
+        map_obj._discard_spawn()
         map_obj.spawn = Entity.parse(map_obj, map_spawn)
 
-        if map_obj.spawn.solids is not None:
-            map_obj.brushes = map_obj.spawn.solids
-
         return map_obj
 
+    @staticmethod
+    def parse_text(
+        file_contents: Union[str, Iterator[str], bytes, memoryview],
+        filename: str='',
+        preserve_ids: bool=False,
+        *,
+        lazy_solids: bool=False,
+        classnames: Optional[Container[str]]=None,
+        ent_filter: Optional[Callable[['Entity'], bool]]=None,
+        keep_text: bool=False,
+    ) -> 'VMF':
+        """Parse a VMF directly from its text, without a tree for the whole map.
+
+        This takes the same values as Property.parse(). Each brush and
+        top-level block is collected into a small Property tree, then
+        converted and discarded as soon as it ends, so the whole file never
+        exists as a tree.
+
+        Parts of the map can be skipped, if they aren't needed:
+        - If lazy_solids is True, world and entity brushes are only parsed
+          when Entity.solids or VMF.brushes is first accessed. Until then
+          they are exported unchanged.
+        - If classnames is passed, only entities with those classnames
+          are parsed.
+        - If ent_filter is passed, it is called with each entity (without
+          brushes), and only those it returns True for are kept.
+        Skipped entities are stored in VMF.skipped_ents, and exported
+        unchanged.
+
+        If keep_text is True, brushes and entities remember their original
+        text. When exporting, those which haven't been modified write that
+        out again instead of being serialised. Changes are detected by
+        comparing against their state after parsing. Brushes loaded lazily
+        are not included.
+        """
+        builder = _VMFBuilder(
+            VMF(preserve_ids=preserve_ids),
+            lazy_solids, classnames, ent_filter, keep_text,
+        )
+        Property.parse_events(file_contents, builder, filename)
+        return builder.finish()
+
+    @staticmethod
+    def _parse_map_info(
+        ver_info: Property,
+        view_opt: Property,
+        cordons: Property,
+        cam_props: Property,
+        quickhide: Property,
+    ) -> Dict[str, str]:
+        """Read the map settings from the respective blocks."""
+        map_info = {}
+        for key in ('editorversion',
+                    'mapversion',
+                    'editorbuild',
+                    'prefab'):
+            map_info[key] = ver_info[key, '']
+
+        map_info['formatversion'] = ver_info['formatversion', '100']
+        if map_info['formatversion'] != '100':
+            # If the version is different, we're probably about to fail horribly
+            raise Exception(
+                'Unknown VMF format version " ' +
+                map_info['formatversion'] + '"!'
+                )
+
+        view_dict = {
+            'bSnapToGrid': 'snaptogrid',
+            'bShowGrid': 'showgrid',
+            'bShow3DGrid': 'show3dgrid',
+            'bShowLogicalGrid': 'showlogicalgrid',
+            'nGridSpacing': 'gridspacing'
+            }
+        for key in view_dict:
+            map_info[view_dict[key]] = view_opt[key, '']
+
+        map_info['cordons_on'] = cordons['active', '0']
+        map_info['active_cam'] = cam_props.int('activecamera', -1)
+        map_info['quickhide'] = quickhide['count', '']
+        return map_info
+
     @overload
     def export(self, *, inc_version: bool=True, minimal: bool=False) -> str: ...
     @overload
-    def export(self, dest_file: IO[str], *, inc_version: bool=True, minimal: bool=False) -> None: ...
-    def export(self, dest_file: IO[str]=None, *, inc_version=True, minimal=False) -> str:
+    def export(
+        self,
+        dest_file: Union[IO[str], IO[bytes]],
+        *,
+        inc_version: bool=True,
+        minimal: bool=False,
+    ) -> None: ...
+    def export(
+        self,
+        dest_file: Union[IO[str], IO[bytes]]=None,
+        *,
+        inc_version=True,
+        minimal=False,
+    ) -> str:
         """Serialises the object's contents into a VMF file.
 
         - If no file is given the map will be returned as a string.
+        - Text or binary files can be passed. Binary files are written
+          as UTF-8, which avoids the overhead of text files.
         - By default, this will increment the map's version - set
           inc_version to False to suppress this.
         - If minimal is True, several blocks will be skipped
           (Viewsettings, cameras, cordons and visgroups)
         """
-        if dest_file is None:
-            dest_file = io.StringIO()
-            # acts like a file object but is actually a string. We're
-            # using this to prevent having Python duplicate the entire
-            # string every time we append
-            ret_string = True
-        else:
-            ret_string = False
+        # The export() methods write each object in a few large chunks,
+        # this collects those and writes them to the file in batches.
+        ret_string = dest_file is None
+        file = dest_file
+        dest_file = _ExportBuffer(file)
 
         if inc_version:
             # Increment this to indicate the map was modified
@@ -478,6 +1117,9 @@ class VMF:
         for ent in self.entities:
             ent.export(dest_file)
 
+        for tree in self.skipped_ents:
+            _export_raw(dest_file, tree)
+
         if not minimal:
             dest_file.write('cameras\n{\n')
             if len(self.cameras) == 0:
@@ -504,9 +1146,8 @@ class VMF:
             dest_file.write('}\n')
 
         if ret_string:
-            string = dest_file.getvalue()
-            dest_file.close()
-            return string
+            return dest_file.getvalue()
+        dest_file.flush()
 
     def iter_wbrushes(self, world: bool=True, detail: bool=True) -> Iterator['Solid']:
         """Iterate through all world and detail solids in the map."""
@@ -522,11 +1163,16 @@ class VMF:
             yield from brush
 
     def iter_ents(self, **cond: str) -> Iterator['Entity']:
-        """Iterate through entities having the given keyvalue values."""
+        """Iterate through entities having the given keyvalue values.
+
+        Entities added while iterating are skipped, as are those removed
+        before they are reached.
+        """
         items = cond.items()
-        for ent in self.entities[:]:
+        for ent in self.entities._iter(include_new=False):
+            keys = ent.keys
             for key, value in items:
-                if key not in ent or ent[key] != value:
+                if keys.get(key) != value:
                     break
             else:
                 yield ent
@@ -539,15 +1185,18 @@ class VMF:
         """Iterate through all entities.
 
         The returned entities must have exactly the given keyvalue values,
-        and have keyvalues containing the tags.
+        and have keyvalues containing the tags. Like iter_ents(), entities
+        added or removed while iterating are skipped.
         """
-        for ent in self.entities[:]:
+        for ent in self.entities._iter(include_new=False):
+            keys = ent.keys
             for key, value in vals.items():
-                if key not in ent or ent[key] != value:
+                if keys.get(key) != value:
                     break
             else:  # passed through without breaks
                 for key, value in tags.items():
-                    if key not in ent or value not in ent[key]:
+                    found = keys.get(key)
+                    if found is None or value not in found:
                         break
                 else:
                     yield ent
@@ -556,7 +1205,12 @@ class VMF:
         """Loop through all Outputs which target the named entity.
 
         - Allows using * at beginning/end
+        - If an IOIndex has been built, that is used. The outputs are then
+          grouped by target, instead of being in map order.
         """
+        if self.io_index is not None:
+            yield from self.io_index.find_inputs(name)
+            return
         wild_start = name[:1] == '*'
         wild_end = name[-1:] == '*'
         if wild_start:
@@ -746,6 +1400,712 @@ class VMF:
         return [north, south, east, west, top, bottom]
 
 
+def _sort_disp_rows(rows: Iterable[Sequence[str]]) -> List[str]:
+    """Order (name, value) displacement rows by their row number."""
+    return [
+        value for name, value in
+        sorted(rows, key=lambda row: srctools.conv_int(row[0][3:]))
+    ]
+
+
+def _export_raw(buffer: IO[str], tree: Property, ind: str='') -> None:
+    """Write out an unparsed block, in the same style as the VMF classes."""
+    buffer.write(ind + tree.real_name + '\n' + ind + '{\n')
+    for child in tree:
+        if child.has_children():
+            _export_raw(buffer, child, ind + '\t')
+        else:
+            buffer.write('{}\t"{}" "{}"\n'.format(ind, child.real_name, child.value))
+    buffer.write(ind + '}\n')
+
+
+def _replay_tree(tree: Property, handler: PropertyHandler) -> None:
+    """Call the handler's methods for each property in an existing tree."""
+    for prop in tree:
+        if prop.has_children():
+            handler.start_block(prop.real_name, False)
+            _replay_tree(prop, handler)
+            handler.end_block()
+        else:
+            handler.key_value(prop.real_name, prop.value, False)
+
+
+class _ExportBuffer:
+    """Collects the text from the export() methods, for VMF.export().
+
+    Writes are kept in a list, and joined to be written to the file once
+    enough has built up. Binary files have the text encoded to UTF-8.
+    If no file is given, everything is kept for getvalue().
+    """
+    # The number of characters to collect before writing.
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, file: Union[IO[str], IO[bytes], None]) -> None:
+        self._lines = []  # type: List[str]
+        self._size = 0
+        if file is None:
+            # Never flush, we just need to append.
+            self._file_write = None  # type: Optional[Callable[[str], Any]]
+            self.write = self._lines.append
+        elif isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+            def write_bytes(text: str) -> None:
+                """Encode text for the binary file."""
+                file.write(text.encode('utf8'))
+            self._file_write = write_bytes
+        else:
+            self._file_write = file.write
+
+    def write(self, text: str) -> None:
+        """Add text to the buffer, writing it out if large enough."""
+        self._lines.append(text)
+        self._size += len(text)
+        if self._size >= self.CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything collected so far to the file."""
+        if self._file_write is not None and self._lines:
+            self._file_write(''.join(self._lines))
+            self._lines.clear()
+            self._size = 0
+
+    def getvalue(self) -> str:
+        """Return everything written, if there's no file."""
+        return ''.join(self._lines)
+
+
+class _VMFBuilder(PropertyHandler):
+    """Builds a VMF from parse events, for VMF.parse_text().
+
+    Each brush and top-level block is built into a small tree, which is
+    converted with the usual parse() methods once it is complete. The
+    settings blocks are kept until the end, since the last one is used.
+    If brushes are lazily parsed or entities filtered, brushes are kept
+    in the entity trees until the entity is complete.
+    """
+    def __init__(
+        self,
+        map_obj: VMF,
+        lazy_solids: bool=False,
+        classnames: Optional[Container[str]]=None,
+        ent_filter: Optional[Callable[['Entity'], bool]]=None,
+        keep_text: bool=False,
+    ) -> None:
+        self.map = map_obj
+        self.lazy_solids = lazy_solids
+        self.classnames = classnames
+        self.ent_filter = ent_filter
+        self.keep_text = keep_text
+        self._keep_raw = lazy_solids or classnames is not None or ent_filter is not None
+        # The blocks we are currently inside (outside to inside).
+        self._blocks = []  # type: List[Property]
+        # The children of the innermost block, or None at the top level.
+        self._children = None  # type: Optional[List[Property]]
+        # Brushes read from the entity currently being parsed.
+        self._solids = []  # type: List[Solid]
+        # Hidden entities are added after the others, like VMF.parse().
+        self._hidden_ents = []  # type: List[Entity]
+        # Settings blocks, by name.
+        self._settings = {}  # type: Dict[str, Property]
+
+    def key_value(self, name: str, value: str, replace: bool) -> None:
+        # Keyvalues outside any block aren't used.
+        if self._children is not None:
+            if replace:
+                self._children[-1] = Property(name, value)
+            else:
+                self._children.append(Property(name, value))
+
+    def start_block(self, name: str, replace: bool) -> None:
+        block = Property(name, [])
+        if self._children is not None:
+            if replace:
+                self._children[-1] = block
+            else:
+                self._children.append(block)
+        self._blocks.append(block)
+        self._children = block.value
+
+    def end_block(self) -> None:
+        block = self._blocks.pop()
+        blocks = self._blocks
+        if not blocks:
+            self._children = None
+            self._end_toplevel(block)
+            return
+        self._children = blocks[-1].value
+        depth = len(blocks)
+        # In each case, the block was just added to the parent, so remove it.
+        if depth == 1 and blocks[0].name == 'hidden':
+            # A hidden entity.
+            self._children.pop()
+            self._add_ent(block, hidden=True)
+        elif block.name == 'solid' and depth <= 3 and not self._keep_raw:
+            # Check this is part of an entity, possibly in a hidden block.
+            path = [parent.name for parent in blocks]
+            hidden = path[-1] == 'hidden'
+            if hidden:
+                path.pop()
+            if path in (['world'], ['entity']) or (
+                len(path) == 2 and path[0] == 'hidden'
+            ):
+                self._children.pop()
+                solid = Solid.parse(self.map, block, hidden)
+                if self.keep_text:
+                    # Each enclosing block is indented once.
+                    solid._save_text(block, '\t' * depth)
+                self._solids.append(solid)
+
+    def _parse_ent(self, tree: Property, hidden: bool=False) -> 'Entity':
+        """Parse an entity, adding the brushes we removed from it.
+
+        If we're keeping the brush blocks, they're split off first.
+        """
+        if self._keep_raw:
+            raw_solids = []  # type: List[Property]
+            keys = []  # type: List[Property]
+            for child in tree:
+                if child.name in ('solid', 'hidden') and child.has_children():
+                    raw_solids.append(child)
+                else:
+                    keys.append(child)
+            tree = Property(tree.real_name, keys)
+            ent = Entity.parse(self.map, tree, hidden)
+            ent._raw_solids = raw_solids
+        else:
+            # The brushes have already been removed from the tree.
+            ent = Entity.parse(self.map, tree, hidden)
+            ent.solids.extend(self._solids)
+            self._solids.clear()
+        if self.keep_text:
+            ent._save_text(tree, '\t' if hidden else '')
+        return ent
+
+    def _keep_ids(self, raw_solids: List[Property], reserve: bool) -> None:
+        """Mark the IDs of unparsed brushes and their sides as used.
+
+        If reserve is True, they're kept for when the brushes are parsed.
+        Otherwise they're never given out again.
+        """
+        solid_ids = set()  # type: Set[int]
+        side_ids = set()  # type: Set[int]
+        for tree in raw_solids:
+            for solid in (tree if tree.name == 'hidden' else [tree]):
+                solid_ids.add(solid.int('id', -1))
+                for side in solid.find_all('side'):
+                    side_ids.add(side.int('id', -1))
+        solid_ids.discard(-1)
+        side_ids.discard(-1)
+        if reserve:
+            self.map.solid_id.reserve_ids(solid_ids)
+            self.map.face_id.reserve_ids(side_ids)
+        else:
+            self.map.solid_id.update(solid_ids)
+            self.map.face_id.update(side_ids)
+
+    def _add_ent(self, tree: Property, hidden: bool) -> None:
+        """Parse an entity, and add it to the map if it passes the filters."""
+        ent = self._parse_ent(tree, hidden)
+        if (
+            (self.classnames is not None and ent['classname'] not in self.classnames)
+            or (self.ent_filter is not None and not self.ent_filter(ent))
+        ):
+            # Skipped, keep the original to export. Its IDs stay used,
+            # since that has them.
+            self.map.skipped_ents.append(
+                Property('hidden', [tree]) if hidden else tree
+            )
+            self._keep_ids(ent._raw_solids, reserve=False)
+            # Stop the ID being freed once the entity is destroyed.
+            ent.id = -1
+            return
+        if self.lazy_solids:
+            self._keep_ids(ent._raw_solids, reserve=True)
+        else:
+            ent._load_solids(self.keep_text)
+        if hidden:
+            self._hidden_ents.append(ent)
+        else:
+            self.map.add_ent(ent)
+
+    def _end_toplevel(self, block: Property) -> None:
+        """Handle a completed top-level block."""
+        name = block.name
+        map_obj = self.map
+        if name == 'entity':
+            self._add_ent(block, hidden=False)
+        elif name == 'world':
+            map_obj._discard_spawn()
+            map_obj.spawn = self._parse_ent(block)
+            if self.lazy_solids:
+                self._keep_ids(map_obj.spawn._raw_solids, reserve=True)
+            else:
+                map_obj.spawn._load_solids(self.keep_text)
+        elif name == 'visgroups':
+            for vis in block.find_all('visgroup'):
+                map_obj.vis_tree.append(VisGroup.parse(map_obj, vis))
+        elif name in ('versioninfo', 'viewsettings', 'cameras', 'cordons', 'quickhide'):
+            self._settings[name] = block
+
+    def finish(self) -> VMF:
+        """Apply the settings blocks, and return the map."""
+        map_obj = self.map
+        map_obj.add_ents(self._hidden_ents)
+        empty = Property(None, [])
+        cordons = self._settings.get('cordons', empty)
+        cam_props = self._settings.get('cameras', empty)
+        map_obj._set_map_info(VMF._parse_map_info(
+            self._settings.get('versioninfo', empty),
+            self._settings.get('viewsettings', empty),
+            cordons,
+            cam_props,
+            self._settings.get('quickhide', empty),
+        ))
+
+        for c in cam_props:
+            if c.name != 'activecamera':
+                Camera.parse(map_obj, c)
+
+        for ent in cordons.find_all('cordon'):
+            Cordon.parse(map_obj, ent)
+
+        return map_obj
+
+
+class SpatialIndex:
+    """Finds the brushes and entities in a map which are near a location.
+
+    World brushes, brush entities, and point entities (by their origin) are
+    indexed by their bounding boxes, so results are based on those too.
+    Entities without brushes or an origin aren't included.
+
+    Objects are stored in a series of grids, each with cells double the size
+    of the previous. Each object is put in the first grid with cells at least
+    as large as it, in the cell containing its minimum point. It can then
+    only extend into the next cell along each axis, so queries just check
+    one extra cell in the negative directions.
+
+    This is built by VMF.build_spatial_index(). Adding or removing brushes
+    and entities from the map, translating or localising brushes, and
+    changing entity origins update it automatically. For other changes
+    (such as modifying sides, or the brushes of an entity), call update().
+    """
+    def __init__(self, vmf: VMF, cell_size: float=256.0) -> None:
+        self.map = vmf
+        self.cell_size = cell_size
+        # Object -> (min_x, min_y, min_z, max_x, max_y, max_z), or None
+        # if it has no location.
+        self._bboxes = {}  # type: Dict[Any, Optional[Tuple[float, ...]]]
+        # Object -> grid level and cell it's stored in.
+        self._location = {}  # type: Dict[Any, Tuple[int, Tuple[int, int, int]]]
+        # For each level, cell -> the objects in it.
+        self._grids = {}  # type: Dict[int, Dict[Tuple[int, int, int], Set[Any]]]
+        # The number of objects in each level.
+        self._counts = defaultdict(int)  # type: Dict[int, int]
+        # Brush -> the brush entity containing it.
+        self._owners = {}  # type: Dict[Solid, Entity]
+
+        for brush in vmf.brushes:
+            self.add(brush)
+        for ent in vmf.entities:
+            self.add(ent)
+
+    def __len__(self) -> int:
+        return len(self._bboxes)
+
+    def __contains__(self, obj: object) -> bool:
+        return obj in self._bboxes
+
+    @staticmethod
+    def _calc_bbox(obj: Union['Solid', 'Entity']) -> Optional[Tuple[float, ...]]:
+        """Compute the bounding box for an object."""
+        if isinstance(obj, Solid):
+            if not obj.sides:
+                return None
+            bbox_min, bbox_max = obj.get_bbox()
+        elif obj.is_brush():
+            bbox_min, bbox_max = obj.solids[0].get_bbox()
+            for solid in obj.solids[1:]:
+                solid_min, solid_max = solid.get_bbox()
+                bbox_min.min(solid_min)
+                bbox_max.max(solid_max)
+        elif 'origin' in obj:
+            bbox_min = bbox_max = Vec.from_str(obj['origin'])
+        else:
+            return None
+        return (
+            bbox_min.x, bbox_min.y, bbox_min.z,
+            bbox_max.x, bbox_max.y, bbox_max.z,
+        )
+
+    def add(self, obj: Union['Solid', 'Entity']) -> None:
+        """Add a brush or entity to the index, or update it if present."""
+        if isinstance(obj, Entity):
+            for solid in obj.solids:
+                self._owners[solid] = obj
+        if obj in self._location:
+            self._unlink(obj)
+        bbox = self._bboxes[obj] = self._calc_bbox(obj)
+        if bbox is None:
+            return
+
+        size = max(bbox[3] - bbox[0], bbox[4] - bbox[1], bbox[5] - bbox[2])
+        level = 0
+        cell_size = self.cell_size
+        while cell_size < size:
+            cell_size *= 2
+            level += 1
+        cell = (
+            math.floor(bbox[0] / cell_size),
+            math.floor(bbox[1] / cell_size),
+            math.floor(bbox[2] / cell_size),
+        )
+        try:
+            grid = self._grids[level]
+        except KeyError:
+            grid = self._grids[level] = {}
+        try:
+            grid[cell].add(obj)
+        except KeyError:
+            grid[cell] = {obj}
+        self._location[obj] = level, cell
+        self._counts[level] += 1
+
+    def _unlink(self, obj: Union['Solid', 'Entity']) -> None:
+        """Remove an object from its grid cell."""
+        level, cell = self._location.pop(obj)
+        grid = self._grids[level]
+        objs = grid[cell]
+        objs.discard(obj)
+        if not objs:
+            del grid[cell]
+        self._counts[level] -= 1
+
+    def remove(self, obj: Union['Solid', 'Entity']) -> None:
+        """Remove a brush or entity from the index, if present."""
+        if obj not in self._bboxes:
+            return
+        del self._bboxes[obj]
+        if obj in self._location:
+            self._unlink(obj)
+        if isinstance(obj, Entity):
+            for solid in obj.solids:
+                if self._owners.get(solid) is obj:
+                    del self._owners[solid]
+
+    def update(self, obj: Union['Solid', 'Entity']) -> None:
+        """Recompute the location of a brush or entity after it moves.
+
+        For the brushes of brush entities, the entity is updated.
+        Objects which aren't in the index are ignored.
+        """
+        if obj in self._bboxes:
+            self.add(obj)
+        elif obj in self._owners:
+            self.update(self._owners[obj])
+
+    def get_bbox(self, obj: Union['Solid', 'Entity']) -> Tuple[Vec, Vec]:
+        """Return the bounding box stored for this object.
+
+        KeyError is raised if it isn't present or has no location.
+        """
+        bbox = self._bboxes[obj]
+        if bbox is None:
+            raise KeyError(obj)
+        return Vec(bbox[:3]), Vec(bbox[3:])
+
+    def _search(
+        self,
+        cells: Callable[[int, float], Optional[Iterable[Tuple[int, int, int]]]],
+    ) -> Iterator[Union['Solid', 'Entity']]:
+        """Yield the objects in the cells produced for each level.
+
+        cells is called with the number of cells in the level and the cell
+        size. If it returns too many cells, the whole level is checked.
+        """
+        for level, grid in self._grids.items():
+            cell_size = self.cell_size * 2 ** level
+            wanted = cells(len(grid), cell_size)
+            if wanted is None:
+                for objs in grid.values():
+                    yield from objs
+            else:
+                for cell in wanted:
+                    try:
+                        yield from grid[cell]
+                    except KeyError:
+                        pass
+
+    def find_box(
+        self,
+        bbox_min: Vec,
+        bbox_max: Vec,
+    ) -> List[Union['Solid', 'Entity']]:
+        """Find all objects whose bounding box overlaps the given one."""
+        min_x, min_y, min_z = bbox_min
+        max_x, max_y, max_z = bbox_max
+
+        def cells(count: int, cell_size: float) -> Optional[Iterable[Tuple[int, int, int]]]:
+            """Produce the cells which may contain overlapping objects."""
+            x_range = range(math.floor(min_x / cell_size) - 1, math.floor(max_x / cell_size) + 1)
+            y_range = range(math.floor(min_y / cell_size) - 1, math.floor(max_y / cell_size) + 1)
+            z_range = range(math.floor(min_z / cell_size) - 1, math.floor(max_z / cell_size) + 1)
+            if len(x_range) * len(y_range) * len(z_range) > count:
+                return None
+            return itertools.product(x_range, y_range, z_range)
+
+        bboxes = self._bboxes
+        found = []
+        for obj in self._search(cells):
+            bbox = bboxes[obj]
+            if (
+                bbox[0] <= max_x and bbox[3] >= min_x and
+                bbox[1] <= max_y and bbox[4] >= min_y and
+                bbox[2] <= max_z and bbox[5] >= min_z
+            ):
+                found.append(obj)
+        return found
+
+    def find_point(self, point: Vec) -> List[Union['Solid', 'Entity']]:
+        """Find all objects whose bounding box contains this point."""
+        return self.find_box(point, point)
+
+    def find_ray(
+        self,
+        start: Vec,
+        end: Vec,
+    ) -> List[Tuple[float, Union['Solid', 'Entity']]]:
+        """Find all objects whose bounding box intersects the line segment.
+
+        This returns (distance, object) tuples, ordered by the distance from
+        start to where the segment enters the bounding box.
+        """
+        start = Vec(start)
+        delta = Vec(end) - start
+        length = delta.mag()
+
+        def cells(count: int, cell_size: float) -> Optional[Iterable[Tuple[int, int, int]]]:
+            """Produce the cells which may contain intersecting objects.
+
+            The segment is split into pieces no longer than a cell, so the
+            cells around each can be checked.
+            """
+            pieces = max(1, math.ceil(length / cell_size))
+            if pieces * 8 > count:
+                return None
+            found = set()  # type: Set[Tuple[int, int, int]]
+            for i in range(pieces):
+                piece_min, piece_max = Vec.bbox(
+                    start + delta * (i / pieces),
+                    start + delta * ((i + 1) / pieces),
+                )
+                found.update(itertools.product(
+                    range(math.floor(piece_min.x / cell_size) - 1, math.floor(piece_max.x / cell_size) + 1),
+                    range(math.floor(piece_min.y / cell_size) - 1, math.floor(piece_max.y / cell_size) + 1),
+                    range(math.floor(piece_min.z / cell_size) - 1, math.floor(piece_max.z / cell_size) + 1),
+                ))
+            return found
+
+        bboxes = self._bboxes
+        hits = []  # type: List[Tuple[float, Union[Solid, Entity]]]
+        for obj in self._search(cells):
+            bbox = bboxes[obj]
+            # Clip the segment to each pair of planes.
+            near = 0.0
+            far = 1.0
+            for axis in range(3):
+                pos = start[axis]
+                off = delta[axis]
+                low = bbox[axis]
+                high = bbox[axis + 3]
+                if off == 0:
+                    if pos < low or pos > high:
+                        break
+                    continue
+                enter = (low - pos) / off
+                leave = (high - pos) / off
+                if enter > leave:
+                    enter, leave = leave, enter
+                if enter > near:
+                    near = enter
+                if leave < far:
+                    far = leave
+                if near > far:
+                    break
+            else:
+                hits.append((near * length, obj))
+        hits.sort(key=operator.itemgetter(0))
+        return hits
+
+
+# All the IOIndexes, so they can be told when Output.target changes.
+_IO_INDEXES = weakref.WeakSet()  # type: weakref.WeakSet[IOIndex]
+
+
+class IOIndex:
+    """Finds the outputs in a map which target an entity name.
+
+    This allows quickly following the I/O of a map in reverse, by finding the
+    outputs targeting an entity, then the entities which fire them.
+    Names are matched like VMF.iter_inputs(), with * allowed at the start or
+    end. Sorted lists of the target names (and the reversed names) are kept
+    to find these.
+
+    This is built by VMF.build_io_index(). Adding or removing entities from
+    the map, changing Entity.outputs and setting Output.target update it
+    automatically.
+    """
+    def __init__(self, vmf: VMF) -> None:
+        self.map = vmf
+        _IO_INDEXES.add(self)
+        # Target name -> the outputs with that target (values are unused).
+        self._by_target = {}  # type: Dict[str, Dict[Output, None]]
+        # Output -> the entity it's in, and the target it's stored under.
+        self._outputs = {}  # type: Dict[Output, Tuple[Entity, str]]
+        # Entity -> the outputs which were indexed for it.
+        self._by_source = {}  # type: Dict[Entity, List[Output]]
+        # All target names, and the names reversed, sorted. These are
+        # only made once needed.
+        self._names = None  # type: Optional[List[str]]
+        self._rev_names = None  # type: Optional[List[str]]
+
+        for ent in vmf.entities:
+            self.add(ent)
+
+    def __len__(self) -> int:
+        return len(self._outputs)
+
+    def __contains__(self, out: object) -> bool:
+        return out in self._outputs
+
+    def _link(self, ent: 'Entity', out: 'Output') -> None:
+        """Add a single output."""
+        if out in self._outputs:
+            self._unlink(out)
+        target = out.target
+        self._outputs[out] = ent, target
+        try:
+            self._by_target[target][out] = None
+        except KeyError:
+            self._by_target[target] = {out: None}
+            if self._names is not None:
+                bisect.insort(self._names, target)
+                bisect.insort(self._rev_names, target[::-1])
+
+    def _unlink(self, out: 'Output') -> None:
+        """Remove a single output."""
+        ent, target = self._outputs.pop(out)
+        outputs = self._by_target[target]
+        del outputs[out]
+        if not outputs:
+            del self._by_target[target]
+            if self._names is not None:
+                del self._names[bisect.bisect_left(self._names, target)]
+                rev_target = target[::-1]
+                del self._rev_names[bisect.bisect_left(self._rev_names, rev_target)]
+
+    def add(self, ent: 'Entity') -> None:
+        """Add all the outputs of an entity, or update them if present."""
+        self.remove(ent)
+        outputs = self._by_source[ent] = list(ent.outputs)
+        for out in outputs:
+            self._link(ent, out)
+
+    def remove(self, ent: 'Entity') -> None:
+        """Remove all the outputs of an entity, if present."""
+        for out in self._by_source.pop(ent, ()):
+            if self._outputs.get(out, (None, ))[0] is ent:
+                self._unlink(out)
+
+    def _retarget(self, out: 'Output') -> None:
+        """Move an output if its target was changed."""
+        try:
+            ent, target = self._outputs[out]
+        except KeyError:
+            return
+        if target != out.target:
+            self._link(ent, out)
+
+    def update(self, ent: 'Entity') -> None:
+        """Re-index the outputs of an entity after they are changed.
+
+        Entities which aren't in the index are ignored.
+        """
+        if ent in self._by_source:
+            self.add(ent)
+
+    def add_outputs(self, ent: 'Entity', outputs: Iterable['Output']) -> None:
+        """Add outputs which were added to an indexed entity."""
+        try:
+            indexed = self._by_source[ent]
+        except KeyError:
+            return
+        for out in outputs:
+            indexed.append(out)
+            self._link(ent, out)
+
+    def remove_outputs(self, ent: 'Entity', outputs: Iterable['Output']) -> None:
+        """Remove outputs which were removed from an entity."""
+        indexed = self._by_source.get(ent, [])
+        for out in outputs:
+            if self._outputs.get(out, (None, ))[0] is ent:
+                self._unlink(out)
+                indexed.remove(out)
+
+    def get_source(self, out: 'Output') -> 'Entity':
+        """Return the entity which fires this output.
+
+        KeyError is raised if it isn't in the index.
+        """
+        return self._outputs[out][0]
+
+    def _find_prefix(self, names: List[str], prefix: str) -> Iterator[str]:
+        """Yield the names in the sorted list starting with the prefix."""
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            yield name
+
+    def find_inputs(self, name: str) -> List['Output']:
+        """Find all the outputs which target the named entity.
+
+        - Allows using * at beginning/end
+        """
+        wild_start = name[:1] == '*'
+        wild_end = name[-1:] == '*'
+        if wild_start:
+            name = name[1:]
+        if wild_end:
+            name = name[:-1]
+
+        if wild_start and wild_end:  # blah-target-blah
+            targets = [
+                target for target in self._by_target
+                if name in target
+            ]  # type: Iterable[str]
+        elif wild_start or wild_end:
+            if self._names is None:
+                self._names = sorted(self._by_target)
+                self._rev_names = sorted([
+                    target[::-1] for target in self._by_target
+                ])
+            if wild_end:  # blah-target
+                targets = self._find_prefix(self._names, name)
+            else:  # target-blah
+                targets = [
+                    target[::-1] for target in
+                    self._find_prefix(self._rev_names, name[::-1])
+                ]
+        else:  # target
+            return list(self._by_target.get(name, ()))
+
+        found = []  # type: List[Output]
+        for target in targets:
+            found.extend(self._by_target[target])
+        return found
+
+
 class Camera:
     """Represents one of several cameras which can be swapped between."""
     def __init__(self, vmf_file: VMF, pos: Vec, targ: Vec) -> None:
@@ -953,6 +2313,9 @@ class Solid:
         self.editor_color = Vec(editor_color)
         self.group_id = group_id
         self.visgroup_ids = set(visgroup_ids)
+        # If parsed with keep_text, the indent and text of the original
+        # block, and the state it was in.
+        self._orig_text = None  # type: Optional[Tuple[str, str, tuple]]
 
     def copy(
         self,
@@ -962,10 +2325,15 @@ class Solid:
         keep_vis: bool=True,
     ) -> 'Solid':
         """Duplicate this brush."""
+        if vmf_file is None:
+            # Allocate all the side IDs in one go.
+            side_ids = self.map.face_id.reserve(len(self.sides))  # type: Iterable[int]
+        else:
+            side_ids = itertools.repeat(-1)
         sides = [
-            s.copy(vmf_file=vmf_file, side_mapping=side_mapping)
-            for s in
-            self.sides
+            s.copy(side_id, vmf_file=vmf_file, side_mapping=side_mapping)
+            for s, side_id in
+            zip(self.sides, side_ids)
         ]
 
         return Solid(
@@ -1024,43 +2392,75 @@ class Solid:
             editor_color,
         )
 
+    def _state(self) -> tuple:
+        """Return everything which affects how this is exported.
+
+        This is used to check if the brush was modified since parsing.
+        """
+        return (
+            self.id,
+            self.hidden,
+            self.group_id,
+            frozenset(self.visgroup_ids),
+            self.vis_shown,
+            self.vis_auto_shown,
+            self.cordon_solid,
+            self.editor_color.as_tuple(),
+            tuple([side._state() for side in self.sides]),
+        )
+
+    def _save_text(self, tree: Property, ind: str) -> None:
+        """Remember the original text of this brush, to export if unchanged."""
+        if tree.int('id', -1) != self.id or [
+            side.int('id', -1) for side in tree.find_all('side')
+        ] != [side.id for side in self.sides]:
+            # IDs were changed to avoid duplicates, so it doesn't match.
+            return
+        buffer = _ExportBuffer(None)
+        _export_raw(buffer, tree, ind)
+        self._orig_text = (ind, buffer.getvalue(), self._state())
+
     def export(self, buffer: IO[str], ind: str='') -> None:
         """Generate the strings needed to define this brush."""
         if self.hidden:
             buffer.write(ind + 'hidden\n' + ind + '{\n')
             ind += '\t'
-        buffer.write(ind + 'solid\n')
-        buffer.write(ind + '{\n')
-        buffer.write(ind + '\t"id" "' + str(self.id) + '"\n')
+        orig = self._orig_text
+        if orig is not None and orig[0] == ind and orig[2] == self._state():
+            # Unchanged since parsing, reuse the original.
+            buffer.write(orig[1])
+            if self.hidden:
+                buffer.write(ind[:-1] + '}\n')
+            return
+        # Build up the whole brush, then write it in one go.
+        lines = [
+            ind + 'solid\n' + ind + '{\n' + ind + '\t"id" "' + str(self.id) + '"\n'
+        ]
+        add = lines.append
+        side_ind = ind + '\t'
         for s in self.sides:
-            s.export(buffer, ind + '\t')
+            add(s._export_text(side_ind))
 
-        buffer.write(ind + '\teditor\n')
-        buffer.write(ind + '\t{\n')
-        buffer.write('{}\t\t"color" "{}"\n'.format(ind, self.editor_color))
+        add('{0}\teditor\n{0}\t{{\n{0}\t\t"color" "{1}"\n'.format(ind, self.editor_color))
         if self.group_id is not None:
-            buffer.write('{}\t\t"groupid" "{}"\n'.format(ind, self.group_id))
+            add('{}\t\t"groupid" "{}"\n'.format(ind, self.group_id))
 
         for group in self.visgroup_ids:
-            buffer.write('{}\t\t"visgroupid" "{}"\n'.format(ind, group))
+            add('{}\t\t"visgroupid" "{}"\n'.format(ind, group))
 
-        buffer.write('{}\t\t"visgroupshown" "{}"\n'.format(
+        add('{0}\t\t"visgroupshown" "{1}"\n{0}\t\t"visgroupautoshown" "{2}"\n'.format(
             ind,
             srctools.bool_as_int(self.vis_shown),
-        ))
-        buffer.write('{}\t\t"visgroupautoshown" "{}"\n'.format(
-            ind,
             srctools.bool_as_int(self.vis_auto_shown),
         ))
         if self.cordon_solid is not None:
-            buffer.write('{}\t\t"cordonsolid" "{}"\n'.format(
+            add('{}\t\t"cordonsolid" "{}"\n'.format(
                 ind,
                 self.cordon_solid,
             ))
 
-        buffer.write(ind + '\t}\n')
-
-        buffer.write(ind + '}\n')
+        add(ind + '\t}\n' + ind + '}\n')
+        buffer.write(''.join(lines))
         if self.hidden:
             buffer.write(ind[:-1] + '}\n')
 
@@ -1104,11 +2504,15 @@ class Solid:
         """Move this solid by the specified vector."""
         for s in self.sides:
             s.translate(diff)
+        if self.map.spatial is not None:
+            self.map.spatial.update(self)
 
     def localise(self, origin: Vec, angles: Vec=None):
         """Shift this brush by the given origin/angles."""
         for s in self.sides:
             s.localise(origin, angles)
+        if self.map.spatial is not None:
+            self.map.spatial.update(self)
 
 
 class UVAxis:
@@ -1232,7 +2636,8 @@ class Side:
         'disp_elev',
         'disp_is_subdiv',
         'disp_allowed_verts',
-        'disp_data',
+        '_disp_data',
+        '_disp_raw',
         'is_disp',
     ]
 
@@ -1262,6 +2667,10 @@ class Side:
         self.ham_rot = rotation
         self.uaxis = uaxis or UVAxis(0, 1, 0)
         self.vaxis = vaxis or UVAxis(0, 0, -1)
+        # Displacement row blocks from parse(), which haven't been
+        # decoded into disp_data yet. Each is the '"name" "value"' rows
+        # joined with newlines, in their original order.
+        self._disp_raw = None  # type: Optional[Dict[str, str]]
         if disp_data is not None:
             self.disp_power = srctools.conv_int(
                 disp_data.get('power', '_'), 4)
@@ -1294,6 +2703,8 @@ class Side:
         planes = list(map(srctools.parse_vec_str, verts))
 
         disp_tree = tree.find_key('dispinfo', [])
+        # The rows are only decoded when disp_data is accessed.
+        disp_raw = {}  # type: Dict[str, str]
         if len(disp_tree) > 0:
             disp_data = {
                 'power': disp_tree['power', '4'],
@@ -1305,15 +2716,32 @@ class Side:
             }
             for prop in disp_tree.find_key('allowed_verts', []):
                 disp_data['allowed_verts'][prop.name] = prop.value
-            for v in _DISP_ROWS:
-                rows = disp_tree[v, []]
-                if len(rows) > 0:
-                    rows.sort(key=lambda x: srctools.conv_int(x.name[3:]))
-                    disp_data[v] = [v.value for v in rows]
+            for prop in disp_tree:
+                if prop.name in _DISP_ROWS and prop.has_children():
+                    # The last block is used, like disp_tree[v].
+                    rows = prop.value
+                    try:
+                        text = '\n'.join([
+                            '"' + row.real_name + '" "' + row.value + '"'
+                            for row in rows
+                        ])
+                    except TypeError:  # A row is a block.
+                        text = ''
+                    if (
+                        text.count('\n') == len(rows) - 1
+                        and text.count('"') == 4 * len(rows)
+                    ):
+                        disp_raw[prop.name] = text
+                    else:
+                        # Empty, or it couldn't be split up again.
+                        disp_raw.pop(prop.name, None)
+                        disp_data[prop.name] = _sort_disp_rows([
+                            (row.real_name, row.value) for row in rows
+                        ])
         else:
             disp_data = None
 
-        return cls(
+        side = cls(
             vmf_file,
             planes=planes,
             des_id=side_id,
@@ -1325,6 +2753,34 @@ class Side:
             lightmap=tree.int('lightmapscale', 16),
             smoothing=tree.int('smoothing_groups', 0),
         )
+        if disp_raw:
+            side._disp_raw = disp_raw
+        return side
+
+    @property
+    def disp_data(self) -> Dict[str, List[str]]:
+        """The rows of displacement data, for each of the _DISP_ROWS.
+
+        For parsed sides, these are decoded on first access.
+        """
+        if self._disp_raw is not None:
+            self._decode_disp()
+        return self._disp_data
+
+    @disp_data.setter
+    def disp_data(self, data: Dict[str, List[str]]) -> None:
+        self._disp_data = data
+        self._disp_raw = None
+
+    def _decode_disp(self) -> None:
+        """Convert the raw row blocks into lists of strings."""
+        raw = self._disp_raw
+        self._disp_raw = None
+        for name, text in raw.items():
+            self._disp_data[name] = _sort_disp_rows([
+                line[1:-1].split('" "', 1)
+                for line in text.split('\n')
+            ])
 
     def copy(
         self,
@@ -1340,7 +2796,8 @@ class Side:
         """
         planes = [p.as_tuple() for p in self.planes]
         if self.is_disp:
-            disp_data = self.disp_data.copy()
+            # Undecoded rows are shared instead.
+            disp_data = self._disp_data.copy()
             disp_data['power'] = self.disp_power
             disp_data['flags'] = self.disp_flags
             disp_data['elevation'] = self.disp_elev
@@ -1364,54 +2821,97 @@ class Side:
             lightmap=self.lightmap,
             disp_data=disp_data,
         )
+        copy._disp_raw = self._disp_raw
         side_mapping[self.id] = copy.id
         return copy
 
+    def _state(self) -> tuple:
+        """Return everything which affects how this is exported.
+
+        Decoding the displacement rows counts as a change, since they may
+        have then been modified.
+        """
+        p1, p2, p3 = self.planes
+        u = self.uaxis
+        v = self.vaxis
+        state = (
+            self.id, self.mat,
+            p1.x, p1.y, p1.z, p2.x, p2.y, p2.z, p3.x, p3.y, p3.z,
+            u.x, u.y, u.z, u.offset, u.scale,
+            v.x, v.y, v.z, v.offset, v.scale,
+            self.ham_rot, self.lightmap, self.smooth,
+            self.is_disp,
+        )
+        if not self.is_disp:
+            return state
+        if self._disp_raw is not None:
+            rows = self._disp_raw  # type: Any
+        else:
+            rows = tuple([tuple(data) for data in self._disp_data.values()])
+        return state + (
+            self.disp_power,
+            self.disp_pos.as_tuple(),
+            self.disp_flags,
+            self.disp_elev,
+            self.disp_is_subdiv,
+            tuple(self.disp_allowed_verts.items()),
+            rows,
+        )
+
     def export(self, buffer: IO[str], ind: str='') -> None:
         """Generate the strings required to define this side in a VMF."""
-        buffer.write(ind + 'side\n')
-        buffer.write(ind + '{\n')
-        buffer.write(ind + '\t"id" "' + str(self.id) + '"\n')
-        pl_str = ('(' + p.join(' ') + ')' for p in self.planes)
-        buffer.write(ind + '\t"plane" "' + ' '.join(pl_str) + '"\n')
-        buffer.write(ind + '\t"material" "' + self.mat + '"\n')
-        buffer.write(ind + '\t"uaxis" "' + str(self.uaxis) + '"\n')
-        buffer.write(ind + '\t"vaxis" "' + str(self.vaxis) + '"\n')
-        buffer.write(ind + '\t"rotation" "' + str(self.ham_rot) + '"\n')
-        buffer.write(ind + '\t"lightmapscale" "' + str(self.lightmap) + '"\n')
-        buffer.write(ind + '\t"smoothing_groups" "' + str(self.smooth) + '"\n')
-        if self.is_disp:
-            buffer.write(ind + '\tdispinfo\n')
-            buffer.write(ind + '\t{\n')
-
-            buffer.write(ind + '\t\t"power" "' + str(self.disp_power) + '"\n')
-            buffer.write(ind + '\t\t"startposition" "[' +
-                         self.disp_pos.join(' ') +
-                         ']"\n')
-            buffer.write(ind + '\t\t"flags" "' + str(self.disp_flags) +
-                         '"\n')
-            buffer.write(ind + '\t\t"elevation" "' + str(self.disp_elev) +
-                         '"\n')
-            buffer.write(ind + '\t\t"subdiv" "' +
-                         srctools.bool_as_int(self.disp_is_subdiv) +
-                         '"\n')
-            for v in _DISP_ROWS:
-                if len(self.disp_data[v]) > 0:
-                    buffer.write(ind + '\t\t' + v + '\n')
-                    buffer.write(ind + '\t\t{\n')
-                    for i, data in enumerate(self.disp_data[v]):
-                        buffer.write(ind + '\t\t\t"row' + str(i) +
-                                     '" "' + data +
-                                     '"\n')
-                    buffer.write(ind + '\t\t}\n')
-            if len(self.disp_allowed_verts) > 0:
-                buffer.write(ind + '\t\tallowed_verts\n')
-                buffer.write(ind + '\t\t{\n')
-                for k, v in self.disp_allowed_verts.items():
-                    buffer.write(ind + '\t\t\t"' + k + '" "' + v + '"\n')
-                buffer.write(ind + '\t\t}\n')
-            buffer.write(ind + '\t}\n')
-        buffer.write(ind + '}\n')
+        buffer.write(self._export_text(ind))
+
+    def _export_text(self, ind: str) -> str:
+        """Produce the text for this side, as a single string."""
+        text = _SIDE_FORMAT.format(
+            ind, self.id,
+            *self.planes,
+            self.mat, self.uaxis, self.vaxis,
+            self.ham_rot, self.lightmap, self.smooth,
+        )
+        if not self.is_disp:
+            return text + ind + '}\n'
+        lines = [text]
+        add = lines.append
+        add(ind + '\tdispinfo\n' + ind + '\t{\n')
+        add('{0}\t\t"power" "{1}"\n'
+            '{0}\t\t"startposition" "[{2}]"\n'
+            '{0}\t\t"flags" "{3}"\n'
+            '{0}\t\t"elevation" "{4}"\n'
+            '{0}\t\t"subdiv" "{5}"\n'.format(
+            ind,
+            self.disp_power,
+            self.disp_pos.join(' '),
+            self.disp_flags,
+            self.disp_elev,
+            srctools.bool_as_int(self.disp_is_subdiv),
+        ))
+        raw = self._disp_raw or EmptyMapping
+        for v in _DISP_ROWS:
+            if raw.get(v):
+                # Not decoded, write the rows back unchanged.
+                row_ind = ind + '\t\t\t'
+                add(ind + '\t\t' + v + '\n')
+                add(ind + '\t\t{\n')
+                add(row_ind + raw[v].replace('\n', '\n' + row_ind) + '\n')
+                add(ind + '\t\t}\n')
+            elif len(self._disp_data[v]) > 0:
+                add(ind + '\t\t' + v + '\n')
+                add(ind + '\t\t{\n')
+                for i, data in enumerate(self._disp_data[v]):
+                    add(ind + '\t\t\t"row' + str(i) +
+                        '" "' + data +
+                        '"\n')
+                add(ind + '\t\t}\n')
+        if len(self.disp_allowed_verts) > 0:
+            add(ind + '\t\tallowed_verts\n')
+            add(ind + '\t\t{\n')
+            for k, v in self.disp_allowed_verts.items():
+                add(ind + '\t\t\t"' + k + '" "' + v + '"\n')
+            add(ind + '\t\t}\n')
+        add(ind + '\t}\n' + ind + '}\n')
+        return ''.join(lines)
 
     def __str__(self) -> str:
         """Dump a user-friendly representation of the side."""
@@ -1504,6 +3004,97 @@ class Side:
     offset = property(fset=offset, doc='Set both offset attributes easily.')
 
 
+class EntityKeys(MutableMapping[str, str]):
+    """A dict of keyvalues for an Entity, with case-insensitive keys.
+
+    Each key keeps the casing it was first set with, and keys are kept in
+    insertion order. Lookups use a dict of casefolded keys, so they don't
+    need to check every key.
+    """
+    __slots__ = ['_names', '_values']
+
+    def __init__(
+        self,
+        keys: Union[Mapping[str, str], Iterable[Tuple[str, str]]]=(),
+    ) -> None:
+        # Both are keyed by the casefolded name. _names stores the original
+        # casing, and both are in the same order.
+        self._names = {}  # type: Dict[str, str]
+        self._values = {}  # type: Dict[str, str]
+        if isinstance(keys, Mapping):
+            keys = keys.items()
+        for key, value in keys:
+            self[key] = value
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(self.__class__.__name__, dict(self.items()))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names.values())
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and key.casefold() in self._values
+
+    def __getitem__(self, key: str) -> str:
+        return self._values[key.casefold()]
+
+    def get(self, key: str, default: T=None) -> Union[str, T]:
+        """Return the value of a key, or the default if not present."""
+        return self._values.get(key.casefold(), default)
+
+    def __setitem__(self, key: str, value: str) -> None:
+        folded = key.casefold()
+        if folded not in self._names:
+            self._names[folded] = key
+        self._values[folded] = value
+
+    def __delitem__(self, key: str) -> None:
+        folded = key.casefold()
+        del self._values[folded]
+        del self._names[folded]
+
+    def clear(self) -> None:
+        """Remove all keys."""
+        self._names.clear()
+        self._values.clear()
+
+    def copy(self) -> 'EntityKeys':
+        """Return a shallow copy of the keyvalues."""
+        new = EntityKeys.__new__(EntityKeys)
+        new._names = self._names.copy()
+        new._values = self._values.copy()
+        return new
+
+    def items(self) -> ItemsView:
+        """Return a view of the (key, value) pairs."""
+        return _EntityKeysItems(self)
+
+    def values(self) -> ValuesView:
+        """Return a view of the values."""
+        return _EntityKeysValues(self)
+
+
+class _EntityKeysItems(ItemsView):
+    """Iterates EntityKeys items without looking up each key."""
+    __slots__ = ()
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        mapping = self._mapping  # type: EntityKeys
+        return zip(mapping._names.values(), mapping._values.values())
+
+
+class _EntityKeysValues(ValuesView):
+    """Iterates EntityKeys values without looking up each key."""
+    __slots__ = ()
+
+    def __iter__(self) -> Iterator[str]:
+        mapping = self._mapping  # type: EntityKeys
+        return iter(mapping._values.values())
+
+
 class Entity:
     """A representation of either a point or brush entity.
 
@@ -1533,17 +3124,17 @@ class Entity:
         comments: str='',
     ):
         self.map = vmf_file
-        self.keys = {
+        self.keys = EntityKeys(
             # Ensure all values are strings. This allows passing ints and Vecs
             # normally.
             # If bool (special case), swap to 1/0.
-            k: str(int(v) if isinstance(v, bool) else v)
+            (k, str(int(v) if isinstance(v, bool) else v))
             for k, v in
             keys.items()
-        }  # type: Dict[str, str]
+        )
         self.fixup = EntityFixup(fixup)
-        self.outputs = outputs or []  # type: List[Output]
-        self.solids = solids or []  # type: List[Solid]
+        self._outputs = OutputList(self, outputs or ())
+        self.solids = solids or []
         self.id = vmf_file.ent_id.get_id(ent_id)
         self.hidden = hidden
         self.groups = list(groups)
@@ -1554,6 +3145,9 @@ class Entity:
         self.editor_color = Vec(editor_color)
         self.logical_pos = logical_pos or '[0 {}]'.format(self.id)
         self.comments = comments
+        # If parsed with keep_text, the block name, indent, original text
+        # (without brushes) and the state it was in.
+        self._orig_text = None  # type: Optional[Tuple[str, str, str, tuple]]
 
     def copy(
         self,
@@ -1563,15 +3157,17 @@ class Entity:
         keep_vis=True,
     ) -> 'Entity':
         """Duplicate this entity entirely, including solids and outputs."""
-        new_keys = {}
+        new_keys = self.keys.copy()
         new_fixup = self.fixup.copy_values()
-        for key, value in self.keys.items():
-            new_keys[key] = value
 
+        if vmf_file is None:
+            solid_ids = self.map.solid_id.reserve(len(self.solids))  # type: Iterable[int]
+        else:
+            solid_ids = itertools.repeat(-1)
         new_solids = [
-            solid.copy(vmf_file=vmf_file, side_mapping=side_mapping)
-            for solid in
-            self.solids
+            solid.copy(solid_id, vmf_file=vmf_file, side_mapping=side_mapping)
+            for solid, solid_id in
+            zip(self.solids, solid_ids)
         ]
         outs = [o.copy() for o in self.outputs]
 
@@ -1684,9 +3280,95 @@ class Entity:
             comment,
         )
 
+    @property
+    def outputs(self) -> OutputList:
+        """The outputs this entity fires.
+
+        Changes to these update VMF.io_index, if it has been built.
+        """
+        return self._outputs
+
+    @outputs.setter
+    def outputs(self, outputs: Iterable['Output']) -> None:
+        self._outputs = OutputList(self, outputs)
+        if self.map.io_index is not None:
+            self.map.io_index.update(self)
+
+    @property
+    def solids(self) -> List[Solid]:
+        """The brushes for this entity.
+
+        If the VMF was parsed with lazy_solids, they are parsed on first access.
+        """
+        if self._raw_solids:
+            self._load_solids()
+        return self._solids
+
+    @solids.setter
+    def solids(self, solids: List[Solid]) -> None:
+        self._solids = solids
+        # Unparsed solid and hidden blocks, from VMF.parse_text().
+        self._raw_solids = []  # type: List[Property]
+
+    def _load_solids(self, keep_text: bool=False) -> None:
+        """Parse any brushes which were kept unparsed.
+
+        If keep_text is True, the brushes remember their original text.
+        """
+        raw_solids = self._raw_solids
+        self._raw_solids = []
+        # The indent the brushes will be exported with.
+        ind = '\t\t' if self.hidden else '\t'
+        for tree in raw_solids:
+            if tree.name == 'hidden':
+                for br in tree:
+                    solid = Solid.parse(self.map, br, hidden=True)
+                    if keep_text:
+                        solid._save_text(br, ind + '\t')
+                    self._solids.append(solid)
+            else:
+                solid = Solid.parse(self.map, tree)
+                if keep_text:
+                    solid._save_text(tree, ind)
+                self._solids.append(solid)
+
+    def _state(self) -> tuple:
+        """Return everything which affects how this is exported, except brushes.
+
+        This is used to check if the entity was modified since parsing.
+        """
+        return (
+            self.id,
+            self.hidden,
+            tuple(self.keys.items()),
+            tuple(self.fixup._fixup.values()),
+            tuple([out._state() for out in self.outputs]),
+            self.editor_color.as_tuple(),
+            tuple(self.groups),
+            frozenset(self.visgroup_ids),
+            self.vis_shown,
+            self.vis_auto_shown,
+            self.logical_pos,
+            self.comments,
+        )
+
+    def _save_text(self, tree: Property, ind: str) -> None:
+        """Remember the original text of this entity, to export if unchanged.
+
+        The tree should not contain the brushes, those are handled separately.
+        """
+        if tree.int('id', -1) != self.id:
+            # Changed to avoid duplicates, so it doesn't match.
+            return
+        buffer = _ExportBuffer(None)
+        _export_raw(buffer, tree, ind)
+        # Remove the closing brace, so brushes can be written after.
+        text = buffer.getvalue()[:-len(ind) - 2]
+        self._orig_text = (tree.real_name, ind, text, self._state())
+
     def is_brush(self) -> bool:
         """Is this Entity a brush entity?"""
-        return len(self.solids) > 0
+        return len(self._solids) > 0 or len(self._raw_solids) > 0
 
     def export(self, buffer: IO[str], ent_name: str='entity', ind: str='') -> None:
         """Generate the strings needed to create this entity.
@@ -1699,17 +3381,32 @@ class Entity:
             buffer.write('{0}hidden\n{0}{{\n'.format(ind))
             ind += '\t'
 
-        buffer.write('{}{}\n'.format(ind, ent_name))
-        buffer.write(ind + '{\n')
-        buffer.write('{}\t"id" "{}"\n'.format(ind, str(self.id)))
-        for key, value in sorted(self.keys.items(), key=operator.itemgetter(0)):
-            buffer.write('{}\t"{}" "{!s}"\n'.format(ind, key, value))
+        orig = self._orig_text
+        if (
+            orig is not None and orig[0] == ent_name and orig[1] == ind
+            and orig[3] == self._state()
+        ):
+            # Unchanged since parsing, reuse the original.
+            buffer.write(orig[2])
+            self._export_solids(buffer, ind)
+            buffer.write(ind + '}\n')
+            if self.hidden:
+                buffer.write(ind[:-1] + '}\n')
+            return
+
+        # Write the keyvalues and editor blocks in one go, brushes may
+        # be large so they're written individually.
+        lines = ['{0}{1}\n{0}{{\n{0}\t"id" "{2}"\n'.format(ind, ent_name, self.id)]
+        lines += [
+            '{}\t"{}" "{!s}"\n'.format(ind, key, value)
+            for key, value in
+            sorted(self.keys.items(), key=operator.itemgetter(0))
+        ]
+        buffer.write(''.join(lines))
 
         self.fixup.export(buffer, ind)
+        self._export_solids(buffer, ind)
 
-        if self.is_brush():
-            for s in self.solids:
-                s.export(buffer, ind=ind+'\t')
         if len(self.outputs) > 0:
             buffer.write(ind + '\tconnections\n')
             buffer.write(ind + '\t{\n')
@@ -1717,31 +3414,40 @@ class Entity:
                 o.export(buffer, ind=ind+'\t\t')
             buffer.write(ind + '\t}\n')
 
-        buffer.write(ind + '\teditor\n')
-        buffer.write(ind + '\t{\n')
-        buffer.write('{}\t\t"color" "{}"\n'.format(ind, self.editor_color))
+        lines = ['{0}\teditor\n{0}\t{{\n{0}\t\t"color" "{1}"\n'.format(ind, self.editor_color)]
+        add = lines.append
 
         for group in self.groups:
-            buffer.write('{}\t\t"groupid" "{}"\n'.format(ind, group))
+            add('{}\t\t"groupid" "{}"\n'.format(ind, group))
 
         for group in self.visgroup_ids:
-            buffer.write('{}\t\t"visgroupid" "{}"\n'.format(ind, group))
-
-        buffer.write('{}\t\t"visgroupshown" "{}"\n'.format(
-            ind,
-            srctools.bool_as_int(self.vis_shown),
-        ))
-        buffer.write('{}\t\t"visgroupautoshown" "{}"\n'.format(
-            ind,
-            srctools.bool_as_int(self.vis_auto_shown),
-        ))
-        buffer.write('{}\t\t"logicalpos" "{}"\n'.format(ind, self.logical_pos))
-        buffer.write('{}\t\t"comments" "{}"\n'.format(ind, self.comments))
-        buffer.write(ind + '\t}\n')
-
-        buffer.write(ind + '}\n')
+            add('{}\t\t"visgroupid" "{}"\n'.format(ind, group))
+
+        add(
+            '{0}\t\t"visgroupshown" "{1}"\n'
+            '{0}\t\t"visgroupautoshown" "{2}"\n'
+            '{0}\t\t"logicalpos" "{3}"\n'
+            '{0}\t\t"comments" "{4}"\n'
+            '{0}\t}}\n'
+            '{0}}}\n'.format(
+                ind,
+                srctools.bool_as_int(self.vis_shown),
+                srctools.bool_as_int(self.vis_auto_shown),
+                self.logical_pos,
+                self.comments,
+            )
+        )
         if self.hidden:
-            buffer.write(ind[:-1] + '}\n')
+            add(ind[:-1] + '}\n')
+        buffer.write(''.join(lines))
+
+    def _export_solids(self, buffer: IO[str], ind: str) -> None:
+        """Write out the brushes for this entity."""
+        for s in self._solids:
+            s.export(buffer, ind=ind+'\t')
+        # Brushes which were never accessed are written unchanged.
+        for tree in self._raw_solids:
+            _export_raw(buffer, tree, ind + '\t')
 
     def sides(self) -> 'Side':
         """Iterate through all our brush sides."""
@@ -1752,7 +3458,15 @@ class Entity:
 
     def add_out(self, *outputs: 'Output') -> None:
         """Add the outputs to our list."""
-        self.outputs.extend(outputs)
+        self._outputs.extend(outputs)
+
+    def remove_out(self, *outputs: 'Output') -> None:
+        """Remove the outputs from our list.
+
+        ValueError is raised if one isn't present.
+        """
+        for out in outputs:
+            self._outputs.remove(out)
 
     def output_targets(self) -> Set[str]:
         """Return a set of the targetnames this entity triggers."""
@@ -1819,13 +3533,7 @@ class Entity:
             key, default = key
         else:
             default = ''
-
-        key = key.casefold()
-        for k in self.keys:
-            if k.casefold() == key:
-                return self.keys[k]
-        else:
-            return default
+        return self.keys.get(key, default)
 
     def __setitem__(
         self,
@@ -1841,15 +3549,8 @@ class Entity:
         if isinstance(val, bool):
             val = '1' if val else '0'
         key_fold = key.casefold()
-        for k in self.keys:
-            if k.casefold() == key_fold:
-                # Check case-insensitively for this key first
-                orig_val = self.keys.get(k)
-                self.keys[k] = str(val)
-                break
-        else:
-            orig_val = self.keys.get(key)
-            self.keys[key] = str(val)
+        orig_val = self.keys.get(key)
+        self.keys[key] = str(val)
 
         # Update the by_class/target dicts with our new value
         if key_fold == 'classname':
@@ -1860,6 +3561,8 @@ class Entity:
             with suppress(KeyError):
                 self.map.by_target[orig_val].remove(self)
             self.map.by_target[val].add(self)
+        elif key_fold == 'origin' and self.map.spatial is not None:
+            self.map.spatial.update(self)
 
     def __delitem__(self, key: str) -> None:
         key = key.casefold()
@@ -1877,10 +3580,11 @@ class Entity:
                 ].remove(self)
             self.map.by_class[None].add(self)
 
-        for k in self.keys:
-            if k.casefold() == key:
-                del self.keys[k]
-                break
+        with suppress(KeyError):
+            del self.keys[key]
+
+        if key == 'origin' and self.map.spatial is not None:
+            self.map.spatial.update(self)
 
     def get(self, key: str, default: T='') -> Union[str, T]:
         """Allow using [] syntax to search for keyvalues.
@@ -1892,12 +3596,7 @@ class Entity:
         - A tuple can be passed for the default to be set, inside the
           [] syntax.
         """
-        key = key.casefold()
-        for k in self.keys:
-            if k.casefold() == key:
-                return self.keys[k]
-        else:
-            return default
+        return self.keys.get(key, default)
 
     def clear_keys(self) -> None:
         """Remove all keyvalues from an item."""
@@ -1910,12 +3609,7 @@ class Entity:
 
     def __contains__(self, key: str) -> bool:
         """Determine if a value exists for the given key."""
-        key = key.casefold()
-        for k in self.keys:
-            if k.casefold() == key:
-                return True
-        else:
-            return False
+        return key in self.keys
 
     get_key = __contains__
 
@@ -2240,7 +3934,7 @@ class Output:
     __slots__ = [
         'output',
         'inst_out',
-        'target',
+        '_target',
         'input',
         'inst_in',
         'params',
@@ -2269,9 +3963,9 @@ class Output:
         self.output = out
         self.inst_out = inst_out
         if isinstance(targ, Entity):
-            self.target = targ['targetname']
+            self._target = targ['targetname']
         else:
-            self.target = targ
+            self._target = targ
         self.input = inp
         self.inst_in = inst_in
         self.params = str(param)
@@ -2279,6 +3973,20 @@ class Output:
         self.times = 1 if only_once else times
         self.comma_sep = comma_sep
 
+    @property
+    def target(self) -> str:
+        """The target entity name.
+
+        Changing this updates any IOIndex containing the output.
+        """
+        return self._target
+
+    @target.setter
+    def target(self, target: str) -> None:
+        self._target = target
+        for index in list(_IO_INDEXES):
+            index._retarget(self)
+
     @property
     def only_once(self) -> bool:
         """Check if the output is active only once."""
@@ -2402,6 +4110,14 @@ class Output:
     def export(self, buffer: IO[str], ind: str='') -> None:
         """Generate the text required to define this output in the VMF."""
         buffer.write(ind + self._get_text())
+
+    def _state(self) -> tuple:
+        """Return everything which affects how this is exported."""
+        return (
+            self.output, self.inst_out, self.target,
+            self.input, self.inst_in, self.params,
+            self.delay, self.times, self.comma_sep,
+        )
         
     def _get_text(self) -> str:
         """Generate the text form of the output."""
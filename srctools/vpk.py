@@ -1,4 +1,5 @@
 """Classes for reading and writing Valve's VPK format, version 1."""
+import io
 import os
 import struct
 import operator
@@ -265,6 +266,7 @@ class VPK:
         mode: Union[OpenModes, str]='r',
         dir_data_limit: Optional[int]=1024,
         version: int=1,
+        dir_contents: Optional[bytes]=None,
     ) -> None:
         """Create a VPK file.
         
@@ -277,6 +279,8 @@ class VPK:
             dir_data_limit: The maximum amount of data for files saved to the dir file.
                None = no limit, and 0=save all to a data file.
             version: The desired version if the file is not read.
+            dir_contents: In read mode, the directory file's data can be
+               passed to parse instead of reading the file.
         """
         if version not in (1, 2):
             raise ValueError("Invalid version ({}) - must be 1 or 2!".format(version))
@@ -295,7 +299,7 @@ class VPK:
         self.version = version
         self.header_len = 0
         
-        self.load_dirfile()
+        self.load_dirfile(dir_contents)
         
     def _check_writable(self):
         """Verify that this is writable."""
@@ -318,9 +322,10 @@ class VPK:
         self.folder = folder
         self.file_prefix = filename[:-8]
 
-    def load_dirfile(self):
+    def load_dirfile(self, contents: Optional[bytes]=None):
         """Read in the directory file to get all filenames.
         
+        In read mode, the file's contents can be passed to parse instead.
         This erases all changes in the file.
         """
         if self.mode is OpenModes.WRITE:
@@ -330,7 +335,10 @@ class VPK:
             return
 
         try:
-            dirfile = open(self.path, 'rb')
+            if contents is not None and self.mode is OpenModes.READ:
+                dirfile = io.BytesIO(contents)  # type: BinaryIO
+            else:
+                dirfile = open(self.path, 'rb')
         except FileNotFoundError:
             if self.mode is OpenModes.APPEND:
                 # No directory file - generate a blank file.